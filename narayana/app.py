@@ -1,36 +1,32 @@
-from flask import Flask, render_template, session
-from models import db, User, Doctor, Patient
-from datetime import datetime, timedelta
+from flask import Flask, redirect, session, url_for, current_app
+from flask.cli import with_appcontext
+import click
+import importlib
+from models import (db, Facility, User, Doctor, Patient, DoctorDailyStats, DoctorHourlyStats, SpecializationDailyStats,
+                    TimelineEntry, Treatment, ClinicalTerm)
+from utils.notifications import get_unread_count
+from utils.shards import (current_facility, facility_codes, facility_context, facility_engine, init_shards,
+                          tune_shard_engines)
+from datetime import datetime
 import os
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'secret-key-for-production'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///database.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Blueprints as (module, url prefix). They are imported inside create_app,
+# so importing this module does not pull in every route and its helpers.
+BLUEPRINTS = [
+    ('routes.shared', None),
+    ('routes.admin', '/admin'),
+    ('routes.doctor', '/doctor'),
+    ('routes.patient', '/patient'),
+    ('routes.api', '/api')
+]
 
-db.init_app(app)
-
-# Import routes
-from routes import admin, doctor, patient, api, shared
-
-# Register blueprints
-app.register_blueprint(shared.bp)
-app.register_blueprint(admin.bp, url_prefix='/admin')
-app.register_blueprint(doctor.bp, url_prefix='/doctor')
-app.register_blueprint(patient.bp, url_prefix='/patient')
-app.register_blueprint(api.bp, url_prefix='/api')
-
-@app.context_processor
 def inject_notifications():
     """Make notification count available to all templates"""
     if 'user_id' in session:
-        from utils.notifications import get_unread_count
         return {'unread_count': get_unread_count(session['user_id'])}
     return {'unread_count': 0}
 
-@app.route('/')
 def index():
-    from flask import redirect, url_for
     if 'user_id' in session:
         role = session.get('role')
         if role == 'admin':
@@ -42,62 +38,368 @@ def index():
     return redirect(url_for('shared.login'))
 
 def init_database():
-    """Initialize database with tables and seed data"""
-    with app.app_context():
-        db.create_all()
-        
-        # Check if already initialized
-        if User.query.first():
-            return
-        
-        # Create admin
-        admin = User(username='admin', email='admin@hospital.com', phone='1234567890', role='admin')
-        admin.set_password('admin123')
-        db.session.add(admin)
-        
-        # Create doctors
-        doctors_data = [
-            {'username': 'dr_smith', 'email': 'smith@hospital.com', 'phone': '1111111111', 
-             'password': 'doctor123', 'specialization': 'Cardiology'},
-            {'username': 'dr_jones', 'email': 'jones@hospital.com', 'phone': '2222222222',
-             'password': 'doctor123', 'specialization': 'Neurology'},
-            {'username': 'dr_brown', 'email': 'brown@hospital.com', 'phone': '3333333333',
-             'password': 'doctor123', 'specialization': 'Pediatrics'}
-        ]
-        
-        for doc_data in doctors_data:
-            user = User(username=doc_data['username'], email=doc_data['email'], 
-                       phone=doc_data['phone'], role='doctor')
-            user.set_password(doc_data['password'])
-            db.session.add(user)
-            db.session.flush()
-            
-            doctor = Doctor(user_id=user.id, specialization=doc_data['specialization'])
-            db.session.add(doctor)
-        
-        # Create patients
-        patients_data = [
-            {'username': 'patient1', 'email': 'patient1@email.com', 'phone': '4444444444',
-             'password': 'patient123', 'medical_id': 'MED001'},
-            {'username': 'patient2', 'email': 'patient2@email.com', 'phone': '5555555555',
-             'password': 'patient123', 'medical_id': 'MED002'},
-            {'username': 'patient3', 'email': 'patient3@email.com', 'phone': '6666666666',
-             'password': 'patient123', 'medical_id': 'MED003'}
-        ]
+    """Create or upgrade the current facility's tables and seed demo data; run via `flask init-db`, not on startup"""
+    db.metadata.create_all(facility_engine())
+    
+    # Each shard records the facility it belongs to, so a misconfigured URL cannot mix two hospitals
+    facility = Facility.query.first()
+    if facility is None:
+        db.session.add(Facility(code=current_facility(), name=current_facility().replace('_', ' ').title()))
+        db.session.commit()
+    elif facility.code != current_facility():
+        raise RuntimeError(f'Database belongs to facility {facility.code!r}, not {current_facility()!r}')
+    
+    # Add columns and indexes introduced since the database was created
+    from utils.schema import upgrade_schema
+    upgrade_schema()
+    
+    # Backfill doctor rollups for databases created before they (or the hourly and specialization ones) existed
+    from utils.doctor_stats import rebuild_doctor_stats
+    if not all(model.query.first() for model in (DoctorDailyStats, DoctorHourlyStats, SpecializationDailyStats)):
+        rebuild_doctor_stats()
+    
+    # Backfill the patient timeline read model the same way
+    from utils.timeline import rebuild_timeline
+    if not TimelineEntry.query.first():
+        rebuild_timeline()
+    
+    # ... and the clinical term index
+    from utils.clinical_index import rebuild_clinical_index
+    if Treatment.query.first() and not ClinicalTerm.query.first():
+        rebuild_clinical_index()
+    
+    # Check if already initialized
+    if User.query.first():
+        return
+    
+    # Create admin
+    admin = User(username='admin', email='admin@hospital.com', phone='1234567890', role='admin')
+    admin.set_password('admin123')
+    db.session.add(admin)
+    
+    # Create doctors
+    doctors_data = [
+        {'username': 'dr_smith', 'email': 'smith@hospital.com', 'phone': '1111111111', 
+         'password': 'doctor123', 'specialization': 'Cardiology'},
+        {'username': 'dr_jones', 'email': 'jones@hospital.com', 'phone': '2222222222',
+         'password': 'doctor123', 'specialization': 'Neurology'},
+        {'username': 'dr_brown', 'email': 'brown@hospital.com', 'phone': '3333333333',
+         'password': 'doctor123', 'specialization': 'Pediatrics'}
+    ]
+    
+    for doc_data in doctors_data:
+        user = User(username=doc_data['username'], email=doc_data['email'], 
+                   phone=doc_data['phone'], role='doctor')
+        user.set_password(doc_data['password'])
+        db.session.add(user)
+        db.session.flush()
         
-        for pat_data in patients_data:
-            user = User(username=pat_data['username'], email=pat_data['email'],
-                       phone=pat_data['phone'], role='patient')
-            user.set_password(pat_data['password'])
-            db.session.add(user)
-            db.session.flush()
-            
-            patient = Patient(user_id=user.id, medical_id=pat_data['medical_id'])
-            db.session.add(patient)
+        doctor = Doctor(user_id=user.id, specialization=doc_data['specialization'])
+        db.session.add(doctor)
+    
+    # Create patients
+    patients_data = [
+        {'username': 'patient1', 'email': 'patient1@email.com', 'phone': '4444444444',
+         'password': 'patient123', 'medical_id': 'MED001'},
+        {'username': 'patient2', 'email': 'patient2@email.com', 'phone': '5555555555',
+         'password': 'patient123', 'medical_id': 'MED002'},
+        {'username': 'patient3', 'email': 'patient3@email.com', 'phone': '6666666666',
+         'password': 'patient123', 'medical_id': 'MED003'}
+    ]
+    
+    for pat_data in patients_data:
+        user = User(username=pat_data['username'], email=pat_data['email'],
+                   phone=pat_data['phone'], role='patient')
+        user.set_password(pat_data['password'])
+        db.session.add(user)
+        db.session.flush()
         
-        db.session.commit()
-        print('Database initialized with seed data')
+        patient = Patient(user_id=user.id, medical_id=pat_data['medical_id'])
+        db.session.add(patient)
+    
+    db.session.commit()
+    print('Database initialized with seed data')
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Create or upgrade every facility's database schema and seed demo data"""
+    for facility in facility_codes():
+        with facility_context(facility):
+            init_database()
+        click.echo(f'Database ready for facility {facility}')
+
+@click.command('build-assets')
+@with_appcontext
+def build_assets_command():
+    """Minify, fingerprint and pre-compress static CSS/JS into static/dist"""
+    from utils.assets import build_assets, brotli
+    
+    manifest = build_assets(current_app.static_folder)
+    current_app.extensions['assets'] = manifest
+    for source, built in sorted(manifest.items()):
+        click.echo(f'{source} -> {built}')
+    if brotli is None:
+        click.echo('brotli is not installed; built gzip variants only')
+
+@click.command('generate-bills')
+@click.option('--date', 'date_str', help='Only bill appointments on this date (YYYY-MM-DD)')
+@click.option('--user', 'username', default='admin', help='User recorded in the audit log')
+@with_appcontext
+def generate_bills_command(date_str, username):
+    """Create bills for all completed appointments that have none"""
+    from utils.billing import generate_bills
+    
+    actor = User.query.filter_by(username=username).first()
+    if not actor:
+        raise click.ClickException(f'Unknown user: {username}')
+    
+    appointment_date = datetime.strptime(date_str, '%Y-%m-%d').date() if date_str else None
+    created = generate_bills(actor.id, appointment_date=appointment_date)
+    click.echo(f'Generated {created} bills')
+
+@click.command('recompute-bills')
+@with_appcontext
+def recompute_bills_command():
+    """Recompute unpaid, unclaimed bill totals with the configured tax rules"""
+    from utils.billing import recompute_bills
+    
+    click.echo(f'Recomputed {recompute_bills()} bills')
+
+@click.command('process-claims')
+@click.option('--user', 'username', default='admin', help='User recorded in the audit log')
+@click.option('--max-bills', type=int, help='Bills per claim file (default CLAIM_BATCH_SIZE)')
+@with_appcontext
+def process_claims_command(username, max_bills):
+    """Batch unclaimed insured bills by insurer and write the claim files; retries failed batches"""
+    from utils.claims import process_claims
+    
+    actor = User.query.filter_by(username=username).first()
+    if not actor:
+        raise click.ClickException(f'Unknown user: {username}')
+    
+    created, completed, failed = process_claims(actor.id, max_bills)
+    click.echo(f'Created {created} claim batches; {completed} completed, {failed} failed')
+    if failed:
+        raise click.ClickException('Some claim batches failed; run process-claims again to retry them')
+
+@click.command('export')
+@click.argument('resource')
+@click.argument('output')
+@click.option('--format', 'fmt', default='csv', type=click.Choice(['csv', 'parquet']))
+@click.option('--start', 'start_str', help='First date to include (YYYY-MM-DD)')
+@click.option('--end', 'end_str', help='Last date to include (YYYY-MM-DD)')
+@click.option('--status', help='Only rows with this status (or action for audit logs)')
+@with_appcontext
+def export_command(resource, output, fmt, start_str, end_str, status):
+    """Stream appointments, bills or audit_logs to a file"""
+    from utils.exports import run_export
+    
+    start_date = datetime.strptime(start_str, '%Y-%m-%d').date() if start_str else None
+    end_date = datetime.strptime(end_str, '%Y-%m-%d').date() if end_str else None
+    try:
+        stats = run_export(resource, fmt, output, start_date, end_date, status)
+    except (ValueError, RuntimeError) as exc:
+        raise click.ClickException(str(exc))
+    click.echo(f'Exported {stats["rows"]} rows in {stats["seconds"]}s '
+               f'({stats["rows_per_second"]} rows/s, {stats["bytes"]} bytes)')
+
+@click.command('process-exports')
+@click.option('--loop', is_flag=True, help='Keep running and pick up new export jobs')
+@click.option('--interval', default=5, help='Seconds between checks with --loop')
+@with_appcontext
+def process_exports_command(loop, interval):
+    """Run the export jobs queued from Admin → Data Exports"""
+    from utils.exports import export_jobs, run_export_worker
+    
+    if loop:
+        run_export_worker(interval, log=click.echo)
+    else:
+        click.echo(f'Ran {export_jobs.process_queued()} exports')
+
+@click.command('seed-synthetic')
+@click.option('--seed', default=42, help='Random seed; the same seed produces the same data')
+@click.option('--doctors', default=200)
+@click.option('--patients', default=20000)
+@click.option('--appointments', default=100000)
+@click.option('--availability-blocks', default=2000)
+@with_appcontext
+def seed_synthetic_command(seed, doctors, patients, appointments, availability_blocks):
+    """Bulk-load deterministic synthetic data for load testing"""
+    from utils.synthetic import generate_synthetic_data, SYNTHETIC_PASSWORD
+    
+    db.metadata.create_all(facility_engine())
+    if User.query.filter_by(username=f'syn{seed}_admin').first():
+        raise click.ClickException(f'Synthetic data for seed {seed} already loaded')
+    
+    counts = generate_synthetic_data(seed=seed, doctors=doctors, patients=patients,
+                                     appointments=appointments,
+                                     availability_blocks=availability_blocks,
+                                     progress=click.echo)
+    for table, count in sorted(counts.items()):
+        click.echo(f'{table}: {count}')
+    click.echo(f'Log in as syn{seed}_admin / syn{seed}_dr0 / syn{seed}_pt0 with password {SYNTHETIC_PASSWORD}')
+
+@click.command('rebuild-doctor-stats')
+@with_appcontext
+def rebuild_doctor_stats_command():
+    """Recompute the doctor and specialization rollups from scratch"""
+    from utils.doctor_stats import rebuild_doctor_stats
+    
+    click.echo(f'Rebuilt {rebuild_doctor_stats()} doctor-day rollups')
+
+@click.command('rebuild-timeline')
+@with_appcontext
+def rebuild_timeline_command():
+    """Recompute the patient_timeline read model from scratch"""
+    from utils.timeline import rebuild_timeline
+    
+    click.echo(f'Rebuilt {rebuild_timeline()} timeline entries')
+
+@click.command('rebuild-clinical-index')
+@with_appcontext
+def rebuild_clinical_index_command():
+    """Recompute the diagnosis and prescription term index from scratch"""
+    from utils.clinical_index import rebuild_clinical_index
+    
+    click.echo(f'Indexed {rebuild_clinical_index()} clinical terms')
+
+@click.command('load-clinical-codes')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@with_appcontext
+def load_clinical_codes_command(path):
+    """Load term-to-code mappings from a CSV (field,term,code,system,description) and re-index"""
+    from utils.clinical_index import load_codes, rebuild_clinical_index
+    
+    try:
+        loaded = load_codes(path)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f'Loaded {loaded} code mappings; indexed {rebuild_clinical_index()} clinical terms')
+
+@click.command('purge-notifications')
+@click.option('--days', type=int, help='Retention window for read notifications')
+@with_appcontext
+def purge_notifications_command(days):
+    """Delete read notifications older than the retention window"""
+    from utils.notifications import purge_read_notifications
+    
+    if days is None:
+        days = current_app.config.get('NOTIFICATION_RETENTION_DAYS', 90)
+    click.echo(f'Deleted {purge_read_notifications(days)} read notifications older than {days} days')
+
+@click.command('purge-change-events')
+@click.option('--days', type=int, help='Retention window for change events')
+@with_appcontext
+def purge_change_events_command(days):
+    """Delete change events older than the retention window"""
+    from utils.changes import purge_change_events
+    
+    if days is None:
+        days = current_app.config.get('CHANGE_RETENTION_DAYS', 30)
+    click.echo(f'Deleted {purge_change_events(days)} change events older than {days} days')
+
+@click.command('send-reminders')
+@click.option('--loop', is_flag=True, help='Keep running and send reminders periodically')
+@click.option('--interval', default=300, help='Seconds between runs with --loop')
+@with_appcontext
+def send_reminders_command(loop, interval):
+    """Send 24h and 1h appointment reminders"""
+    from utils.reminders import send_due_reminders, run_reminder_worker
+    
+    if loop:
+        run_reminder_worker(interval, log=click.echo)
+    else:
+        click.echo(f'Sent reminders: {send_due_reminders()}')
+
+@click.command('expire-waitlist')
+@click.option('--loop', is_flag=True, help='Keep running and release expired holds periodically')
+@click.option('--interval', default=60, help='Seconds between runs with --loop')
+@with_appcontext
+def expire_waitlist_command(loop, interval):
+    """Release waitlist holds that were not confirmed in time"""
+    from utils.waitlist import expire_waitlist, run_waitlist_worker
+    
+    if loop:
+        run_waitlist_worker(interval, log=click.echo)
+    else:
+        released, stale = expire_waitlist()
+        click.echo(f'Released {released} expired holds and closed {stale} past waitlist entries')
+
+COMMANDS = [
+    init_db_command,
+    build_assets_command,
+    generate_bills_command,
+    recompute_bills_command,
+    process_claims_command,
+    export_command,
+    process_exports_command,
+    seed_synthetic_command,
+    rebuild_doctor_stats_command,
+    rebuild_timeline_command,
+    rebuild_clinical_index_command,
+    load_clinical_codes_command,
+    purge_notifications_command,
+    purge_change_events_command,
+    send_reminders_command,
+    expire_waitlist_command
+]
+
+def create_app(config=None):
+    """Build and configure the application; `config` overrides the defaults"""
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'secret-key-for-production'
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///database.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['FACILITY'] = os.environ.get('FACILITY', 'main')
+    app.config['FACILITY_DATABASES'] = os.environ.get('FACILITY_DATABASES', '')
+    if config:
+        app.config.update(config)
+    
+    # One database per facility, chosen per request by the routing session
+    init_shards(app)
+    db.init_app(app)
+    tune_shard_engines(app)
+    
+    # Enable {% cache %} fragments in templates
+    from utils.fragment_cache import init_fragment_cache
+    init_fragment_cache(app)
+    
+    # ... and the plain data behind the dashboards
+    from utils.view_cache import init_view_cache
+    init_view_cache(app)
+    
+    # Serve fingerprinted static assets built by `flask build-assets`
+    from utils.assets import init_assets
+    init_assets(app)
+    
+    # Keep doctor_daily_stats rollups current from change signals
+    from utils.doctor_stats import connect_doctor_stats
+    connect_doctor_stats()
+    
+    # ... and the patient timeline read model
+    from utils.timeline import connect_timeline
+    connect_timeline()
+    
+    # Offer slots freed by cancellations to waiting patients
+    from utils.waitlist import connect_waitlist
+    connect_waitlist()
+    
+    # Log appointment, treatment and bill changes for downstream consumers
+    from utils.changes import connect_change_capture
+    connect_change_capture()
+    
+    # Import routes and register blueprints
+    for module_name, url_prefix in BLUEPRINTS:
+        app.register_blueprint(importlib.import_module(module_name).bp, url_prefix=url_prefix)
+    
+    app.context_processor(inject_notifications)
+    app.add_url_rule('/', 'index', index)
+    
+    for command in COMMANDS:
+        app.cli.add_command(command)
+    
+    return app
 
 if __name__ == '__main__':
-    init_database()
-    app.run(debug=True)
+    create_app().run(debug=True)
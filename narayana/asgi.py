@@ -0,0 +1,71 @@
+"""ASGI entry point with an asyncio-served read API.
+
+    uvicorn asgi:application --workers 2
+
+GET requests for /api/doctors, /api/patients, /api/appointments and
+/api/specializations are answered on the event loop from a pool of
+aiosqlite connections, so slow or numerous polling clients do not each
+hold a worker thread. Every other request is passed to the Flask app.
+The pool reads the default facility's database, so with more than one
+facility configured these requests go through Flask and its routing
+session instead.
+Requires the optional packages aiosqlite, asgiref and an ASGI server
+such as uvicorn.
+"""
+import os
+from asgiref.wsgi import WsgiToAsgi
+from sqlalchemy.dialects import sqlite
+from app import create_app
+from models import db
+from utils.async_db import AsyncSQLitePool
+from utils.serializers import RESOURCES, RowEncoder, sqlite_time
+
+def _raw_row_encoder(encoder):
+    # aiosqlite returns dates as ISO strings already; times need normalizing
+    converters = {'time': sqlite_time} if 'time' in encoder.fields else None
+    return RowEncoder(encoder.fields, converters)
+
+# SQL compiled once at import from the same selects the sync blueprint runs
+QUERIES = {
+    f'/api/{name}': (str(resource.query.compile(dialect=sqlite.dialect())), _raw_row_encoder(resource.encoder))
+    for name, resource in RESOURCES.items()
+}
+
+app = create_app()
+
+def _database_path():
+    with app.app_context():
+        return db.engine.url.database
+
+# The pool only knows the default facility's database
+SERVE_ASYNC = len(app.config['FACILITY_DATABASES']) == 1
+
+pool = AsyncSQLitePool(_database_path(), size=int(os.environ.get('ASYNC_DB_POOL_SIZE', 8)))
+flask_app = WsgiToAsgi(app)
+
+async def api_view(path, send):
+    sql, encoder = QUERIES[path]
+    body = encoder.encode(await pool.fetchall(sql))
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', b'application/json'),
+                            (b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await pool.open()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await pool.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    path = scope.get('path', '').rstrip('/')
+    if SERVE_ASYNC and scope['type'] == 'http' and scope['method'] == 'GET' and path in QUERIES:
+        await api_view(path, send)
+        return
+
+    await flask_app(scope, receive, send)
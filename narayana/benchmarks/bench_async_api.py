@@ -0,0 +1,133 @@
+"""Concurrency benchmark: async /api (asgi.py) against the sync Flask blueprint.
+
+Usage:
+    python benchmarks/bench_async_api.py --database /tmp/load.db --concurrency 200 --workers 4
+
+Starts `gunicorn -w WORKERS 'app:create_app()'` (sync workers) and
+`uvicorn asgi:application --workers WORKERS` on local ports, then keeps
+CONCURRENCY keep-alive clients polling each /api endpoint for DURATION
+seconds and reports throughput and latency percentiles. Needs gunicorn,
+uvicorn, aiosqlite and asgiref installed.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENDPOINTS = ['/api/doctors', '/api/specializations', '/api/patients']
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'Server on port {port} did not start')
+
+async def client(port, path, stop_at, latencies, errors):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    request = f'GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: keep-alive\r\n\r\n'.encode()
+    try:
+        while time.perf_counter() < stop_at:
+            started = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status_line = await reader.readline()
+            if not status_line:
+                # Server closed the connection (sync workers do not keep alive)
+                writer.close()
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                continue
+            length = 0
+            chunked = False
+            close = False
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                name, _, value = line.decode().partition(':')
+                if name.lower() == 'content-length':
+                    length = int(value)
+                elif name.lower() == 'transfer-encoding' and 'chunked' in value:
+                    chunked = True
+                elif name.lower() == 'connection' and 'close' in value.lower():
+                    close = True
+            if chunked:
+                while True:
+                    size = int((await reader.readline()).strip(), 16)
+                    await reader.readexactly(size + 2)
+                    if size == 0:
+                        break
+            else:
+                await reader.readexactly(length)
+            latencies.append(time.perf_counter() - started)
+            if not status_line.startswith(b'HTTP/1.1 200'):
+                errors.append(status_line)
+            if close:
+                writer.close()
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    except (ConnectionError, asyncio.IncompleteReadError) as exc:
+        errors.append(str(exc))
+    finally:
+        writer.close()
+
+async def hammer(port, concurrency, duration):
+    latencies, errors = [], []
+    stop_at = time.perf_counter() + duration
+    await asyncio.gather(*[
+        client(port, ENDPOINTS[i % len(ENDPOINTS)], stop_at, latencies, errors)
+        for i in range(concurrency)
+    ], return_exceptions=True)
+    return latencies, errors
+
+def report(label, latencies, errors, duration):
+    latencies.sort()
+    pick = lambda pct: latencies[min(len(latencies) - 1, int(len(latencies) * pct / 100))] * 1000 if latencies else 0
+    print(f'{label:<28}{len(latencies) / duration:>10.1f} req/s  p50 {pick(50):>8.1f} ms  '
+          f'p99 {pick(99):>8.1f} ms  errors {len(errors)}')
+
+def run_server(command, env, concurrency, duration, label):
+    port = free_port()
+    process = subprocess.Popen([arg.format(port=port) for arg in command], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        latencies, errors = asyncio.run(hammer(port, concurrency, duration))
+        report(label, latencies, errors, duration)
+    finally:
+        process.terminate()
+        process.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', help='SQLite file to serve (sets DATABASE_URL)')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=10.0)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    if args.database:
+        env['DATABASE_URL'] = f'sqlite:///{os.path.abspath(args.database)}'
+
+    python = sys.executable
+    run_server([python, '-m', 'gunicorn', '-w', str(args.workers), '-k', 'sync',
+                '-b', '127.0.0.1:{port}', 'app:create_app()'],
+               env, args.concurrency, args.duration, f'sync gunicorn x{args.workers}')
+    run_server([python, '-m', 'uvicorn', 'asgi:application', '--workers', str(args.workers),
+                '--port', '{port}', '--log-level', 'warning'],
+               env, args.concurrency, args.duration, f'async uvicorn x{args.workers}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Benchmark batch bill generation against the per-request billing path.
+
+Usage:
+    python benchmarks/bench_bill_computation.py --appointments 5000
+
+The per-request path mirrors what doctor.create_bill did for each bill:
+float arithmetic, an ORM insert, a committed notification, an audit row
+and a second commit. The batch path is utils.billing.generate_bills.
+"""
+import argparse
+import os
+import tempfile
+from datetime import date, time
+
+from common import build_app, timed
+from models import db, User, Doctor, Patient, Appointment, Bill, Notification, AuditLog
+from utils.notifications import create_notification
+from utils.billing import generate_bills
+
+def seed(appointment_count):
+    db.drop_all()
+    db.create_all()
+    db.session.execute(User.__table__.insert(), [
+        {'id': 1, 'username': 'admin', 'email': 'admin@bench.local', 'password_hash': 'x', 'role': 'admin'},
+        {'id': 2, 'username': 'dr', 'email': 'dr@bench.local', 'password_hash': 'x', 'role': 'doctor'},
+        {'id': 3, 'username': 'pt', 'email': 'pt@bench.local', 'password_hash': 'x', 'role': 'patient'}
+    ])
+    db.session.execute(Doctor.__table__.insert(), [{'id': 1, 'user_id': 2, 'specialization': 'General',
+                                                    'consultation_fee': 49.99}])
+    db.session.execute(Patient.__table__.insert(), [{'id': 1, 'user_id': 3, 'medical_id': 'MED1'}])
+    db.session.execute(Appointment.__table__.insert(), [
+        {'doctor_id': 1, 'patient_id': 1, 'appointment_date': date.today(),
+         'appointment_time': time(9, 0), 'status': 'Completed'}
+        for _ in range(appointment_count)
+    ])
+    db.session.commit()
+
+def per_request_path():
+    for appointment in Appointment.query.filter_by(status='Completed').all():
+        consultation_fee = float(appointment.doctor.consultation_fee)
+        subtotal = consultation_fee
+        tax_amount = subtotal * 0.05
+        total_amount = subtotal + tax_amount
+        bill = Bill(appointment_id=appointment.id, patient_id=appointment.patient_id,
+                    doctor_id=appointment.doctor_id, consultation_fee=consultation_fee,
+                    subtotal=subtotal, tax_amount=tax_amount, total_amount=total_amount)
+        db.session.add(bill)
+        create_notification(appointment.patient.user_id,
+                            f'Bill generated for your appointment on {appointment.appointment_date}. '
+                            f'Amount: ${total_amount:.2f}')
+        db.session.add(AuditLog(user_id=1, action='CREATE', entity_type='Bill', entity_id=appointment.id,
+                                details=f'Created bill for appointment {appointment.id}'))
+        db.session.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--appointments', type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = build_app(os.path.join(tmp, 'bench.db'))
+        with app.app_context():
+            per_request = timed('per-request create_bill path', per_request_path,
+                                setup=lambda: seed(args.appointments))
+            batch = timed('generate_bills (one transaction)', lambda: generate_bills(1),
+                          setup=lambda: seed(args.appointments))
+            assert Bill.query.count() == args.appointments
+            assert Notification.query.count() == args.appointments
+            print(f'{args.appointments} bills; speedup {per_request / batch:.1f}x')
+
+if __name__ == '__main__':
+    main()
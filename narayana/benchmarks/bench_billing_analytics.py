@@ -0,0 +1,96 @@
+"""Benchmark the billing analytics engine against the per-route queries.
+
+Usage:
+    python benchmarks/bench_billing_analytics.py --bills 10000000
+
+Builds a throwaway SQLite database with synthetic bills, then times the
+old admin.billing statistics (four SUM/COUNT queries) plus a Python pass
+over every bill, against the single grouped pass in
+utils.billing_analytics.billing_summary.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from common import build_app, timed
+from sqlalchemy import func
+from models import db, User, Doctor, Bill
+
+SPECIALIZATIONS = ['Cardiology', 'Neurology', 'Pediatrics', 'Orthopedics', 'Dermatology']
+METHODS = ['Cash', 'Card', 'Insurance', 'Online', None]
+STATUSES = ['Paid', 'Paid', 'Paid', 'Pending', 'Cancelled']
+
+def seed(bill_count, doctor_count, days, chunk_size=100000):
+    rng = random.Random(42)
+    users = [{'id': i + 1, 'username': f'dr_{i}', 'email': f'dr_{i}@bench.local',
+              'password_hash': 'x', 'role': 'doctor'} for i in range(doctor_count)]
+    doctors = [{'id': i + 1, 'user_id': i + 1, 'specialization': SPECIALIZATIONS[i % len(SPECIALIZATIONS)]}
+               for i in range(doctor_count)]
+    db.session.execute(User.__table__.insert(), users)
+    db.session.execute(Doctor.__table__.insert(), doctors)
+
+    start = datetime.utcnow() - timedelta(days=days)
+    inserted = 0
+    while inserted < bill_count:
+        rows = []
+        for _ in range(min(chunk_size, bill_count - inserted)):
+            total = round(rng.uniform(20, 500), 2)
+            method = rng.choice(METHODS)
+            status = rng.choice(STATUSES)
+            rows.append({
+                'appointment_id': inserted + 1,
+                'patient_id': 1,
+                'doctor_id': rng.randint(1, doctor_count),
+                'subtotal': total,
+                'total_amount': total,
+                'payment_status': status,
+                'payment_method': method,
+                'insurance_claimed': method == 'Insurance',
+                'insurance_amount': round(total * 0.8, 2) if method == 'Insurance' else 0.0,
+                'created_at': start + timedelta(seconds=rng.randint(0, days * 86400))
+            })
+            inserted += 1
+        db.session.execute(Bill.__table__.insert(), rows)
+        db.session.commit()
+
+def legacy_statistics():
+    """The statistics admin.billing and patient.bills used to compute"""
+    total_revenue = db.session.query(func.sum(Bill.total_amount)).filter_by(payment_status='Paid').scalar() or 0
+    pending_amount = db.session.query(func.sum(Bill.total_amount)).filter_by(payment_status='Pending').scalar() or 0
+    total_bills = Bill.query.count()
+    paid_bills = Bill.query.filter_by(payment_status='Paid').count()
+
+    amounts = db.session.query(Bill.total_amount, Bill.payment_status).yield_per(50000)
+    by_status = {}
+    for amount, status in amounts:
+        by_status[status] = by_status.get(status, 0.0) + amount
+    return total_revenue, pending_amount, total_bills, paid_bills, by_status
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bills', type=int, default=10000000)
+    parser.add_argument('--doctors', type=int, default=200)
+    parser.add_argument('--days', type=int, default=730)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    from utils.billing_analytics import billing_summary
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = build_app(os.path.join(tmp, 'bench.db'))
+        with app.app_context():
+            db.create_all()
+            started = time.perf_counter()
+            seed(args.bills, args.doctors, args.days)
+            print(f'Seeded {args.bills} bills in {time.perf_counter() - started:.1f}s')
+
+            legacy = timed('legacy queries + python pass', legacy_statistics, args.repeat)
+            grouped = timed('billing_summary (grouped scans)', billing_summary, args.repeat)
+            print(f'billing_summary also returns day/week/month/doctor/specialization/method '
+                  f'breakdowns; speedup {legacy / grouped:.2f}x')
+
+if __name__ == '__main__':
+    main()
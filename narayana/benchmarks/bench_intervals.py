@@ -0,0 +1,41 @@
+"""Time the interval-based conflict check against a linear scan.
+
+Usage:
+    python benchmarks/bench_intervals.py --size 200
+
+Times IntervalIndex.overlaps against comparing every interval. The
+randomized correctness checks against brute force live in
+tests/test_intervals.py.
+"""
+import argparse
+import random
+from datetime import time
+
+from common import timed
+from utils.availability import DURATION_CHOICES, slot_end
+from utils.intervals import IntervalIndex
+
+def _random_interval(rng, step=15):
+    minutes = rng.randrange(0, 24 * 60, step)
+    start = time(minutes // 60, minutes % 60)
+    return start, slot_end(start, rng.choice(DURATION_CHOICES))
+
+def _overlaps(intervals, start, end):
+    return any(other_start < end and start < other_end for other_start, other_end in intervals)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=200, help='Intervals per index')
+    parser.add_argument('--queries', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    intervals = [_random_interval(rng) for _ in range(args.size)]
+    queries = [_random_interval(rng) for _ in range(args.queries)]
+    index = IntervalIndex(intervals)
+    timed(f'linear scan ({args.size} intervals)', lambda: [_overlaps(intervals, *q) for q in queries], repeat=3)
+    timed(f'IntervalIndex ({args.size} intervals)', lambda: [index.overlaps(*q) for q in queries], repeat=3)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Benchmark the precompiled /api row encoders against jsonify.
+
+Usage:
+    python benchmarks/bench_serialization.py --rows 100000
+
+Times the old path (ORM-free dict building with per-row .isoformat()
+calls, then flask.jsonify) against utils.serializers.RowEncoder with the
+stdlib backend and, when installed, orjson. Reports MB/s of JSON output.
+"""
+import argparse
+import time
+from datetime import date, time as dt_time, timedelta
+
+from common import build_app
+from flask import jsonify
+from utils.serializers import RESOURCES, RowEncoder, orjson, isoformat
+
+def make_rows(count):
+    start = date.today()
+    return [(i, f'dr_{i % 200}', f'patient_{i % 20000}', start + timedelta(days=i % 365),
+             dt_time(9 + i % 8, 0), 'Booked', 30) for i in range(count)]
+
+def jsonify_path(rows):
+    result = []
+    for row in rows:
+        result.append({
+            'id': row[0],
+            'doctor': row[1],
+            'patient': row[2],
+            'date': row[3].isoformat(),
+            'time': row[4].isoformat(),
+            'status': row[5],
+            'duration_minutes': row[6]
+        })
+    return jsonify(result).get_data()
+
+def measure(label, fn, repeat):
+    best, size = None, 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        size = len(fn())
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    print(f'{label:<28}{best * 1000:>10.1f} ms {size / best / 1e6:>10.1f} MB/s')
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    fields = RESOURCES['appointments'].encoder.fields
+    converters = {'date': isoformat, 'time': isoformat}
+    app = build_app(':memory:')
+    with app.app_context():
+        baseline = measure('jsonify + isoformat', lambda: jsonify_path(rows), args.repeat)
+
+        stdlib_encoder = RowEncoder(fields, converters, backend='json')
+        stdlib = measure('RowEncoder (json)', lambda: stdlib_encoder.encode(rows), args.repeat)
+        print(f'{"":<28}speedup {baseline / stdlib:.2f}x')
+
+        if orjson:
+            orjson_encoder = RowEncoder(fields, converters, backend='orjson')
+            fast = measure('RowEncoder (orjson)', lambda: orjson_encoder.encode(rows), args.repeat)
+            print(f'{"":<28}speedup {baseline / fast:.2f}x')
+        else:
+            print('orjson not installed; skipping')
+
+if __name__ == '__main__':
+    main()
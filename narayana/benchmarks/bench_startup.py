@@ -0,0 +1,87 @@
+"""Cold-start benchmark: per-worker startup with and without a preloaded master.
+
+Usage:
+    python benchmarks/bench_startup.py --workers 8
+
+"cold" starts a fresh interpreter per worker, as gunicorn does without
+preload_app, and times importing app.py, create_app() and the first
+request. "preloaded" builds the app once in this process and forks the
+workers from it, as gunicorn does with preload_app = True, and times
+each forked worker's first request.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+COLD_WORKER = '''
+import json, time
+started = time.perf_counter()
+import app as app_module
+imported = time.perf_counter()
+app = app_module.create_app()
+created = time.perf_counter()
+app.test_client().get('/login')
+served = time.perf_counter()
+print(json.dumps({'import': imported - started, 'create_app': created - imported,
+                  'first_request': served - created}))
+'''
+
+def cold_start(env):
+    started = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', COLD_WORKER], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    timings = json.loads(output.strip().splitlines()[-1])
+    timings['total'] = time.perf_counter() - started
+    return timings
+
+def forked_start(app):
+    read_fd, write_fd = os.pipe()
+    started = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        forked = time.perf_counter()
+        app.test_client().get('/login')
+        served = time.perf_counter()
+        os.write(write_fd, json.dumps({'fork': forked - started, 'first_request': served - forked}).encode())
+        os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as pipe:
+        timings = json.loads(pipe.read())
+    os.waitpid(pid, 0)
+    timings['total'] = time.perf_counter() - started
+    return timings
+
+def report(label, samples):
+    keys = list(samples[0])
+    parts = '  '.join(f'{key} {statistics.median(s[key] for s in samples) * 1000:>7.1f} ms' for key in keys)
+    print(f'{label:<10} median per worker: {parts}')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=8, help='Workers to start in each mode')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL=f'sqlite:///{os.path.join(tmp, "startup.db")}')
+        os.environ.update(env)
+
+        report('cold', [cold_start(env) for _ in range(args.workers)])
+
+        started = time.perf_counter()
+        from app import create_app
+        app = create_app()
+        app.test_client().get('/login')
+        print(f'preload in master: {(time.perf_counter() - started) * 1000:.1f} ms (once)')
+        report('preloaded', [forked_start(app) for _ in range(args.workers)])
+
+if __name__ == '__main__':
+    main()
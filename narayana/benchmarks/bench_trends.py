@@ -0,0 +1,143 @@
+"""Cross-check and time the appointment trends read from the rollups.
+
+Usage:
+    python benchmarks/bench_trends.py --appointments 500000 --years 5
+
+Builds a throwaway SQLite database with synthetic appointments and paid
+bills, builds the daily and hourly rollups, then compares random
+appointment_trend() calls (every bucket size, doctor, specialization and
+status filters) against a brute-force pass over the generated rows; the
+script exits non-zero on any mismatch. It then times a 5-year daily
+series from the rollups against grouping the appointments table.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time as clock
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+
+from common import build_app, timed
+from sqlalchemy import func
+from models import db, User, Doctor, Patient, Appointment, Bill
+from utils.doctor_stats import rebuild_doctor_stats
+from utils.trends import BUCKETS, STATUSES, appointment_trend, bucket_start
+
+SPECIALIZATIONS = ['Cardiology', 'Neurology', 'Pediatrics', 'Orthopedics']
+
+def seed(rng, appointment_count, doctor_count, first_day, days, chunk_size=50000):
+    db.session.execute(User.__table__.insert(), [
+        {'id': i + 1, 'username': f'dr_{i}', 'email': f'dr_{i}@bench.local', 'password_hash': 'x', 'role': 'doctor'}
+        for i in range(doctor_count)
+    ] + [{'id': doctor_count + 1, 'username': 'pt', 'email': 'pt@bench.local', 'password_hash': 'x', 'role': 'patient'}])
+    db.session.execute(Doctor.__table__.insert(), [
+        {'id': i + 1, 'user_id': i + 1, 'specialization': SPECIALIZATIONS[i % len(SPECIALIZATIONS)]}
+        for i in range(doctor_count)
+    ])
+    db.session.execute(Patient.__table__.insert(), [{'id': 1, 'user_id': doctor_count + 1, 'medical_id': 'MED1'}])
+
+    appointments, bills = [], []
+    for appointment_id in range(1, appointment_count + 1):
+        day = first_day + timedelta(days=rng.randrange(days))
+        appointments.append({'id': appointment_id, 'doctor_id': rng.randint(1, doctor_count), 'patient_id': 1,
+                             'appointment_date': day, 'appointment_time': time(rng.randrange(8, 19)),
+                             'status': rng.choice(['Booked', 'Completed', 'Completed', 'Cancelled'])})
+        if appointments[-1]['status'] == 'Completed' and rng.random() < 0.5:
+            paid = datetime.combine(day, time(rng.randrange(24), rng.randrange(60)))
+            bills.append({'appointment_id': appointment_id, 'patient_id': 1,
+                          'doctor_id': appointments[-1]['doctor_id'], 'total_amount': round(rng.uniform(20, 500), 2),
+                          'payment_status': 'Paid', 'payment_date': paid})
+    for offset in range(0, len(appointments), chunk_size):
+        db.session.execute(Appointment.__table__.insert(), appointments[offset:offset + chunk_size])
+    for offset in range(0, len(bills), chunk_size):
+        db.session.execute(Bill.__table__.insert(), bills[offset:offset + chunk_size])
+    db.session.commit()
+    return appointments, bills
+
+def brute_force(appointments, bills, start, end, bucket, doctor_id, specialization, status, doctor_count):
+    def included(row_doctor):
+        if doctor_id and row_doctor != doctor_id:
+            return False
+        return not specialization or SPECIALIZATIONS[(row_doctor - 1) % len(SPECIALIZATIONS)] == specialization
+
+    counts = defaultdict(int)
+    revenue = defaultdict(float)
+    for row in appointments:
+        if start <= row['appointment_date'] <= end and included(row['doctor_id']):
+            if status and row['status'] != status:
+                continue
+            moment = row['appointment_date']
+            if bucket == 'hour':
+                moment = datetime.combine(moment, row['appointment_time'])
+            counts[bucket_start(moment, bucket)] += 1
+    for row in bills:
+        if start <= row['payment_date'].date() <= end and included(row['doctor_id']):
+            moment = row['payment_date'] if bucket == 'hour' else row['payment_date'].date()
+            revenue[bucket_start(moment, bucket)] += row['total_amount']
+    return counts, revenue
+
+def check(rng, appointments, bills, first_day, days, doctor_count, trials):
+    for _ in range(trials):
+        bucket = rng.choice(BUCKETS)
+        start = first_day + timedelta(days=rng.randrange(days))
+        end = start + timedelta(days=rng.randrange(10 if bucket == 'hour' else 400))
+        doctor_id = rng.choice([None, rng.randint(1, doctor_count)])
+        specialization = rng.choice([None, rng.choice(SPECIALIZATIONS)])
+        status = rng.choice([None, *STATUSES])
+
+        series = appointment_trend(start, end, bucket, doctor_id, specialization, status)
+        counts, revenue = brute_force(appointments, bills, start, end, bucket, doctor_id, specialization, status,
+                                      doctor_count)
+        got = {point['start']: point['appointments'] for point in series if point['appointments']}
+        if got != dict(counts):
+            raise SystemExit(f'Count mismatch for {bucket} {start}..{end} doctor={doctor_id} '
+                             f'specialization={specialization} status={status}')
+        for point in series:
+            if abs(point['revenue'] - revenue.get(point['start'], 0.0)) > 0.01 * max(1, len(series)):
+                raise SystemExit(f'Revenue mismatch in {bucket} bucket {point["start"]}')
+    print(f'appointment_trend: {trials} random queries match brute force')
+
+def raw_daily(start, end):
+    return db.session.query(Appointment.appointment_date, func.count(Appointment.id)).filter(
+        Appointment.appointment_date >= start,
+        Appointment.appointment_date <= end
+    ).group_by(Appointment.appointment_date).all()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--appointments', type=int, default=500000)
+    parser.add_argument('--doctors', type=int, default=40)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--trials', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    days = 365 * args.years
+    first_day = date.today() - timedelta(days=days)
+    with tempfile.TemporaryDirectory() as tmp:
+        app = build_app(os.path.join(tmp, 'trends.db'))
+        with app.app_context():
+            db.create_all()
+            started = clock.perf_counter()
+            appointments, bills = seed(rng, args.appointments, args.doctors, first_day, days)
+            print(f'Seeded {len(appointments)} appointments and {len(bills)} paid bills '
+                  f'in {clock.perf_counter() - started:.1f}s')
+            timed('rebuild_doctor_stats', rebuild_doctor_stats)
+
+            check(rng, appointments, bills, first_day, days, args.doctors, args.trials)
+
+            end = date.today()
+            timed(f'raw GROUP BY day ({args.years} years)', lambda: raw_daily(first_day, end), repeat=5)
+            timed(f'trend, day buckets ({args.years} years)', lambda: appointment_trend(first_day, end), repeat=5)
+            timed(f'trend, month buckets ({args.years} years)',
+                  lambda: appointment_trend(first_day, end, 'month'), repeat=5)
+            timed('trend, one doctor, days', lambda: appointment_trend(first_day, end, doctor_id=1), repeat=5)
+            timed('trend, hour buckets (30 days)',
+                  lambda: appointment_trend(end - timedelta(days=29), end, 'hour'), repeat=5)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,30 @@
+"""Helpers shared by the benchmark scripts"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from models import db
+
+def build_app(path):
+    """A bare app bound to a throwaway SQLite file"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+def timed(label, fn, repeat=1, setup=None):
+    """Run fn `repeat` times and print the best wall-clock time"""
+    best = None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    print(f'{label:<36} {best * 1000:>10.1f} ms (best of {repeat})')
+    return best
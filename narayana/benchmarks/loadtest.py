@@ -0,0 +1,250 @@
+"""Drive realistic patient, doctor and admin journeys and report latency.
+
+Usage:
+    # in-process through the Flask test client, against a synthetic database
+    python benchmarks/loadtest.py --database /tmp/load.db --generate --appointments 1000000
+
+    # over HTTP against a running server (e.g. gunicorn -w 4 'app:create_app()')
+    python benchmarks/loadtest.py --url http://127.0.0.1:8000 --seed 42
+
+Each journey mixes page views with writes: patients book and cancel,
+doctors complete visits and record treatments, admins bulk-complete
+booked appointments, so the signal-driven rollups, timeline, change
+capture, clinical index and waitlist run under load too. Reports
+p50/p95/p99 latency per endpoint, plus queries per request when
+running in-process. Synthetic accounts come from `flask seed-synthetic`
+(or --generate) and share utils.synthetic.SYNTHETIC_PASSWORD.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+class Step(namedtuple('Step', 'endpoint path method form capture')):
+    """One request of a journey.
+
+    `path` and `form` values are formatted with the values captured so
+    far; `capture` is a regex whose named groups are taken from a random
+    match in the response. A step whose values were never captured (say,
+    no booked appointment was listed) is skipped and counted as such.
+    """
+    __slots__ = ()
+
+    def __new__(cls, endpoint, path, method='GET', form=None, capture=None):
+        return super().__new__(cls, endpoint, path, method, form, capture and re.compile(capture))
+
+BOOKING_FORM = (r'name="doctor_id" value="(?P<doctor_id>\d+)">\s*'
+                r'<input type="hidden" name="date" value="(?P<date>[\d-]+)">\s*'
+                r'<input type="hidden" name="time" value="(?P<time>[\d:]+)">\s*'
+                r'<input type="hidden" name="duration" value="(?P<duration>\d+)">')
+
+PATIENT_JOURNEY = [
+    Step('patient.dashboard', '/patient/dashboard'),
+    Step('patient.search_doctors', '/patient/search-doctors'),
+    Step('patient.doctor_profile', '/patient/doctors/{doctor_id}', capture=BOOKING_FORM),
+    Step('patient.book_appointment', '/patient/book-appointment', 'POST',
+         {'doctor_id': '{doctor_id}', 'date': '{date}', 'time': '{time}', 'duration': '{duration}'}),
+    Step('patient.appointments', '/patient/appointments',
+         capture=r'/patient/appointments/(?P<appointment_id>\d+)/cancel'),
+    Step('patient.cancel_appointment', '/patient/appointments/{appointment_id}/cancel', 'POST'),
+    Step('patient.bills', '/patient/bills'),
+    Step('patient.medical_history', '/patient/medical-history'),
+    Step('shared.notifications', '/notifications')
+]
+DOCTOR_JOURNEY = [
+    Step('doctor.dashboard', '/doctor/dashboard'),
+    Step('doctor.appointments', '/doctor/appointments',
+         capture=r'/doctor/appointments/(?P<appointment_id>\d+)/complete'),
+    Step('doctor.complete_appointment', '/doctor/appointments/{appointment_id}/complete', 'POST'),
+    Step('doctor.add_treatment', '/doctor/appointments/{appointment_id}/treatment', 'POST',
+         {'diagnosis': 'Seasonal allergic rhinitis', 'prescription': 'Cetirizine 10mg once daily',
+          'notes': 'Load test visit'}),
+    Step('doctor.availability', '/doctor/availability'),
+    Step('doctor.patients_list', '/doctor/patients'),
+    Step('shared.notifications', '/notifications')
+]
+ADMIN_JOURNEY = [
+    Step('admin.dashboard', '/admin/dashboard'),
+    Step('admin.billing', '/admin/billing'),
+    Step('admin.appointments_list', '/admin/appointments?status=Booked',
+         capture=r'name="appointment_ids" value="(?P<appointment_id>\d+)"'),
+    Step('admin.bulk_appointments', '/admin/appointments/bulk', 'POST',
+         {'action': 'complete', 'scope': 'selected', 'appointment_ids': '{appointment_id}'}),
+    Step('api.get_doctors', '/api/doctors'),
+    Step('api.get_specializations', '/api/specializations')
+]
+
+class QueryCounter:
+    """Counts SQL statements per thread via an engine event"""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.local = threading.local()
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.local.count = getattr(self.local, 'count', 0) + 1
+
+    def reset(self):
+        self.local.count = 0
+
+    def value(self):
+        return getattr(self.local, 'count', 0)
+
+class TestClientSession:
+    def __init__(self, app, counter):
+        self.client = app.test_client()
+        self.counter = counter
+
+    def login(self, username, password):
+        self.client.post('/login', data={'username': username, 'password': password})
+
+    def request(self, method, path, form=None):
+        self.counter.reset()
+        started = time.perf_counter()
+        response = self.client.open(path, method=method, data=form)
+        elapsed = time.perf_counter() - started
+        return response.status_code, elapsed, self.counter.value(), response.get_data(as_text=True)
+
+class HttpSession:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+
+    def login(self, username, password):
+        data = urllib.parse.urlencode({'username': username, 'password': password}).encode()
+        self.opener.open(self.base_url + '/login', data=data).read()
+
+    def request(self, method, path, form=None):
+        # urllib follows the redirect after a POST, so its time is included
+        data = urllib.parse.urlencode(form or {}).encode() if method == 'POST' else None
+        started = time.perf_counter()
+        try:
+            with self.opener.open(self.base_url + path, data=data) as response:
+                body = response.read().decode('utf-8', 'replace')
+                status = response.status
+        except urllib.error.HTTPError as exc:
+            status, body = exc.code, ''
+        return status, time.perf_counter() - started, None, body
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+def run_journeys(make_session, seed, users, iterations, concurrency, doctor_count, patient_count):
+    results = defaultdict(lambda: {'latency': [], 'queries': [], 'errors': 0, 'skipped': 0})
+    lock = threading.Lock()
+    prefix = f'syn{seed}_'
+
+    def journey(worker):
+        from utils.synthetic import SYNTHETIC_PASSWORD
+        rng = random.Random(worker)
+        role = ['patient', 'patient', 'patient', 'doctor', 'admin'][worker % 5]
+        session = make_session()
+        if role == 'patient':
+            session.login(f'{prefix}pt{rng.randrange(patient_count)}', SYNTHETIC_PASSWORD)
+            steps = PATIENT_JOURNEY
+        elif role == 'doctor':
+            session.login(f'{prefix}dr{rng.randrange(doctor_count)}', SYNTHETIC_PASSWORD)
+            steps = DOCTOR_JOURNEY
+        else:
+            session.login(f'{prefix}admin', SYNTHETIC_PASSWORD)
+            steps = ADMIN_JOURNEY
+
+        for _ in range(iterations):
+            values = {'doctor_id': rng.randint(1, doctor_count)}
+            for step in steps:
+                try:
+                    path = step.path.format(**values)
+                    form = {key: value.format(**values) for key, value in (step.form or {}).items()}
+                except KeyError:
+                    with lock:
+                        results[step.endpoint]['skipped'] += 1
+                    continue
+                status, elapsed, queries, body = session.request(step.method, path, form)
+                if step.capture:
+                    matches = list(step.capture.finditer(body))
+                    if matches:
+                        values.update(rng.choice(matches).groupdict())
+                with lock:
+                    result = results[step.endpoint]
+                    result['latency'].append(elapsed)
+                    if queries is not None:
+                        result['queries'].append(queries)
+                    if status >= 400:
+                        result['errors'] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(journey, range(users)))
+    return results, time.perf_counter() - started
+
+def print_report(results, wall_seconds):
+    total = sum(len(r['latency']) for r in results.values())
+    print(f'{"endpoint":<32}{"n":>7}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"queries":>9}{"errors":>8}{"skipped":>9}')
+    for endpoint in sorted(results):
+        r = results[endpoint]
+        latency = r['latency']
+        if not latency:
+            print(f'{endpoint:<32}{0:>7}{"-":>10}{"-":>10}{"-":>10}{"-":>9}{0:>8}{r["skipped"]:>9}')
+            continue
+        queries = f'{sum(r["queries"]) / len(r["queries"]):.1f}' if r['queries'] else '-'
+        print(f'{endpoint:<32}{len(latency):>7}'
+              f'{percentile(latency, 50) * 1000:>10.1f}{percentile(latency, 95) * 1000:>10.1f}'
+              f'{percentile(latency, 99) * 1000:>10.1f}{queries:>9}{r["errors"]:>8}{r["skipped"]:>9}')
+    print(f'{total} requests in {wall_seconds:.1f}s ({total / wall_seconds:.1f} req/s)')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='Base URL of a running server; omit to use the Flask test client')
+    parser.add_argument('--database', help='SQLite file for in-process runs (sets DATABASE_URL)')
+    parser.add_argument('--generate', action='store_true', help='Load synthetic data before the run')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--doctors', type=int, default=200)
+    parser.add_argument('--patients', type=int, default=20000)
+    parser.add_argument('--appointments', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=20, help='Simulated users (each runs one journey)')
+    parser.add_argument('--iterations', type=int, default=5, help='Journey repetitions per user')
+    parser.add_argument('--concurrency', type=int, default=4)
+    args = parser.parse_args()
+
+    if args.url:
+        results, wall = run_journeys(lambda: HttpSession(args.url), args.seed, args.users,
+                                     args.iterations, args.concurrency, args.doctors, args.patients)
+        print_report(results, wall)
+        return
+
+    if args.database:
+        os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(args.database)}'
+
+    from app import create_app
+    from models import db
+
+    app = create_app()
+    with app.app_context():
+        if args.generate:
+            from utils.synthetic import generate_synthetic_data
+            db.create_all()
+            started = time.perf_counter()
+            generate_synthetic_data(seed=args.seed, doctors=args.doctors, patients=args.patients,
+                                    appointments=args.appointments, progress=print)
+            print(f'Generated synthetic data in {time.perf_counter() - started:.1f}s')
+        counter = QueryCounter(db.engine)
+
+    results, wall = run_journeys(lambda: TestClientSession(app, counter), args.seed, args.users,
+                                 args.iterations, args.concurrency, args.doctors, args.patients)
+    print_report(results, wall)
+
+if __name__ == '__main__':
+    main()
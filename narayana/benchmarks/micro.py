@@ -0,0 +1,143 @@
+"""Micro-benchmarks for hot helper functions at several data sizes.
+
+Usage:
+    python benchmarks/micro.py                         # run and print
+    python benchmarks/micro.py --save                  # store results as the baseline
+    python benchmarks/micro.py --compare --threshold 20
+
+--compare exits with status 1 when any benchmark is slower than the
+stored baseline by more than --threshold percent, and at once when there
+is no baseline: timings are machine-specific, so the baseline is not
+committed and must be recorded locally with --save first. Results are keyed by
+benchmark name and data size (number of synthetic appointments).
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from common import build_app
+from models import db, User, Doctor, Patient, Appointment
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+def measure(fn, min_time=0.2, max_calls=1000):
+    """Median seconds per call over at least `min_time` of wall clock"""
+    samples = []
+    deadline = time.perf_counter() + min_time
+    while len(samples) < max_calls and (len(samples) < 3 or time.perf_counter() < deadline):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+def benchmarks_for(app):
+    """Return (name, callable) pairs bound to the loaded data"""
+    from routes.patient import get_smart_suggestions
+    from utils.availability import available_slots
+    from utils.validators import check_double_booking
+    from utils.notifications import get_unread_count, create_notification
+    from utils.synthetic import SYNTHETIC_PASSWORD
+
+    # The busiest doctor, patient and user make the worst-case inputs
+    doctor_id = db.session.query(Appointment.doctor_id).group_by(Appointment.doctor_id).order_by(
+        db.func.count(Appointment.id).desc()).limit(1).scalar()
+    patient = Patient.query.first()
+    user = User.query.filter(User.role == 'patient').first()
+    booked = Appointment.query.filter_by(doctor_id=doctor_id).first()
+    today = date.today()
+    slots = available_slots(doctor_id, today, today + timedelta(days=7))
+    client = app.test_client()
+
+    return [
+        ('available_slots', lambda: available_slots(doctor_id, today, today + timedelta(days=7))),
+        ('get_smart_suggestions', lambda: get_smart_suggestions(list(slots))),
+        ('check_double_booking', lambda: check_double_booking(doctor_id, booked.appointment_date,
+                                                              booked.appointment_time)),
+        ('get_unread_count', lambda: get_unread_count(patient.user_id)),
+        ('create_notification', lambda: create_notification(patient.user_id, 'Benchmark notification')),
+        ('User.check_password', lambda: user.check_password(SYNTHETIC_PASSWORD)),
+        ('api.get_doctors', lambda: client.get('/api/doctors')),
+        ('api.get_patients', lambda: client.get('/api/patients')),
+        ('api.get_appointments', lambda: client.get('/api/appointments')),
+        ('api.get_specializations', lambda: client.get('/api/specializations'))
+    ]
+
+def run(sizes, only=None):
+    from routes import api
+    from utils.synthetic import generate_synthetic_data
+
+    results = {}
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            app = build_app(os.path.join(tmp, 'micro.db'))
+            app.register_blueprint(api.bp, url_prefix='/api')
+            with app.app_context():
+                db.create_all()
+                generate_synthetic_data(seed=7, doctors=max(5, size // 500), patients=max(10, size // 5),
+                                        appointments=size, availability_blocks=size // 50)
+                for name, fn in benchmarks_for(app):
+                    if only and not any(pattern in name for pattern in only):
+                        continue
+                    key = f'{name}[{size}]'
+                    results[key] = measure(fn)
+                    print(f'{key:<40} {results[key] * 1e6:>12.1f} us')
+                db.session.remove()
+    return results
+
+def compare(results, baseline, threshold):
+    regressions = []
+    print(f'\n{"benchmark":<40}{"baseline us":>14}{"current us":>14}{"change":>9}')
+    for key, current in sorted(results.items()):
+        previous = baseline.get(key)
+        if previous is None:
+            print(f'{key:<40}{"-":>14}{current * 1e6:>14.1f}{"new":>9}')
+            continue
+        change = (current - previous) / previous * 100
+        flag = '  REGRESSION' if change > threshold else ''
+        print(f'{key:<40}{previous * 1e6:>14.1f}{current * 1e6:>14.1f}{change:>+8.1f}%{flag}')
+        if flag:
+            regressions.append(key)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000,50000',
+                        help='Comma-separated synthetic appointment counts')
+    parser.add_argument('--only', action='append', help='Run benchmarks whose name contains this text')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save', action='store_true', help='Store results as the new baseline')
+    parser.add_argument('--compare', action='store_true', help='Compare against the stored baseline')
+    parser.add_argument('--threshold', type=float, default=20.0, help='Allowed slowdown in percent')
+    args = parser.parse_args()
+
+    # Check before spending minutes on the run
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            sys.exit(f'No baseline at {args.baseline}. Baselines are machine-specific and not committed; '
+                     f'record one on this machine with --save (from the commit to compare against) first')
+        with open(args.baseline) as handle:
+            baseline = json.load(handle)
+
+    results = run([int(size) for size in args.sizes.split(',')], args.only)
+
+    if args.compare:
+        if not baseline.keys() & results.keys():
+            sys.exit(f'{args.baseline} has none of these benchmarks; record it with the same --sizes and --only')
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f'\n{len(regressions)} benchmark(s) regressed by more than {args.threshold}%')
+            sys.exit(1)
+        print('\nNo regressions')
+
+    if args.save:
+        with open(args.baseline, 'w') as handle:
+            json.dump(results, handle, indent=2, sort_keys=True)
+        print(f'Saved baseline to {args.baseline}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+# Gunicorn settings: gunicorn -c gunicorn.conf.py 'app:create_app()'
+import multiprocessing
+import os
+from importlib.util import find_spec
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+
+# Notification streams (/notifications/stream) are long-lived and mostly
+# idle. With gevent each one is a greenlet rather than a blocked sync
+# worker; without it, fall back to threads so streams do not starve
+# ordinary requests.
+try:
+    from gevent import monkey
+    # Patch before the app is preloaded so its locks and queues are cooperative
+    monkey.patch_all()
+    worker_class = 'gevent'
+    worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+except ImportError:
+    worker_class = 'gthread'
+    threads = int(os.environ.get('GUNICORN_THREADS', 32))
+
+# Build the app once in the master and fork workers from it, so imported
+# modules and compiled templates are shared copy-on-write. create_app
+# never opens a database connection, so no connection crosses the fork.
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+timeout = 60
+
+# Optional packages, what they back and the fallback without them
+# (see requirements-optional.txt)
+OPTIONAL_BACKENDS = (
+    ('API JSON encoding', 'orjson', 'json'),
+    ('Parquet exports', 'pyarrow', 'disabled'),
+    ('Static asset compression', 'brotli', 'gzip only')
+)
+
+def when_ready(server):
+    server.log.info('Worker class: %s, %s workers', server.cfg.worker_class_str, server.cfg.workers)
+    for feature, package, fallback in OPTIONAL_BACKENDS:
+        server.log.info('%s: %s', feature, package if find_spec(package) else f'{fallback} ({package} not installed)')
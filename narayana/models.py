@@ -1,8 +1,21 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
+from utils.shards import RoutingSession
 
-db = SQLAlchemy()
+# Each facility's data lives in its own database; the session routes to it
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+class Facility(db.Model):
+    """The hospital a database shard belongs to; each shard holds one row, its own"""
+    __tablename__ = 'facilities'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    code = db.Column(db.String(50), unique=True, nullable=False)
+    name = db.Column(db.String(150), nullable=False)
+    address = db.Column(db.Text)
+    phone = db.Column(db.String(20))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -73,6 +86,26 @@ class Availability(db.Model):
     end_time = db.Column(db.Time, nullable=False)
     is_available = db.Column(db.Boolean, default=True)
 
+class AvailabilityRule(db.Model):
+    """A blocked date range, optionally limited to some weekdays and a time window; see utils.availability"""
+    __tablename__ = 'availability_rules'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False)
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date)  # None: repeats indefinitely
+    weekdays = db.Column(db.Integer, default=0)  # bit 0 = Monday ... bit 6 = Sunday; 0: every day
+    start_time = db.Column(db.Time)  # None: all day
+    end_time = db.Column(db.Time)
+    reason = db.Column(db.String(200))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    doctor = db.relationship('Doctor', backref='availability_rules')
+    
+    __table_args__ = (
+        db.Index('ix_availability_rules_doctor_start', 'doctor_id', 'start_date'),
+    )
+
 class Appointment(db.Model):
     __tablename__ = 'appointments'
     
@@ -81,11 +114,17 @@ class Appointment(db.Model):
     patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=False)
     appointment_date = db.Column(db.Date, nullable=False)
     appointment_time = db.Column(db.Time, nullable=False)
+    duration_minutes = db.Column(db.Integer, default=60)
     status = db.Column(db.String(20), default='Booked')  # Booked, Completed, Cancelled
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     treatment = db.relationship('Treatment', backref='appointment', uselist=False, cascade='all, delete-orphan')
     rating = db.relationship('Rating', backref='appointment', uselist=False, cascade='all, delete-orphan')
+    
+    __table_args__ = (
+        db.Index('ix_appointments_date_time', 'appointment_date', 'appointment_time'),
+        db.Index('ix_appointments_doctor_date_time', 'doctor_id', 'appointment_date', 'appointment_time'),
+    )
 
 class Treatment(db.Model):
     __tablename__ = 'treatments'
@@ -118,6 +157,168 @@ class Notification(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     user = db.relationship('User', backref='notifications')
+    
+    __table_args__ = (
+        db.Index('ix_notifications_user_created', 'user_id', 'created_at', 'id'),
+        db.Index('ix_notifications_user_unread', 'user_id', 'is_read'),
+    )
+
+class ReminderLog(db.Model):
+    __tablename__ = 'reminder_logs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    appointment_id = db.Column(db.Integer, db.ForeignKey('appointments.id'), nullable=False)
+    window = db.Column(db.String(10), nullable=False)  # 24h, 1h
+    sent_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('appointment_id', 'window', name='uq_reminder_logs_appointment_window'),
+    )
+
+class WaitlistEntry(db.Model):
+    """A patient waiting for a slot with a doctor between two dates; matched by utils.waitlist"""
+    __tablename__ = 'waitlist_entries'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=False)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False)
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+    duration_minutes = db.Column(db.Integer, default=60)
+    auto_confirm = db.Column(db.Boolean, default=False)  # book outright instead of holding
+    status = db.Column(db.String(20), default='Waiting')  # Waiting, Held, Booked, Expired, Cancelled
+    appointment_id = db.Column(db.Integer, db.ForeignKey('appointments.id'))  # the held or booked slot
+    hold_expires_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    patient = db.relationship('Patient', backref='waitlist_entries')
+    doctor = db.relationship('Doctor', backref='waitlist_entries')
+    appointment = db.relationship('Appointment')
+    
+    __table_args__ = (
+        db.Index('ix_waitlist_doctor_status_start', 'doctor_id', 'status', 'start_date'),
+        db.Index('ix_waitlist_status_hold', 'status', 'hold_expires_at'),
+    )
+
+class DoctorDailyStats(db.Model):
+    """Per-doctor, per-day rollup maintained by utils.doctor_stats"""
+    __tablename__ = 'doctor_daily_stats'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    booked = db.Column(db.Integer, default=0)
+    completed = db.Column(db.Integer, default=0)
+    cancelled = db.Column(db.Integer, default=0)
+    available_slots = db.Column(db.Integer, default=0)
+    revenue = db.Column(db.Float, default=0.0)  # paid bills, by payment date
+    rating_sum = db.Column(db.Integer, default=0)  # ratings given that day
+    rating_count = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('doctor_id', 'day', name='uq_doctor_daily_stats_doctor_day'),
+        db.Index('ix_doctor_daily_stats_day', 'day'),
+    )
+
+class DoctorHourlyStats(db.Model):
+    """Per-doctor, per-hour appointment and revenue rollup for hourly trends, maintained by utils.doctor_stats"""
+    __tablename__ = 'doctor_hourly_stats'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    hour = db.Column(db.Integer, nullable=False)  # 0-23
+    booked = db.Column(db.Integer, default=0)
+    completed = db.Column(db.Integer, default=0)
+    cancelled = db.Column(db.Integer, default=0)
+    revenue = db.Column(db.Float, default=0.0)  # paid bills, by payment hour
+    
+    __table_args__ = (
+        db.UniqueConstraint('doctor_id', 'day', 'hour', name='uq_doctor_hourly_stats_doctor_day_hour'),
+        db.Index('ix_doctor_hourly_stats_day_hour', 'day', 'hour'),
+    )
+
+class SpecializationDailyStats(db.Model):
+    """Per-day appointment and revenue totals by specialization, summed from doctor_daily_stats for trends"""
+    __tablename__ = 'specialization_daily_stats'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    specialization = db.Column(db.String(100), nullable=False)
+    booked = db.Column(db.Integer, default=0)
+    completed = db.Column(db.Integer, default=0)
+    cancelled = db.Column(db.Integer, default=0)
+    revenue = db.Column(db.Float, default=0.0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('day', 'specialization', name='uq_specialization_daily_stats_day_specialization'),
+        # Covers the trend query, which reads every column but id
+        db.Index('ix_specialization_daily_stats_day_totals', 'day', 'specialization',
+                 'booked', 'completed', 'cancelled', 'revenue'),
+    )
+
+class TimelineEntry(db.Model):
+    """One completed appointment with its doctor, treatment, bill and rating, maintained by utils.timeline"""
+    __tablename__ = 'patient_timeline'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    appointment_id = db.Column(db.Integer, db.ForeignKey('appointments.id'), nullable=False, unique=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=False)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False)
+    appointment_date = db.Column(db.Date, nullable=False)
+    appointment_time = db.Column(db.Time, nullable=False)
+    doctor_name = db.Column(db.String(80))
+    specialization = db.Column(db.String(100))
+    diagnosis = db.Column(db.Text)
+    prescription = db.Column(db.Text)
+    treatment_notes = db.Column(db.Text)
+    treatment_recorded_at = db.Column(db.DateTime)
+    bill_id = db.Column(db.Integer)
+    bill_total = db.Column(db.Float)
+    bill_status = db.Column(db.String(20))
+    rating = db.Column(db.Integer)
+    feedback = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_patient_timeline_patient_date', 'patient_id', 'appointment_date', 'appointment_id'),
+    )
+
+class ClinicalTerm(db.Model):
+    """Inverted index posting: one normalized diagnosis or prescription term of a treatment, maintained by utils.clinical_index"""
+    __tablename__ = 'clinical_terms'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    term = db.Column(db.String(100), nullable=False)
+    field = db.Column(db.String(20), nullable=False)  # diagnosis, prescription
+    code = db.Column(db.String(20))  # mapped code, when the term has one
+    treatment_id = db.Column(db.Integer, db.ForeignKey('treatments.id'), nullable=False)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=False)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False)
+    appointment_date = db.Column(db.Date, nullable=False)
+    
+    __table_args__ = (
+        db.UniqueConstraint('treatment_id', 'field', 'term', name='uq_clinical_terms_treatment_field_term'),
+        # Term lookups and monthly trends read only the index
+        db.Index('ix_clinical_terms_term', 'term', 'field', 'appointment_date', 'treatment_id'),
+        db.Index('ix_clinical_terms_code', 'code', 'field', 'appointment_date', 'treatment_id'),
+    )
+
+class ClinicalCode(db.Model):
+    """Optional mapping from a normalized term or phrase to a code, e.g. ICD-10 for diagnoses, ATC for drugs"""
+    __tablename__ = 'clinical_codes'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    field = db.Column(db.String(20), nullable=False)  # diagnosis, prescription
+    term = db.Column(db.String(100), nullable=False)
+    code = db.Column(db.String(20), nullable=False)
+    system = db.Column(db.String(20))  # ICD-10, ATC, ...
+    description = db.Column(db.String(200))
+    
+    __table_args__ = (
+        db.UniqueConstraint('field', 'term', name='uq_clinical_codes_field_term'),
+    )
 
 class AuditLog(db.Model):
     __tablename__ = 'audit_logs'
@@ -132,6 +333,32 @@ class AuditLog(db.Model):
     
     user = db.relationship('User', backref='audit_logs')
 
+class CacheVersion(db.Model):
+    """Change counter of an entity (entity_id 0) or one of its rows, shared by every worker process"""
+    __tablename__ = 'cache_versions'
+    
+    entity = db.Column(db.String(50), primary_key=True)
+    entity_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class ChangeEvent(db.Model):
+    """Append-only change log of appointments, treatments and bills, written by utils.changes"""
+    __tablename__ = 'change_events'
+    
+    # The id is the stream's sequence number; AUTOINCREMENT never reuses one
+    id = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(30), nullable=False)  # table name
+    entity_id = db.Column(db.Integer, nullable=False)
+    operation = db.Column(db.String(10), nullable=False)  # insert, update, delete
+    changed_columns = db.Column(db.Text)  # comma separated
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # Consumers that follow one entity read it in sequence order
+        db.Index('ix_change_events_entity_id', 'entity', 'id'),
+        {'sqlite_autoincrement': True}
+    )
+
 class Bill(db.Model):
     __tablename__ = 'bills'
     
@@ -162,6 +389,8 @@ class Bill(db.Model):
     # Insurance
     insurance_claimed = db.Column(db.Boolean, default=False)
     insurance_amount = db.Column(db.Float, default=0.0)
+    claim_batch_id = db.Column(db.Integer, db.ForeignKey('claim_batches.id'))
+    claim_status = db.Column(db.String(20))  # Batched, Claimed
     
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -170,3 +399,30 @@ class Bill(db.Model):
     appointment = db.relationship('Appointment', backref='bill')
     patient = db.relationship('Patient', backref='bills')
     doctor = db.relationship('Doctor', backref='bills')
+    
+    __table_args__ = (
+        # Bills still to claim (claim_batch_id IS NULL) and the bills of one
+        # claim batch are both range scans of this index
+        db.Index('ix_bills_claim_batch', 'claim_batch_id', 'id'),
+    )
+
+class ClaimBatch(db.Model):
+    __tablename__ = 'claim_batches'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    insurance_provider = db.Column(db.String(100), nullable=False)
+    status = db.Column(db.String(20), default='Pending')  # Pending, Completed, Failed
+    bill_count = db.Column(db.Integer, default=0)
+    claimed_amount = db.Column(db.Float, default=0.0)
+    filename = db.Column(db.String(200))
+    attempts = db.Column(db.Integer, default=0)
+    error = db.Column(db.Text)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
+    
+    creator = db.relationship('User')
+    
+    __table_args__ = (
+        db.Index('ix_claim_batches_status', 'status', 'id'),
+    )
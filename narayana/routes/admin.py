@@ -1,27 +1,37 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
-from models import db, User, Doctor, Patient, Appointment, AuditLog
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, send_file, abort
+from models import db, User, Doctor, Patient, Appointment, AuditLog, Bill, ClaimBatch
 from utils.auth import role_required
+from utils import signals
+from utils.billing_analytics import billing_summary
+from utils.bulk_appointments import bulk_update_appointments, parse_bulk_form
+from utils.claims import claim_file_path, claim_queue, process_claims, submit_claim_batch
+from utils.clinical_index import clinical_trend, parse_clinical_args, search_treatments, top_terms
+from utils.doctor_stats import doctor_performance as get_doctor_performance
+from utils.exports import export_jobs, EXPORTS, EXPORT_FORMATS
+from utils.facility_reports import facilities_report
+from utils.fragment_cache import fragment_cache, versions
+from utils.trends import appointment_trend
+from utils.view_cache import cached_view, view_cache
 from datetime import datetime, timedelta
 from sqlalchemy import func
 
 bp = Blueprint('admin', __name__)
 
-@bp.route('/dashboard')
-@role_required('admin')
-def dashboard():
+# Entities whose changes show on the admin dashboard
+DASHBOARD_ENTITIES = ('appointments', 'doctor', 'patient', 'bills', 'availability')
+
+def dashboard_stats(today):
+    """Counts, trends and revenue shown on the admin dashboard"""
+    thirty_days_ago = today - timedelta(days=30)
+    
     # Get counts
     doctor_count = Doctor.query.count()
     patient_count = Patient.query.count()
     appointment_count = Appointment.query.count()
     
-    # Get appointment trends (last 30 days)
-    thirty_days_ago = datetime.utcnow().date() - timedelta(days=30)
-    appointments_by_date = db.session.query(
-        Appointment.appointment_date,
-        func.count(Appointment.id)
-    ).filter(
-        Appointment.appointment_date >= thirty_days_ago
-    ).group_by(Appointment.appointment_date).all()
+    # Get appointment trends (last 30 days) from the daily rollups
+    appointments_by_date = [(point['start'], point['appointments'])
+                            for point in appointment_trend(thirty_days_ago, today) if point['appointments']]
     
     # Get appointments by specialization
     appointments_by_spec = db.session.query(
@@ -29,23 +39,33 @@ def dashboard():
         func.count(Appointment.id)
     ).join(Appointment).group_by(Doctor.specialization).all()
     
-    # Get doctor performance
-    doctor_performance = db.session.query(
-        User.username,
-        Doctor.specialization,
-        func.count(Appointment.id).label('total_appointments'),
-        func.avg(Doctor.rating).label('avg_rating')
-    ).join(Doctor, User.id == Doctor.user_id).outerjoin(
-        Appointment, Doctor.id == Appointment.doctor_id
-    ).group_by(User.id).all()
+    # Get doctor performance from the daily rollups
+    doctor_performance = get_doctor_performance(thirty_days_ago, today)
+    
+    # Get revenue overview
+    revenue = billing_summary(start_date=thirty_days_ago)
     
+    return {
+        'doctor_count': doctor_count,
+        'patient_count': patient_count,
+        'appointment_count': appointment_count,
+        'appointments_by_date': appointments_by_date,
+        'appointments_by_spec': appointments_by_spec,
+        'doctor_performance': doctor_performance,
+        'revenue': revenue
+    }
+
+@bp.route('/dashboard')
+@role_required('admin')
+def dashboard():
+    # The stats are only computed when the cached dashboard fragment is stale,
+    # and then come from the view-data cache shared by all admins when possible
+    today = datetime.utcnow().date()
+    depends_on = [today] + [versions.get(entity) for entity in DASHBOARD_ENTITIES]
     return render_template('admin/dashboard.html',
-                         doctor_count=doctor_count,
-                         patient_count=patient_count,
-                         appointment_count=appointment_count,
-                         appointments_by_date=appointments_by_date,
-                         appointments_by_spec=appointments_by_spec,
-                         doctor_performance=doctor_performance)
+                         today=today,
+                         load_stats=lambda: cached_view('admin.dashboard', lambda: dashboard_stats(today),
+                                                        *depends_on, shared=True))
 
 @bp.route('/doctors')
 @role_required('admin')
@@ -94,6 +114,7 @@ def create_doctor():
         db.session.add(audit)
         
         db.session.commit()
+        signals.doctor_changed.send(doctor_ids=[doctor.id])
         flash('Doctor created successfully', 'success')
         return redirect(url_for('admin.doctors'))
     
@@ -152,6 +173,7 @@ def create_patient():
         db.session.add(audit)
         
         db.session.commit()
+        signals.patient_changed.send(patient_ids=[patient.id])
         flash('Patient created successfully', 'success')
         return redirect(url_for('admin.patients'))
     
@@ -196,7 +218,26 @@ def appointments_list():
                          booked=booked,
                          completed=completed,
                          cancelled=cancelled,
-                         status_filter=status_filter)
+                         status_filter=status_filter,
+                         doctors=Doctor.query.all())
+
+@bp.route('/appointments/bulk', methods=['POST'])
+@role_required('admin')
+def bulk_appointments():
+    try:
+        options = parse_bulk_form(request.form)
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('admin.appointments_list'))
+    
+    doctor_id = request.form.get('doctor_id', type=int)
+    if options.get('start_date') and not doctor_id:
+        flash('Choose a doctor for a date range', 'error')
+        return redirect(url_for('admin.appointments_list'))
+    
+    results = bulk_update_appointments(session['user_id'], doctor_id=doctor_id, **options)
+    return render_template('shared/bulk_results.html', action=options['action'], results=results,
+                         back_url=url_for('admin.appointments_list'))
 
 @bp.route('/doctors/<int:doctor_id>/toggle-status', methods=['POST'])
 @role_required('admin')
@@ -213,6 +254,7 @@ def toggle_doctor_status(doctor_id):
     db.session.add(audit)
     
     db.session.commit()
+    signals.doctor_changed.send(doctor_ids=[doctor.id])
     flash(f'Doctor {"activated" if user.is_active else "deactivated"} successfully', 'success')
     return redirect(url_for('admin.doctors'))
 
@@ -231,32 +273,206 @@ def toggle_patient_status(patient_id):
     db.session.add(audit)
     
     db.session.commit()
+    signals.patient_changed.send(patient_ids=[patient.id])
     flash(f'Patient {"activated" if user.is_active else "deactivated"} successfully', 'success')
     return redirect(url_for('admin.patients'))
 
 @bp.route('/billing')
 @role_required('admin')
 def billing():
-    from models import Bill
-    
     status_filter = request.args.get('status', '')
+    page = request.args.get('page', 1, type=int)
     
     query = Bill.query
     if status_filter:
         query = query.filter_by(payment_status=status_filter)
     
-    bills = query.order_by(Bill.created_at.desc()).all()
+    bills = query.order_by(Bill.created_at.desc()).paginate(page=page, per_page=50, error_out=False)
     
-    # Calculate statistics
-    total_revenue = db.session.query(func.sum(Bill.total_amount)).filter_by(payment_status='Paid').scalar() or 0
-    pending_amount = db.session.query(func.sum(Bill.total_amount)).filter_by(payment_status='Pending').scalar() or 0
-    total_bills = Bill.query.count()
-    paid_bills = Bill.query.filter_by(payment_status='Paid').count()
+    # Calculate statistics in a single grouped pass over bills
+    analytics = billing_summary()
+    totals = analytics['totals']
     
     return render_template('admin/billing.html',
                          bills=bills,
-                         total_revenue=total_revenue,
-                         pending_amount=pending_amount,
-                         total_bills=total_bills,
-                         paid_bills=paid_bills,
+                         analytics=analytics,
+                         total_revenue=totals['revenue'],
+                         pending_amount=totals['pending'],
+                         total_bills=totals['bills'],
+                         paid_bills=totals['paid_bills'],
                          status_filter=status_filter)
+
+@bp.route('/claims')
+@role_required('admin')
+def claims():
+    status_filter = request.args.get('status', '')
+    page = request.args.get('page', 1, type=int)
+    
+    query = ClaimBatch.query
+    if status_filter:
+        query = query.filter_by(status=status_filter)
+    batches = query.order_by(ClaimBatch.id.desc()).paginate(page=page, per_page=50, error_out=False)
+    
+    return render_template('admin/claims.html',
+                         batches=batches,
+                         queue=claim_queue(),
+                         status_filter=status_filter)
+
+@bp.route('/claims/run', methods=['POST'])
+@role_required('admin')
+def run_claims():
+    # Audit rows for the new batches are written by create_claim_batches()
+    created, completed, failed = process_claims(session['user_id'])
+    
+    if failed:
+        flash(f'{completed} claim batches completed, {failed} failed. Failed batches can be retried.', 'error')
+    else:
+        flash(f'Created {created} claim batches; {completed} claim files ready', 'success')
+    return redirect(url_for('admin.claims'))
+
+@bp.route('/claims/<int:batch_id>/retry', methods=['POST'])
+@role_required('admin')
+def retry_claim_batch(batch_id):
+    batch = ClaimBatch.query.get_or_404(batch_id)
+    if batch.status == 'Completed':
+        flash('This claim batch is already complete', 'error')
+        return redirect(url_for('admin.claims'))
+    
+    batch = submit_claim_batch(batch.id)
+    
+    # Audit log
+    audit = AuditLog(user_id=session['user_id'], action='UPDATE',
+                    entity_type='ClaimBatch', entity_id=batch.id,
+                    details=f'Retried claim batch {batch.id}: {batch.status}')
+    db.session.add(audit)
+    db.session.commit()
+    
+    if batch.status == 'Completed':
+        flash(f'Claim batch {batch.id} completed', 'success')
+    else:
+        flash(f'Claim batch {batch.id} failed again: {batch.error}', 'error')
+    return redirect(url_for('admin.claims'))
+
+@bp.route('/claims/<int:batch_id>/download')
+@role_required('admin')
+def download_claim_batch(batch_id):
+    batch = ClaimBatch.query.get_or_404(batch_id)
+    path = claim_file_path(batch)
+    if batch.status != 'Completed' or not path:
+        abort(404)
+    return send_file(path, as_attachment=True, download_name=batch.filename)
+
+@bp.route('/clinical-search')
+@role_required('admin')
+def clinical_search():
+    try:
+        options = parse_clinical_args(request.args)
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('admin.clinical_search'))
+    
+    summary, results, next_cursor, trend = None, [], None, []
+    if options['text']:
+        try:
+            summary, results, next_cursor = search_treatments(cursor=request.args.get('cursor'), **options)
+            trend = clinical_trend(**options)
+        except ValueError as e:
+            flash(str(e), 'error')
+    
+    return render_template('shared/clinical_search.html',
+                         endpoint='admin.clinical_search',
+                         options=options,
+                         mine=False,
+                         summary=summary,
+                         results=results,
+                         next_cursor=next_cursor,
+                         trend=trend,
+                         top_diagnoses=top_terms('diagnosis', options['start'], options['end']),
+                         top_prescriptions=top_terms('prescription', options['start'], options['end']))
+
+@bp.route('/exports', methods=['GET', 'POST'])
+@role_required('admin')
+def exports():
+    if request.method == 'POST':
+        resource = request.form.get('resource')
+        fmt = request.form.get('format', 'csv')
+        start = request.form.get('start_date')
+        end = request.form.get('end_date')
+        status = request.form.get('status') or None
+        
+        if resource not in EXPORTS or fmt not in EXPORT_FORMATS:
+            flash('Invalid export request', 'error')
+            return redirect(url_for('admin.exports'))
+        
+        try:
+            start_date = datetime.strptime(start, '%Y-%m-%d').date() if start else None
+            end_date = datetime.strptime(end, '%Y-%m-%d').date() if end else None
+        except ValueError:
+            flash('Dates must be in YYYY-MM-DD format', 'error')
+            return redirect(url_for('admin.exports'))
+        
+        job = export_jobs.submit(resource, fmt, start_date, end_date, status,
+                                 requested_by=session['username'])
+        
+        # Audit log
+        audit = AuditLog(user_id=session['user_id'], action='CREATE',
+                        entity_type='Export', entity_id=None,
+                        details=f'Started {fmt} export of {resource} ({job["id"]})')
+        db.session.add(audit)
+        db.session.commit()
+        
+        flash('Export queued. The export worker will make it available for download here.', 'success')
+        return redirect(url_for('admin.exports'))
+    
+    return render_template('admin/exports.html',
+                         jobs=export_jobs.all(),
+                         resources=list(EXPORTS),
+                         formats=EXPORT_FORMATS)
+
+@bp.route('/exports/<job_id>')
+@role_required('admin')
+def export_status(job_id):
+    job = export_jobs.get(job_id)
+    if not job:
+        abort(404)
+    return jsonify({key: value for key, value in job.items() if key != 'path'})
+
+@bp.route('/exports/<job_id>/download')
+@role_required('admin')
+def download_export(job_id):
+    job = export_jobs.get(job_id)
+    if not job or job['status'] != 'Completed':
+        abort(404)
+    return send_file(job['path'], as_attachment=True, download_name=job['filename'])
+
+@bp.route('/facilities')
+@role_required('admin')
+def facilities():
+    # Aggregated across every facility's shard
+    days = min(max(request.args.get('days', 30, type=int), 1), 365)
+    rows, totals = facilities_report(datetime.utcnow().date(), days)
+    return render_template('admin/facilities.html', rows=rows, totals=totals, days=days)
+
+@bp.route('/instrumentation')
+@role_required('admin')
+def instrumentation():
+    return render_template('admin/instrumentation.html',
+                         fragments=fragment_cache.metrics(),
+                         max_entries=fragment_cache.max_entries,
+                         ttl=fragment_cache.ttl,
+                         views=view_cache.metrics(),
+                         view_cache=view_cache)
+
+@bp.route('/instrumentation/view-cache/clear', methods=['POST'])
+@role_required('admin')
+def clear_view_cache():
+    dropped = view_cache.invalidate()
+    
+    audit = AuditLog(user_id=session['user_id'], action='UPDATE',
+                    entity_type='ViewCache', entity_id=None,
+                    details=f'Cleared view data cache ({dropped} entries)')
+    db.session.add(audit)
+    db.session.commit()
+    
+    flash(f'Dropped {dropped} cached views', 'success')
+    return redirect(url_for('admin.instrumentation'))
@@ -1,59 +1,181 @@
-from flask import Blueprint, jsonify
-from models import Doctor, Patient, Appointment, User
-from sqlalchemy import func
+from flask import Blueprint, jsonify, request, session
+from models import db, Patient
+from utils.auth import role_required
+from utils.billing_analytics import billing_summary
+from utils.changes import DEFAULT_BATCH_SIZE, MAX_BATCH_SIZE, TRACKED_TABLES, CursorExpired, get_changes
+from utils import clinical_index
+from utils.facility_reports import combined_trend
+from utils.serializers import RESOURCES, json_response
+from utils.timeline import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, get_timeline_page, serialize_entry
+from utils.trends import appointment_trend, parse_trend_args, serialize_point, trend_summary
+from datetime import datetime
 
 bp = Blueprint('api', __name__)
 
+def _resource_response(name):
+    resource = RESOURCES[name]
+    rows = db.session.execute(resource.query).all()
+    return json_response(resource.encoder.encode(rows))
+
 @bp.route('/doctors')
 def get_doctors():
-    doctors = Doctor.query.all()
-    result = []
-    for doctor in doctors:
-        result.append({
-            'id': doctor.id,
-            'username': doctor.user.username,
-            'email': doctor.user.email,
-            'phone': doctor.user.phone,
-            'specialization': doctor.specialization,
-            'rating': doctor.rating
-        })
-    return jsonify(result)
+    return _resource_response('doctors')
 
 @bp.route('/patients')
 def get_patients():
-    patients = Patient.query.all()
-    result = []
-    for patient in patients:
-        result.append({
-            'id': patient.id,
-            'username': patient.user.username,
-            'email': patient.user.email,
-            'phone': patient.user.phone,
-            'medical_id': patient.medical_id
-        })
-    return jsonify(result)
+    return _resource_response('patients')
 
 @bp.route('/appointments')
 def get_appointments():
-    appointments = Appointment.query.all()
-    result = []
-    for appointment in appointments:
-        result.append({
-            'id': appointment.id,
-            'doctor': appointment.doctor.user.username,
-            'patient': appointment.patient.user.username,
-            'date': appointment.appointment_date.isoformat(),
-            'time': appointment.appointment_time.isoformat(),
-            'status': appointment.status
-        })
-    return jsonify(result)
+    return _resource_response('appointments')
 
 @bp.route('/specializations')
 def get_specializations():
-    specializations = Doctor.query.with_entities(
-        Doctor.specialization,
-        func.count(Doctor.id).label('count')
-    ).group_by(Doctor.specialization).all()
+    return _resource_response('specializations')
+
+@bp.route('/billing/analytics')
+@role_required('admin')
+def get_billing_analytics():
+    start = request.args.get('start')
+    end = request.args.get('end')
+    doctor_id = request.args.get('doctor_id', type=int)
+    
+    try:
+        start_date = datetime.strptime(start, '%Y-%m-%d').date() if start else None
+        end_date = datetime.strptime(end, '%Y-%m-%d').date() if end else None
+    except ValueError:
+        return jsonify({'error': 'Dates must be in YYYY-MM-DD format'}), 400
+    
+    return jsonify(billing_summary(start_date, end_date, doctor_id))
+
+@bp.route('/trends/appointments')
+@role_required('admin')
+def get_appointment_trends():
+    try:
+        options = parse_trend_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    series = appointment_trend(**options)
+    return jsonify({
+        'bucket': options['bucket'],
+        'start': options['start'].isoformat(),
+        'end': options['end'].isoformat(),
+        'filters': {field: options[field] for field in ('doctor_id', 'specialization', 'status')},
+        'totals': trend_summary(series),
+        'series': [serialize_point(point) for point in series]
+    })
+
+@bp.route('/facilities/trends/appointments')
+@role_required('admin')
+def get_facility_trends():
+    try:
+        options = parse_trend_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if options.pop('doctor_id'):
+        return jsonify({'error': 'doctor_id is specific to one facility'}), 400
+    
+    series, facilities = combined_trend(**options)
+    return jsonify({
+        'bucket': options['bucket'],
+        'start': options['start'].isoformat(),
+        'end': options['end'].isoformat(),
+        'filters': {field: options[field] for field in ('specialization', 'status')},
+        'totals': trend_summary(series),
+        'facilities': facilities,
+        'series': [serialize_point(point) for point in series]
+    })
+
+@bp.route('/patients/<int:patient_id>/timeline')
+def get_patient_timeline(patient_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Authentication required'}), 401
+    
+    patient = Patient.query.get_or_404(patient_id)
+    
+    # Patients may only read their own timeline; doctors and admins any
+    role = session.get('role')
+    if role not in ('doctor', 'admin') and patient.user_id != session['user_id']:
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    limit = min(max(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    entries, next_cursor = get_timeline_page(patient.id, cursor=request.args.get('cursor'), limit=limit)
+    return jsonify({
+        'patient_id': patient.id,
+        'entries': [serialize_entry(entry) for entry in entries],
+        'next_cursor': next_cursor
+    })
+
+@bp.route('/clinical/search')
+def search_clinical():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Authentication required'}), 401
+    if session.get('role') not in ('doctor', 'admin'):
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    limit = min(max(request.args.get('limit', clinical_index.DEFAULT_PAGE_SIZE, type=int), 1),
+                clinical_index.MAX_PAGE_SIZE)
+    try:
+        options = clinical_index.parse_clinical_args(request.args)
+        summary, results, next_cursor = clinical_index.search_treatments(
+            doctor_id=request.args.get('doctor_id', type=int), cursor=request.args.get('cursor'), limit=limit,
+            **options
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'query': options['text'],
+        'field': options['field'],
+        'start': options['start'].isoformat(),
+        'end': options['end'].isoformat(),
+        'summary': summary,
+        'results': [dict(row, appointment_date=row['appointment_date'].isoformat()) for row in results],
+        'next_cursor': next_cursor
+    })
+
+@bp.route('/clinical/trends')
+def get_clinical_trends():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Authentication required'}), 401
+    if session.get('role') not in ('doctor', 'admin'):
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    doctor_id = request.args.get('doctor_id', type=int)
+    try:
+        options = clinical_index.parse_clinical_args(request.args)
+        series = clinical_index.clinical_trend(doctor_id=doctor_id, **options)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'query': options['text'],
+        'field': options['field'],
+        'start': options['start'].isoformat(),
+        'end': options['end'].isoformat(),
+        'series': series,
+        'top_terms': {field: clinical_index.top_terms(field, options['start'], options['end'], doctor_id)
+                      for field in clinical_index.FIELDS}
+    })
+
+@bp.route('/changes')
+@role_required('admin')
+def get_change_events():
+    after = request.args.get('cursor', '0')
+    if not after.isdigit():
+        return jsonify({'error': 'cursor must be a sequence number'}), 400
+    
+    entities = [entity for entity in request.args.get('entity', '').split(',') if entity]
+    unknown = [entity for entity in entities if entity not in TRACKED_TABLES]
+    if unknown:
+        return jsonify({'error': f'entity must be one of {", ".join(TRACKED_TABLES)}'}), 400
     
-    result = [{'specialization': s[0], 'count': s[1]} for s in specializations]
-    return jsonify(result)
+    limit = min(max(request.args.get('limit', DEFAULT_BATCH_SIZE, type=int), 1), MAX_BATCH_SIZE)
+    try:
+        changes, next_cursor, has_more = get_changes(int(after), limit, entities)
+    except CursorExpired as e:
+        return jsonify({'error': str(e)}), 410
+    return jsonify({
+        'changes': changes,
+        'next_cursor': str(next_cursor),
+        'has_more': has_more
+    })
@@ -1,8 +1,18 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
-from models import db, Doctor, Appointment, Availability, Treatment, User, Patient, AuditLog
+from models import db, Doctor, Appointment, Availability, AvailabilityRule, Treatment, User, Patient, AuditLog, Bill
 from utils.auth import role_required
+from utils import signals
+from utils.availability import WEEKDAY_NAMES, describe_rule, rule_conflicts, weekday_mask
+from utils.billing import CHARGE_FIELDS, compute_bill
+from utils.bulk_appointments import bulk_update_appointments, parse_bulk_form
+from utils.clinical_index import clinical_trend, index_treatments, parse_clinical_args, search_treatments, top_terms
+from utils.doctor_stats import doctor_trend, rollup_days, trend_totals
+from utils.fragment_cache import versions
 from utils.notifications import create_notification
+from utils.timeline import get_timeline_page
+from utils.view_cache import cached_view
 from datetime import datetime, date, time, timedelta
+from decimal import InvalidOperation
 
 bp = Blueprint('doctor', __name__)
 
@@ -11,20 +21,28 @@ bp = Blueprint('doctor', __name__)
 def dashboard():
     doctor = Doctor.query.filter_by(user_id=session['user_id']).first()
     
-    # Get today's appointments
+    # Today's and upcoming appointments; the queries only run when the
+    # cached schedule fragment is stale
     today = date.today()
     today_appointments = Appointment.query.filter_by(
         doctor_id=doctor.id,
         appointment_date=today
-    ).filter(Appointment.status != 'Cancelled').all()
+    ).filter(Appointment.status != 'Cancelled')
     
-    # Get upcoming appointments
     upcoming = Appointment.query.filter(
         Appointment.doctor_id == doctor.id,
         Appointment.appointment_date > today
-    ).filter(Appointment.status != 'Cancelled').order_by(Appointment.appointment_date).limit(5).all()
+    ).filter(Appointment.status != 'Cancelled').order_by(Appointment.appointment_date).limit(5)
+    
+    # Workload for the last 30 days from the daily rollups, cached until they change
+    doctor_id = doctor.id
+    trend = cached_view('doctor.dashboard', lambda: doctor_trend(doctor_id, today - timedelta(days=29), today),
+                        today, versions.get('doctor_stats', doctor_id))
     
     return render_template('doctor/dashboard.html', 
+                         today=today,
+                         trend=trend[-7:],
+                         totals=trend_totals(trend),
                          today_appointments=today_appointments,
                          upcoming_appointments=upcoming,
                          doctor=doctor)
@@ -74,6 +92,7 @@ def availability():
             db.session.add(audit)
         
         db.session.commit()
+        signals.availability_changed.send(doctor_ids=[doctor.id], doctor_days=[(doctor.id, avail_date)])
         return redirect(url_for('doctor.availability'))
     
     # Get blocked slots
@@ -84,10 +103,100 @@ def availability():
         Availability.is_available == False
     ).order_by(Availability.date, Availability.start_time).all()
     
+    # Recurring and range rules that still apply
+    rules = AvailabilityRule.query.filter(
+        AvailabilityRule.doctor_id == doctor.id,
+        (AvailabilityRule.end_date == None) | (AvailabilityRule.end_date >= today)
+    ).order_by(AvailabilityRule.start_date).all()
+    
     return render_template('doctor/availability.html', 
                          blocked_slots=blocked_slots,
+                         rules=[(rule, describe_rule(rule)) for rule in rules],
+                         weekday_names=WEEKDAY_NAMES,
+                         today=today,
                          doctor=doctor)
 
+@bp.route('/availability/rules', methods=['POST'])
+@role_required('doctor')
+def add_availability_rule():
+    doctor = Doctor.query.filter_by(user_id=session['user_id']).first()
+    
+    try:
+        start_date = datetime.strptime(request.form.get('start_date', ''), '%Y-%m-%d').date()
+        end_date_str = request.form.get('end_date')
+        end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date() if end_date_str else None
+        if request.form.get('all_day'):
+            start_time = end_time = None
+        else:
+            start_time = datetime.strptime(request.form.get('start_time', ''), '%H:%M').time()
+            end_time = datetime.strptime(request.form.get('end_time', ''), '%H:%M').time()
+    except ValueError:
+        flash('Please enter valid dates and times', 'error')
+        return redirect(url_for('doctor.availability'))
+    
+    if end_date and end_date < start_date:
+        flash('End date must be on or after the start date', 'error')
+        return redirect(url_for('doctor.availability'))
+    if start_time and start_time >= end_time:
+        flash('End time must be after the start time', 'error')
+        return redirect(url_for('doctor.availability'))
+    
+    weekdays = [int(day) for day in request.form.getlist('weekdays') if day.isdigit() and int(day) < 7]
+    rule = AvailabilityRule(
+        doctor_id=doctor.id,
+        start_date=start_date,
+        end_date=end_date,
+        weekdays=weekday_mask(weekdays),
+        start_time=start_time,
+        end_time=end_time,
+        reason=request.form.get('reason') or None
+    )
+    db.session.add(rule)
+    
+    # Audit log
+    audit = AuditLog(user_id=session['user_id'], action='CREATE',
+                    entity_type='AvailabilityRule', entity_id=doctor.id,
+                    details=f'Blocked {describe_rule(rule)}')
+    db.session.add(audit)
+    
+    db.session.commit()
+    signals.availability_changed.send(doctor_ids=[doctor.id],
+                                      doctor_days=rollup_days(doctor.id, start_date, end_date))
+    flash(f'Blocked {describe_rule(rule)}', 'success')
+    
+    # Existing appointments are kept; tell the doctor which ones now overlap
+    conflicts = rule_conflicts(rule)
+    if conflicts:
+        flash(f'{len(conflicts)} booked appointment{"s" if len(conflicts) != 1 else ""} fall in this period, '
+              f'starting {conflicts[0].appointment_date} at {conflicts[0].appointment_time.strftime("%H:%M")}. '
+              'Cancel them from the Appointments page if needed.', 'warning')
+    return redirect(url_for('doctor.availability'))
+
+@bp.route('/availability/rules/<int:rule_id>/delete', methods=['POST'])
+@role_required('doctor')
+def delete_availability_rule(rule_id):
+    rule = AvailabilityRule.query.get_or_404(rule_id)
+    doctor = Doctor.query.filter_by(user_id=session['user_id']).first()
+    
+    if rule.doctor_id != doctor.id:
+        flash('Unauthorized action', 'error')
+        return redirect(url_for('doctor.availability'))
+    
+    description = describe_rule(rule)
+    db.session.delete(rule)
+    
+    # Audit log
+    audit = AuditLog(user_id=session['user_id'], action='DELETE',
+                    entity_type='AvailabilityRule', entity_id=doctor.id,
+                    details=f'Removed block: {description}')
+    db.session.add(audit)
+    
+    db.session.commit()
+    signals.availability_changed.send(doctor_ids=[doctor.id],
+                                      doctor_days=rollup_days(doctor.id, rule.start_date, rule.end_date))
+    flash('Availability rule removed', 'success')
+    return redirect(url_for('doctor.availability'))
+
 @bp.route('/availability/<int:availability_id>/unblock', methods=['POST'])
 @role_required('doctor')
 def unblock_availability(availability_id):
@@ -101,6 +210,7 @@ def unblock_availability(availability_id):
     # Remove the block (delete the availability record)
     db.session.delete(availability)
     db.session.commit()
+    signals.availability_changed.send(doctor_ids=[doctor.id], doctor_days=[(doctor.id, availability.date)])
     flash('Time slot unblocked successfully', 'success')
     return redirect(url_for('doctor.availability'))
 
@@ -142,6 +252,9 @@ def complete_appointment(appointment_id):
     db.session.add(audit)
     
     db.session.commit()
+    signals.appointment_changed.send(doctor_ids=[doctor.id], patient_ids=[appointment.patient_id],
+                                     appointment_ids=[appointment.id],
+                                     doctor_days=[(doctor.id, appointment.appointment_date)])
     flash('Appointment marked as completed', 'success')
     return redirect(url_for('doctor.add_treatment', appointment_id=appointment_id))
 
@@ -172,9 +285,27 @@ def cancel_appointment(appointment_id):
     db.session.add(audit)
     
     db.session.commit()
+    signals.appointment_changed.send(doctor_ids=[doctor.id], patient_ids=[appointment.patient_id],
+                                     appointment_ids=[appointment.id],
+                                     doctor_days=[(doctor.id, appointment.appointment_date)])
     flash('Appointment cancelled successfully', 'success')
     return redirect(url_for('doctor.appointments'))
 
+@bp.route('/appointments/bulk', methods=['POST'])
+@role_required('doctor')
+def bulk_appointments():
+    doctor = Doctor.query.filter_by(user_id=session['user_id']).first()
+    
+    try:
+        options = parse_bulk_form(request.form)
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('doctor.appointments'))
+    
+    results = bulk_update_appointments(session['user_id'], doctor_id=doctor.id, **options)
+    return render_template('shared/bulk_results.html', action=options['action'], results=results,
+                         back_url=url_for('doctor.appointments'))
+
 @bp.route('/appointments/<int:appointment_id>/treatment', methods=['GET', 'POST'])
 @role_required('doctor')
 def add_treatment(appointment_id):
@@ -194,11 +325,12 @@ def add_treatment(appointment_id):
         prescription = request.form.get('prescription')
         notes = request.form.get('notes')
         
-        if appointment.treatment:
+        treatment = appointment.treatment
+        if treatment:
             # Update existing treatment
-            appointment.treatment.diagnosis = diagnosis
-            appointment.treatment.prescription = prescription
-            appointment.treatment.notes = notes
+            treatment.diagnosis = diagnosis
+            treatment.prescription = prescription
+            treatment.notes = notes
         else:
             # Create new treatment
             treatment = Treatment(
@@ -209,6 +341,10 @@ def add_treatment(appointment_id):
             )
             db.session.add(treatment)
         
+        # Re-index its diagnosis and prescription terms in the same transaction
+        db.session.flush()
+        index_treatments([treatment.id])
+        
         # Create notification
         create_notification(appointment.patient.user_id,
                            f'Treatment record added for your appointment on {appointment.appointment_date}')
@@ -220,6 +356,8 @@ def add_treatment(appointment_id):
         db.session.add(audit)
         
         db.session.commit()
+        signals.appointment_changed.send(doctor_ids=[appointment.doctor_id], patient_ids=[appointment.patient_id],
+                                         appointment_ids=[appointment.id])
         flash('Treatment record saved successfully', 'success')
         return redirect(url_for('doctor.appointments'))
     
@@ -230,15 +368,15 @@ def add_treatment(appointment_id):
 def patient_history(patient_id):
     patient = Patient.query.get_or_404(patient_id)
     
-    # Get all completed appointments with treatments
-    appointments = Appointment.query.filter_by(
-        patient_id=patient.id,
-        status='Completed'
-    ).order_by(Appointment.appointment_date.desc()).all()
+    # One page of completed visits from the denormalized timeline
+    cursor = request.args.get('cursor')
+    entries, next_cursor = get_timeline_page(patient.id, cursor=cursor)
     
     return render_template('doctor/patient_history.html', 
                          patient=patient,
-                         appointments=appointments)
+                         entries=entries,
+                         next_cursor=next_cursor,
+                         cursor=cursor)
 
 @bp.route('/patients')
 @role_required('doctor')
@@ -252,11 +390,42 @@ def patients_list():
     
     return render_template('doctor/patients_list.html', patients=patients)
 
+@bp.route('/clinical-search')
+@role_required('doctor')
+def clinical_search():
+    doctor = Doctor.query.filter_by(user_id=session['user_id']).first()
+    mine = request.args.get('mine') == '1'
+    doctor_id = doctor.id if mine else None
+    
+    try:
+        options = parse_clinical_args(request.args)
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('doctor.clinical_search'))
+    
+    summary, results, next_cursor, trend = None, [], None, []
+    if options['text']:
+        try:
+            summary, results, next_cursor = search_treatments(doctor_id=doctor_id, cursor=request.args.get('cursor'),
+                                                              **options)
+            trend = clinical_trend(doctor_id=doctor_id, **options)
+        except ValueError as e:
+            flash(str(e), 'error')
+    
+    return render_template('shared/clinical_search.html',
+                         endpoint='doctor.clinical_search',
+                         options=options,
+                         mine=mine,
+                         summary=summary,
+                         results=results,
+                         next_cursor=next_cursor,
+                         trend=trend,
+                         top_diagnoses=top_terms('diagnosis', options['start'], options['end'], doctor_id),
+                         top_prescriptions=top_terms('prescription', options['start'], options['end'], doctor_id))
+
 @bp.route('/appointments/<int:appointment_id>/billing', methods=['GET', 'POST'])
 @role_required('doctor')
 def create_bill(appointment_id):
-    from models import Bill
-    
     appointment = Appointment.query.get_or_404(appointment_id)
     doctor = Doctor.query.filter_by(user_id=session['user_id']).first()
     
@@ -269,50 +438,34 @@ def create_bill(appointment_id):
         return redirect(url_for('doctor.appointments'))
     
     if request.method == 'POST':
-        consultation_fee = float(request.form.get('consultation_fee', 0))
-        lab_charges = float(request.form.get('lab_charges', 0))
-        medicine_charges = float(request.form.get('medicine_charges', 0))
-        procedure_charges = float(request.form.get('procedure_charges', 0))
-        other_charges = float(request.form.get('other_charges', 0))
-        discount_amount = float(request.form.get('discount_amount', 0))
+        charges = {field: request.form.get(field, 0) for field in CHARGE_FIELDS}
         notes = request.form.get('notes', '')
         
-        # Calculate totals
-        subtotal = consultation_fee + lab_charges + medicine_charges + procedure_charges + other_charges
-        tax_amount = subtotal * 0.05  # 5% tax
-        total_amount = subtotal + tax_amount - discount_amount
+        # Calculate totals in exact cents
+        try:
+            values = compute_bill(charges, discount=request.form.get('discount_amount', 0))
+        except InvalidOperation:
+            flash('Charges must be valid amounts, and the discount cannot exceed the bill', 'error')
+            return redirect(url_for('doctor.create_bill', appointment_id=appointment.id))
+        total_amount = values['total_amount']
         
         # Check if bill already exists
         existing_bill = Bill.query.filter_by(appointment_id=appointment.id).first()
         
         if existing_bill:
             # Update existing bill
-            existing_bill.consultation_fee = consultation_fee
-            existing_bill.lab_charges = lab_charges
-            existing_bill.medicine_charges = medicine_charges
-            existing_bill.procedure_charges = procedure_charges
-            existing_bill.other_charges = other_charges
-            existing_bill.subtotal = subtotal
-            existing_bill.tax_amount = tax_amount
-            existing_bill.discount_amount = discount_amount
-            existing_bill.total_amount = total_amount
-            existing_bill.notes = notes
+            bill = existing_bill
+            for field, value in values.items():
+                setattr(bill, field, value)
+            bill.notes = notes
         else:
             # Create new bill
             bill = Bill(
                 appointment_id=appointment.id,
                 patient_id=appointment.patient_id,
                 doctor_id=doctor.id,
-                consultation_fee=consultation_fee,
-                lab_charges=lab_charges,
-                medicine_charges=medicine_charges,
-                procedure_charges=procedure_charges,
-                other_charges=other_charges,
-                subtotal=subtotal,
-                tax_amount=tax_amount,
-                discount_amount=discount_amount,
-                total_amount=total_amount,
-                notes=notes
+                notes=notes,
+                **values
             )
             db.session.add(bill)
         
@@ -327,6 +480,12 @@ def create_bill(appointment_id):
         db.session.add(audit)
         
         db.session.commit()
+        # A paid bill's new total changes revenue on the day it was paid
+        doctor_days = []
+        if bill.payment_status == 'Paid' and bill.payment_date:
+            doctor_days.append((bill.doctor_id, bill.payment_date.date()))
+        signals.bill_changed.send(patient_ids=[appointment.patient_id], appointment_ids=[appointment.id],
+                                  doctor_days=doctor_days)
         flash('Bill created successfully', 'success')
         return redirect(url_for('doctor.appointments'))
     
@@ -1,8 +1,16 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
-from models import db, Patient, Doctor, Appointment, Availability, Rating, User, AuditLog
+from models import db, Patient, Doctor, Appointment, Rating, User, AuditLog, Bill, WaitlistEntry
 from utils.auth import role_required
+from utils import signals
+from utils.availability import (DEFAULT_DURATION_MINUTES, DURATION_CHOICES, available_slots, is_blocked,
+                                slot_end, within_working_hours)
+from utils.billing_analytics import patient_bill_totals
+from utils.fragment_cache import versions
 from utils.notifications import create_notification
+from utils.timeline import get_timeline_page
 from utils.validators import check_double_booking, validate_rating
+from utils.view_cache import cached_view
+from utils.waitlist import HOLD_MINUTES, MAX_WAITLIST_DAYS, match_waitlist, release_holds
 from datetime import datetime, date, timedelta
 
 bp = Blueprint('patient', __name__)
@@ -12,21 +20,39 @@ bp = Blueprint('patient', __name__)
 def dashboard():
     patient = Patient.query.filter_by(user_id=session['user_id']).first()
     
-    # Get upcoming appointments
+    # Upcoming and recent appointments, cached until the patient's schedule changes
     today = date.today()
-    upcoming = Appointment.query.filter(
-        Appointment.patient_id == patient.id,
-        Appointment.appointment_date >= today
-    ).filter(Appointment.status != 'Cancelled').order_by(Appointment.appointment_date).all()
-    
-    # Get recent appointments
-    recent = Appointment.query.filter_by(patient_id=patient.id).order_by(
-        Appointment.appointment_date.desc()
-    ).limit(5).all()
+    patient_id = patient.id
+    appointments = cached_view('patient.dashboard', lambda: dashboard_appointments(patient_id, today),
+                               today, versions.get('patient_schedule', patient_id))
     
     return render_template('patient/dashboard.html',
-                         upcoming_appointments=upcoming,
-                         recent_appointments=recent)
+                         upcoming_appointments=appointments['upcoming'],
+                         recent_appointments=appointments['recent'])
+
+def dashboard_appointments(patient_id, today):
+    """Upcoming and recent appointments of a patient as plain dicts, for caching"""
+    query = db.session.query(
+        Appointment.appointment_date,
+        Appointment.appointment_time,
+        Appointment.status,
+        User.username.label('doctor_name'),
+        Doctor.specialization
+    ).join(Doctor, Appointment.doctor_id == Doctor.id).join(User, Doctor.user_id == User.id).filter(
+        Appointment.patient_id == patient_id
+    )
+    
+    upcoming = query.filter(
+        Appointment.appointment_date >= today,
+        Appointment.status != 'Cancelled'
+    ).order_by(Appointment.appointment_date)
+    
+    recent = query.order_by(Appointment.appointment_date.desc()).limit(5)
+    
+    return {
+        'upcoming': [row._asdict() for row in upcoming],
+        'recent': [row._asdict() for row in recent]
+    }
 
 @bp.route('/search-doctors')
 @role_required('patient')
@@ -56,74 +82,30 @@ def doctor_profile(doctor_id):
     today = date.today()
     seven_days = today + timedelta(days=7)
     
-    # Generate default time slots
-    available_slots = get_default_time_slots(doctor.id, today, seven_days)
+    # Slots of the chosen length minus blocks, availability rules and bookings
+    duration = request.args.get('duration', DEFAULT_DURATION_MINUTES, type=int)
+    if duration not in DURATION_CHOICES:
+        duration = DEFAULT_DURATION_MINUTES
+    slots = available_slots(doctor.id, today, seven_days, duration)
     
     # Get smart suggestions (next 3 optimal slots)
-    suggestions = get_smart_suggestions(available_slots)
+    suggestions = get_smart_suggestions(slots)
     
-    # Get recent ratings
+    # Recent ratings; the query only runs when the cached reviews fragment is stale
     recent_ratings = Rating.query.filter_by(doctor_id=doctor.id).order_by(
         Rating.created_at.desc()
-    ).limit(5).all()
+    ).limit(5)
     
     return render_template('patient/doctor_profile.html',
                          doctor=doctor,
-                         available_slots=available_slots,
+                         available_slots=slots,
+                         duration=duration,
+                         duration_choices=DURATION_CHOICES,
+                         hold_minutes=HOLD_MINUTES,
+                         today=today,
                          suggestions=suggestions,
                          recent_ratings=recent_ratings)
 
-def get_default_time_slots(doctor_id, start_date, end_date):
-    """Generate default 24/7 time slots for a doctor"""
-    from datetime import time as dt_time
-    
-    slots = []
-    current_date = start_date
-    
-    # Time slots: 9 AM to 5 PM in 1-hour intervals (8 slots per day)
-    time_slots = [
-        (dt_time(9, 0), dt_time(10, 0)),
-        (dt_time(10, 0), dt_time(11, 0)),
-        (dt_time(11, 0), dt_time(12, 0)),
-        (dt_time(12, 0), dt_time(13, 0)),
-        (dt_time(14, 0), dt_time(15, 0)),
-        (dt_time(15, 0), dt_time(16, 0)),
-        (dt_time(16, 0), dt_time(17, 0)),
-        (dt_time(17, 0), dt_time(18, 0)),
-    ]
-    
-    while current_date <= end_date:
-        for start_time, end_time in time_slots:
-            # Check if doctor has blocked this slot
-            blocked = Availability.query.filter_by(
-                doctor_id=doctor_id,
-                date=current_date,
-                start_time=start_time,
-                is_available=False
-            ).first()
-            
-            if not blocked:
-                # Check if slot is already booked
-                is_booked = Appointment.query.filter_by(
-                    doctor_id=doctor_id,
-                    appointment_date=current_date,
-                    appointment_time=start_time
-                ).filter(Appointment.status.in_(['Booked', 'Completed'])).first()
-                
-                if not is_booked:
-                    # Create a virtual slot object
-                    class VirtualSlot:
-                        def __init__(self, date, start_time, end_time):
-                            self.date = date
-                            self.start_time = start_time
-                            self.end_time = end_time
-                    
-                    slots.append(VirtualSlot(current_date, start_time, end_time))
-        
-        current_date += timedelta(days=1)
-    
-    return slots
-
 def get_smart_suggestions(available_slots):
     """Get smart appointment suggestions"""
     if not available_slots:
@@ -154,9 +136,20 @@ def book_appointment():
     
     appointment_date = datetime.strptime(date_str, '%Y-%m-%d').date()
     appointment_time = datetime.strptime(time_str, '%H:%M').time()
+    duration = request.form.get('duration', DEFAULT_DURATION_MINUTES, type=int)
+    end_time = slot_end(appointment_time, duration)
+    
+    if duration not in DURATION_CHOICES or not within_working_hours(appointment_time, end_time):
+        flash("Please choose a slot within the doctor's working hours", 'error')
+        return redirect(url_for('patient.doctor_profile', doctor_id=doctor_id))
+    
+    # Check blocked time (single slots and availability rules)
+    if is_blocked(int(doctor_id), appointment_date, appointment_time, end_time):
+        flash('The doctor is unavailable at this time', 'error')
+        return redirect(url_for('patient.doctor_profile', doctor_id=doctor_id))
     
     # Check for double booking
-    if check_double_booking(doctor_id, appointment_date, appointment_time):
+    if check_double_booking(doctor_id, appointment_date, appointment_time, duration):
         flash('This time slot is no longer available', 'error')
         return redirect(url_for('patient.doctor_profile', doctor_id=doctor_id))
     
@@ -166,6 +159,7 @@ def book_appointment():
         patient_id=patient.id,
         appointment_date=appointment_date,
         appointment_time=appointment_time,
+        duration_minutes=duration,
         status='Booked'
     )
     db.session.add(appointment)
@@ -184,6 +178,9 @@ def book_appointment():
     db.session.add(audit)
     
     db.session.commit()
+    signals.appointment_changed.send(doctor_ids=[doctor.id], patient_ids=[patient.id],
+                                     appointment_ids=[appointment.id],
+                                     doctor_days=[(doctor.id, appointment_date)])
     flash('Appointment booked successfully', 'success')
     return redirect(url_for('patient.appointments'))
 
@@ -225,9 +222,128 @@ def cancel_appointment(appointment_id):
     db.session.add(audit)
     
     db.session.commit()
+    signals.appointment_changed.send(doctor_ids=[appointment.doctor_id], patient_ids=[patient.id],
+                                     appointment_ids=[appointment.id],
+                                     doctor_days=[(appointment.doctor_id, appointment.appointment_date)])
     flash('Appointment cancelled successfully', 'success')
     return redirect(url_for('patient.appointments'))
 
+@bp.route('/waitlist')
+@role_required('patient')
+def waitlist():
+    patient = Patient.query.filter_by(user_id=session['user_id']).first()
+    entries = WaitlistEntry.query.filter_by(patient_id=patient.id).order_by(WaitlistEntry.created_at.desc()).all()
+    
+    return render_template('patient/waitlist.html', entries=entries, now=datetime.now())
+
+@bp.route('/waitlist', methods=['POST'])
+@role_required('patient')
+def join_waitlist():
+    patient = Patient.query.filter_by(user_id=session['user_id']).first()
+    doctor = Doctor.query.get_or_404(request.form.get('doctor_id', type=int))
+    
+    try:
+        start_date = datetime.strptime(request.form.get('start_date', ''), '%Y-%m-%d').date()
+        end_date = datetime.strptime(request.form.get('end_date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        flash('Please enter valid dates', 'error')
+        return redirect(url_for('patient.doctor_profile', doctor_id=doctor.id))
+    
+    duration = request.form.get('duration', DEFAULT_DURATION_MINUTES, type=int)
+    if duration not in DURATION_CHOICES:
+        duration = DEFAULT_DURATION_MINUTES
+    
+    if start_date < date.today() or end_date < start_date or (end_date - start_date).days > MAX_WAITLIST_DAYS:
+        flash(f'Choose a date range from today of at most {MAX_WAITLIST_DAYS} days', 'error')
+        return redirect(url_for('patient.doctor_profile', doctor_id=doctor.id))
+    
+    entry = WaitlistEntry(patient_id=patient.id, doctor_id=doctor.id, start_date=start_date, end_date=end_date,
+                          duration_minutes=duration, auto_confirm=bool(request.form.get('auto_confirm')))
+    db.session.add(entry)
+    db.session.flush()
+    
+    # Audit log
+    audit = AuditLog(user_id=session['user_id'], action='CREATE',
+                    entity_type='WaitlistEntry', entity_id=entry.id,
+                    details=f'Joined waitlist for doctor {doctor.id} from {start_date} to {end_date}')
+    db.session.add(audit)
+    
+    db.session.commit()
+    
+    # A slot that is already open is offered right away
+    days = [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+    if match_waitlist([(doctor.id, day) for day in days]):
+        flash('A matching slot is open and has been reserved for you', 'success')
+    else:
+        flash('You are on the waitlist. We will notify you when a slot opens up', 'success')
+    return redirect(url_for('patient.waitlist'))
+
+@bp.route('/waitlist/<int:entry_id>/confirm', methods=['POST'])
+@role_required('patient')
+def confirm_waitlist(entry_id):
+    patient = Patient.query.filter_by(user_id=session['user_id']).first()
+    entry = WaitlistEntry.query.get_or_404(entry_id)
+    
+    if entry.patient_id != patient.id:
+        flash('Unauthorized action', 'error')
+        return redirect(url_for('patient.waitlist'))
+    
+    if entry.status != 'Held' or entry.appointment.status != 'Booked':
+        flash('This slot is no longer held for you', 'error')
+        return redirect(url_for('patient.waitlist'))
+    
+    if entry.hold_expires_at <= datetime.now():
+        release_holds([entry], 'Expired')
+        flash('Sorry, the hold on this slot has expired', 'error')
+        return redirect(url_for('patient.waitlist'))
+    
+    entry.status = 'Booked'
+    entry.hold_expires_at = None
+    
+    # Create notification
+    create_notification(entry.doctor.user_id,
+                       f'New appointment booked by {patient.user.username} on {entry.appointment.appointment_date}')
+    
+    # Audit log
+    audit = AuditLog(user_id=session['user_id'], action='UPDATE',
+                    entity_type='Appointment', entity_id=entry.appointment_id,
+                    details=f'Confirmed waitlist slot from entry {entry.id}')
+    db.session.add(audit)
+    
+    db.session.commit()
+    flash('Appointment booked successfully', 'success')
+    return redirect(url_for('patient.appointments'))
+
+@bp.route('/waitlist/<int:entry_id>/cancel', methods=['POST'])
+@role_required('patient')
+def leave_waitlist(entry_id):
+    patient = Patient.query.filter_by(user_id=session['user_id']).first()
+    entry = WaitlistEntry.query.get_or_404(entry_id)
+    
+    if entry.patient_id != patient.id:
+        flash('Unauthorized action', 'error')
+        return redirect(url_for('patient.waitlist'))
+    
+    if entry.status == 'Held':
+        # Declining a hold frees the slot for the next patient in line
+        release_holds([entry], 'Cancelled')
+    elif entry.status == 'Waiting':
+        entry.status = 'Cancelled'
+        db.session.commit()
+    else:
+        flash('This waitlist entry is already closed', 'error')
+        return redirect(url_for('patient.waitlist'))
+    
+    # Audit log
+    audit = AuditLog(user_id=session['user_id'], action='UPDATE',
+                    entity_type='WaitlistEntry', entity_id=entry.id,
+                    details=f'Left waitlist for doctor {entry.doctor_id}')
+    db.session.add(audit)
+    db.session.commit()
+    
+    flash('You have left the waitlist', 'success')
+    return redirect(url_for('patient.waitlist'))
+
 @bp.route('/appointments/<int:appointment_id>/rate', methods=['GET', 'POST'])
 @role_required('patient')
 def rate_appointment(appointment_id):
@@ -265,6 +381,9 @@ def rate_appointment(appointment_id):
             )
             db.session.add(rating)
         
+        # Ratings are rolled up by the day they were first given
+        rated_on = appointment.rating.created_at if appointment.rating else datetime.utcnow()
+        
         # Update doctor's average rating
         doctor = appointment.doctor
         avg_rating = db.session.query(db.func.avg(Rating.rating)).filter_by(
@@ -279,6 +398,8 @@ def rate_appointment(appointment_id):
         db.session.add(audit)
         
         db.session.commit()
+        signals.rating_changed.send(doctor_ids=[doctor.id], appointment_ids=[appointment.id],
+                                    doctor_days=[(doctor.id, rated_on.date())])
         flash('Rating submitted successfully', 'success')
         return redirect(url_for('patient.appointments'))
     
@@ -289,38 +410,31 @@ def rate_appointment(appointment_id):
 def medical_history():
     patient = Patient.query.filter_by(user_id=session['user_id']).first()
     
-    # Get all completed appointments with treatments
-    appointments = Appointment.query.filter_by(
-        patient_id=patient.id,
-        status='Completed'
-    ).order_by(Appointment.appointment_date.desc()).all()
+    # One page of completed visits from the denormalized timeline
+    cursor = request.args.get('cursor')
+    entries, next_cursor = get_timeline_page(patient.id, cursor=cursor)
     
-    return render_template('patient/medical_history.html', appointments=appointments)
+    return render_template('patient/medical_history.html',
+                         entries=entries,
+                         next_cursor=next_cursor,
+                         cursor=cursor)
 
 @bp.route('/bills')
 @role_required('patient')
 def bills():
-    from models import Bill
-    
     patient = Patient.query.filter_by(user_id=session['user_id']).first()
     bills = Bill.query.filter_by(patient_id=patient.id).order_by(Bill.created_at.desc()).all()
     
     # Calculate totals
-    total_billed = sum(bill.total_amount for bill in bills)
-    total_paid = sum(bill.total_amount for bill in bills if bill.payment_status == 'Paid')
-    total_pending = sum(bill.total_amount for bill in bills if bill.payment_status == 'Pending')
+    totals = patient_bill_totals(patient.id)
     
     return render_template('patient/bills.html', 
                          bills=bills,
-                         total_billed=total_billed,
-                         total_paid=total_paid,
-                         total_pending=total_pending)
+                         **totals)
 
 @bp.route('/bills/<int:bill_id>')
 @role_required('patient')
 def view_bill(bill_id):
-    from models import Bill
-    
     patient = Patient.query.filter_by(user_id=session['user_id']).first()
     bill = Bill.query.get_or_404(bill_id)
     
@@ -333,8 +447,6 @@ def view_bill(bill_id):
 @bp.route('/bills/<int:bill_id>/pay', methods=['POST'])
 @role_required('patient')
 def pay_bill(bill_id):
-    from models import Bill
-    
     patient = Patient.query.filter_by(user_id=session['user_id']).first()
     bill = Bill.query.get_or_404(bill_id)
     
@@ -365,5 +477,7 @@ def pay_bill(bill_id):
     db.session.add(audit)
     
     db.session.commit()
+    signals.bill_changed.send(patient_ids=[patient.id], appointment_ids=[bill.appointment_id],
+                              doctor_days=[(bill.doctor_id, bill.payment_date.date())])
     flash('Payment successful!', 'success')
     return redirect(url_for('patient.view_bill', bill_id=bill.id))
@@ -1,5 +1,9 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash
+from flask import Blueprint, render_template, request, redirect, url_for, session, flash, Response, current_app
 from models import db, User, Patient
+from utils import signals
+from utils.notifications import get_inbox_page, get_unread_count, mark_read, mark_as_read, stream_key
+from utils.pubsub import hub, format_sse
+from utils.shards import current_facility, facility_context
 from datetime import datetime
 
 bp = Blueprint('shared', __name__)
@@ -16,6 +20,7 @@ def login():
             session['user_id'] = user.id
             session['username'] = user.username
             session['role'] = user.role
+            session['facility'] = current_facility()
             
             if user.role == 'admin':
                 return redirect(url_for('admin.dashboard'))
@@ -84,6 +89,7 @@ def register():
         )
         db.session.add(patient)
         db.session.commit()
+        signals.patient_changed.send(patient_ids=[patient.id])
         
         flash('Registration successful! Please login with your credentials.', 'success')
         return redirect(url_for('shared.login'))
@@ -98,25 +104,81 @@ def logout():
 
 @bp.route('/notifications')
 def notifications():
-    from utils.auth import login_required
-    from models import Notification
+    if 'user_id' not in session:
+        return redirect(url_for('shared.login'))
     
+    cursor = request.args.get('cursor')
+    unread_only = request.args.get('unread') == '1'
+    notifications, next_cursor = get_inbox_page(session['user_id'], cursor=cursor, unread_only=unread_only)
+    return render_template('shared/notifications.html',
+                         notifications=notifications,
+                         next_cursor=next_cursor,
+                         cursor=cursor,
+                         unread_only=unread_only)
+
+@bp.route('/notifications/read', methods=['POST'])
+def mark_notifications_read():
     if 'user_id' not in session:
         return redirect(url_for('shared.login'))
     
-    notifications = Notification.query.filter_by(user_id=session['user_id']).order_by(Notification.created_at.desc()).all()
-    return render_template('shared/notifications.html', notifications=notifications)
+    if request.form.get('all') == '1':
+        changed = mark_read(session['user_id'])
+    else:
+        ids = [int(value) for value in request.form.getlist('notification_ids') if value.isdigit()]
+        changed = mark_read(session['user_id'], ids)
+    
+    flash(f'{changed} notification{"s" if changed != 1 else ""} marked as read', 'success')
+    return redirect(url_for('shared.notifications'))
 
 @bp.route('/notifications/<int:notification_id>/read', methods=['POST'])
 def mark_notification_read(notification_id):
-    from utils.notifications import mark_as_read
-    
     if 'user_id' not in session:
         return redirect(url_for('shared.login'))
     
-    mark_as_read(notification_id)
+    mark_as_read(notification_id, session['user_id'])
     return redirect(url_for('shared.notifications'))
 
+@bp.route('/notifications/stream')
+def notification_stream():
+    if 'user_id' not in session:
+        return Response(status=401)
+    
+    user_id = session['user_id']
+    unread_count = get_unread_count(user_id)
+    heartbeat = current_app.config.get('SSE_HEARTBEAT_SECONDS', 15)
+    app = current_app._get_current_object()
+    facility = current_facility()
+    subscription = hub.subscribe(stream_key(user_id))
+    
+    # Release the database connection before the long-lived stream starts
+    db.session.remove()
+    
+    def stream():
+        last_count = unread_count
+        try:
+            yield 'retry: 5000\n'
+            yield format_sse('unread', {'unread_count': unread_count})
+            while True:
+                message = subscription.get(timeout=heartbeat)
+                if message is not None:
+                    last_count = message[1].get('unread_count', last_count)
+                    yield format_sse(*message)
+                    continue
+                # The hub only carries this worker's events; notifications created
+                # by other workers or CLI commands show up in the count
+                with facility_context(facility, app):
+                    count = get_unread_count(user_id)
+                if count != last_count:
+                    last_count = count
+                    yield format_sse('unread', {'unread_count': count})
+                else:
+                    yield ': keep-alive\n\n'
+        finally:
+            hub.unsubscribe(subscription)
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @bp.route('/profile', methods=['GET', 'POST'])
 def profile():
     if 'user_id' not in session:
@@ -145,6 +207,10 @@ def profile():
             user.doctor_profile.experience_years = request.form.get('experience_years')
         
         db.session.commit()
+        if user.role == 'doctor':
+            signals.doctor_changed.send(doctor_ids=[user.doctor_profile.id])
+        elif user.role == 'patient':
+            signals.patient_changed.send(patient_ids=[user.patient_profile.id])
         flash('Profile updated successfully', 'success')
         return redirect(url_for('shared.profile'))
     
@@ -0,0 +1,116 @@
+"""Change capture of bulk statements and change-log cursors against a small database"""
+from datetime import date, time, timedelta
+
+import pytest
+from sqlalchemy import insert, update
+
+from app import create_app, init_database
+from models import db, Appointment, ChangeEvent, Doctor, Patient
+from utils.changes import CursorExpired, get_changes
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "changes.db"}'})
+    with app.app_context():
+        init_database()
+        yield app
+
+def _appointment_rows(count):
+    doctor_id = Doctor.query.first().id
+    patient_id = Patient.query.first().id
+    day = date.today() + timedelta(days=1)
+    return [{'doctor_id': doctor_id, 'patient_id': patient_id, 'appointment_date': day,
+             'appointment_time': time(9 + i % 9, 15 * (i // 9 % 4)), 'duration_minutes': 15,
+             'status': 'Booked'} for i in range(count)]
+
+def _appointment_events(after=0):
+    events, _, _ = get_changes(after, limit=1000, entities=['appointments'])
+    return events
+
+def test_bulk_insert_records_every_new_id(app):
+    # A row added through the unit of work first, so new ids do not start at 1
+    db.session.add(Appointment(**_appointment_rows(1)[0]))
+    db.session.commit()
+    before = _appointment_events()
+    assert [event['operation'] for event in before] == ['insert']
+
+    db.session.execute(insert(Appointment), _appointment_rows(25))
+    db.session.commit()
+
+    new_ids = [appointment_id for (appointment_id,) in db.session.query(Appointment.id).filter(
+        Appointment.id > before[0]['entity_id']
+    ).order_by(Appointment.id)]
+    events = _appointment_events(before[-1]['seq'])
+    assert len(new_ids) == 25
+    assert [event['entity_id'] for event in events] == new_ids
+    assert {event['operation'] for event in events} == {'insert'}
+    assert all(event['columns'] == [] for event in events)
+
+def test_bulk_updates_record_rows_and_columns(app):
+    db.session.execute(insert(Appointment), _appointment_rows(6))
+    db.session.commit()
+    ids = [appointment_id for (appointment_id,) in db.session.query(Appointment.id).order_by(Appointment.id)]
+    cursor = _appointment_events()[-1]['seq']
+
+    # executemany UPDATE by primary key
+    db.session.execute(update(Appointment), [{'id': appointment_id, 'status': 'Cancelled'}
+                                             for appointment_id in ids[:2]])
+    # UPDATE ... WHERE
+    db.session.execute(update(Appointment).where(Appointment.id.in_(ids[4:])).values(
+        status='Completed', duration_minutes=30
+    ).execution_options(synchronize_session=False))
+    db.session.commit()
+
+    events = _appointment_events(cursor)
+    assert [(event['entity_id'], event['operation']) for event in events] == [
+        (ids[0], 'update'), (ids[1], 'update'), (ids[4], 'update'), (ids[5], 'update')
+    ]
+    assert events[0]['columns'] == ['status']
+    assert sorted(events[2]['columns']) == ['duration_minutes', 'status']
+
+def test_cursor_pages_through_events_in_order(app):
+    db.session.execute(insert(Appointment), _appointment_rows(5))
+    db.session.commit()
+
+    seen, cursor, has_more = [], 0, True
+    while has_more:
+        events, cursor, has_more = get_changes(cursor, limit=2)
+        assert len(events) <= 2
+        seen.extend(events)
+    assert [event['seq'] for event in seen] == sorted({event['seq'] for event in seen})
+    assert cursor == seen[-1]['seq']
+    assert get_changes(cursor) == ([], cursor, False)
+
+def test_cursor_expires_only_when_events_after_it_were_purged(app):
+    db.session.execute(insert(Appointment), _appointment_rows(6))
+    db.session.commit()
+    seqs = [event['seq'] for event in _appointment_events()]
+
+    # Purge the first three events, as purge_change_events would
+    ChangeEvent.query.filter(ChangeEvent.id <= seqs[2]).delete()
+    db.session.commit()
+
+    # Consumers that already read the purged events can carry on
+    events, _, _ = get_changes(seqs[2])
+    assert [event['seq'] for event in events] == seqs[3:]
+    # Starting over is always allowed
+    assert [event['seq'] for event in get_changes(0)[0]] == seqs[3:]
+    # A consumer that missed a purged event has to resync
+    with pytest.raises(CursorExpired):
+        get_changes(seqs[1])
+    with pytest.raises(CursorExpired):
+        get_changes(seqs[0])
+
+def test_expired_cursor_returns_410(app):
+    db.session.execute(insert(Appointment), _appointment_rows(3))
+    db.session.commit()
+    seqs = [event['seq'] for event in _appointment_events()]
+    ChangeEvent.query.filter(ChangeEvent.id <= seqs[1]).delete()
+    db.session.commit()
+
+    client = app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    assert client.get(f'/api/changes?cursor={seqs[0]}').status_code == 410
+    response = client.get(f'/api/changes?cursor={seqs[1]}')
+    assert response.status_code == 200
+    assert [event['seq'] for event in response.get_json()['changes']] == seqs[2:]
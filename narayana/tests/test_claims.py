@@ -0,0 +1,95 @@
+"""Claim batching and retries of failed claim files against a small database"""
+import csv
+from datetime import date, time, timedelta
+
+import pytest
+
+from app import create_app, init_database
+from models import db, Appointment, Bill, ClaimBatch, Doctor, Patient
+from utils.claims import claim_file_path, create_claim_batches, process_claims, submit_claim_batch
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "claims.db"}',
+        'CLAIMS_DIR': str(tmp_path / 'claims')
+    })
+    with app.app_context():
+        init_database()
+        yield app
+
+@pytest.fixture
+def bills(app):
+    """Three insured bills and one of an uninsured patient; returns the insured bill ids"""
+    doctor = Doctor.query.first()
+    insured, uninsured = Patient.query.order_by(Patient.id).limit(2).all()
+    insured.insurance_provider = 'Acme Health'
+    insured.insurance_number = 'AC-1'
+    ids = []
+    for i, patient in enumerate([insured, insured, insured, uninsured]):
+        appointment = Appointment(doctor_id=doctor.id, patient_id=patient.id, status='Completed',
+                                  appointment_date=date.today() - timedelta(days=i + 1),
+                                  appointment_time=time(10))
+        db.session.add(appointment)
+        db.session.flush()
+        bill = Bill(appointment_id=appointment.id, patient_id=patient.id, doctor_id=doctor.id,
+                    consultation_fee=100.0, subtotal=100.0, total_amount=100.0,
+                    insurance_amount=60.0 if i == 0 else 0.0)
+        db.session.add(bill)
+        db.session.flush()
+        ids.append(bill.id)
+    db.session.commit()
+    return ids[:3]
+
+def _bill_state(bill_ids):
+    return db.session.query(Bill.id, Bill.claim_batch_id, Bill.claim_status, Bill.insurance_claimed).filter(
+        Bill.id.in_(bill_ids)
+    ).order_by(Bill.id).all()
+
+def test_each_bill_lands_in_one_batch(app, bills):
+    batches = create_claim_batches(1, max_bills=2)
+
+    assert [(batch.insurance_provider, batch.bill_count) for batch in batches] == [
+        ('Acme Health', 2), ('Acme Health', 1)
+    ]
+    # The explicit insurance amount is kept; the others are claimed at CLAIM_COVERAGE
+    assert [batch.claimed_amount for batch in batches] == [140.0, 80.0]
+    assert {batch_id for _, batch_id, _, _ in _bill_state(bills)} == {batch.id for batch in batches}
+    assert all(status == 'Batched' for _, _, status, _ in _bill_state(bills))
+    # The uninsured patient's bill is never batched
+    assert Bill.query.filter(Bill.claim_batch_id.isnot(None)).count() == 3
+    # A second run finds nothing left to batch
+    assert create_claim_batches(1, max_bills=2) == []
+    assert ClaimBatch.query.count() == 2
+
+def test_failed_batch_keeps_its_bills_and_retries_cleanly(app, bills, tmp_path):
+    # A file where the claims directory should be makes every write fail
+    blocker = tmp_path / 'blocked'
+    blocker.write_text('')
+    app.config['CLAIMS_DIR'] = str(blocker)
+    created, completed, failed = process_claims(1)
+    assert (created, completed, failed) == (1, 0, 1)
+
+    batch = ClaimBatch.query.one()
+    assert (batch.status, batch.attempts, batch.filename) == ('Failed', 1, None)
+    assert batch.error
+    assert [(batch_id, status, claimed) for _, batch_id, status, claimed in _bill_state(bills)] == [
+        (batch.id, 'Batched', False)
+    ] * 3
+
+    # The retry neither re-batches the bills nor duplicates claim lines
+    app.config['CLAIMS_DIR'] = str(tmp_path / 'claims')
+    assert process_claims(1) == (0, 1, 0)
+    batch = db.session.get(ClaimBatch, batch.id)
+    assert (batch.status, batch.attempts, batch.bill_count, batch.error) == ('Completed', 2, 3, None)
+    assert [(batch_id, status, claimed) for _, batch_id, status, claimed in _bill_state(bills)] == [
+        (batch.id, 'Claimed', True)
+    ] * 3
+    with open(claim_file_path(batch), newline='') as handle:
+        lines = list(csv.DictReader(handle))
+    assert sorted(int(line['bill_id']) for line in lines) == bills
+
+    # A completed batch is left alone
+    assert submit_claim_batch(batch.id).attempts == 2
+    assert process_claims(1) == (0, 0, 0)
+    assert ClaimBatch.query.count() == 1
@@ -0,0 +1,107 @@
+"""Randomized cross-checks of the interval conflict checks against brute force"""
+import random
+from datetime import date, time, timedelta
+
+import pytest
+from flask import Flask
+
+from models import db, User, Doctor, Patient, Appointment
+from utils.availability import DURATION_CHOICES, Schedule, rule_interval, slot_end
+from utils.intervals import IntervalIndex
+from utils.validators import check_double_booking
+
+SEED = 7
+TRIALS = 2000
+BOOKINGS = 500
+
+class Rule:
+    """Stand-in with the AvailabilityRule fields the engine reads"""
+
+    def __init__(self, doctor_id, start_date, end_date, weekdays, start_time, end_time):
+        self.doctor_id = doctor_id
+        self.start_date = start_date
+        self.end_date = end_date
+        self.weekdays = weekdays
+        self.start_time = start_time
+        self.end_time = end_time
+
+def _random_time(rng, step=15):
+    minutes = rng.randrange(0, 24 * 60, step)
+    return time(minutes // 60, minutes % 60)
+
+def _random_interval(rng):
+    start = _random_time(rng)
+    return start, slot_end(start, rng.choice(DURATION_CHOICES))
+
+def _overlaps(intervals, start, end):
+    return any(other_start < end and start < other_end for other_start, other_end in intervals)
+
+@pytest.fixture
+def rng():
+    return random.Random(SEED)
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmp_path / "intervals.db"}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+
+def test_interval_index_matches_brute_force(rng):
+    for _ in range(TRIALS):
+        intervals = [_random_interval(rng) for _ in range(rng.randrange(0, 30))]
+        index = IntervalIndex(intervals[:len(intervals) // 2])
+        for interval in intervals[len(intervals) // 2:]:
+            index.add(*interval)
+        start, end = _random_interval(rng)
+        assert index.overlaps(start, end) == _overlaps(intervals, start, end), (start, end, intervals)
+        assert sorted(index.overlapping(start, end)) == sorted(
+            interval for interval in intervals if _overlaps([interval], start, end)
+        ), (start, end, intervals)
+
+def test_schedule_matches_brute_force(rng):
+    today = date.today()
+    for _ in range(TRIALS):
+        blocks = []
+        for _ in range(rng.randrange(0, 6)):
+            start, end = _random_interval(rng)
+            blocks.append((1, today + timedelta(days=rng.randrange(7)), start, end))
+        rules = []
+        for _ in range(rng.randrange(0, 4)):
+            start_date = today + timedelta(days=rng.randrange(-3, 7))
+            end_date = rng.choice([None, start_date + timedelta(days=rng.randrange(0, 5))])
+            hours = rng.choice([(None, None), _random_interval(rng)])
+            rules.append(Rule(1, start_date, end_date, rng.randrange(0, 128), *hours))
+        schedule = Schedule(rules, blocks)
+
+        day = today + timedelta(days=rng.randrange(7))
+        start, end = _random_interval(rng)
+        intervals = [(block_start, block_end) for _, block_day, block_start, block_end in blocks if block_day == day]
+        intervals += [interval for interval in (rule_interval(rule, day) for rule in rules) if interval]
+        assert schedule.is_blocked(1, day, start, end) == _overlaps(intervals, start, end), (day, start, intervals)
+
+def test_check_double_booking_matches_brute_force(app, rng):
+    today = date.today()
+    db.session.execute(User.__table__.insert(), [
+        {'id': 1, 'username': 'dr', 'email': 'dr@test.local', 'password_hash': 'x', 'role': 'doctor'},
+        {'id': 2, 'username': 'pt', 'email': 'pt@test.local', 'password_hash': 'x', 'role': 'patient'}
+    ])
+    db.session.execute(Doctor.__table__.insert(), [{'id': 1, 'user_id': 1, 'specialization': 'General'}])
+    db.session.execute(Patient.__table__.insert(), [{'id': 1, 'user_id': 2, 'medical_id': 'MED1'}])
+    rows = [{'doctor_id': 1, 'patient_id': 1, 'appointment_date': today + timedelta(days=rng.randrange(5)),
+             'appointment_time': _random_time(rng), 'duration_minutes': rng.choice(DURATION_CHOICES),
+             'status': rng.choice(['Booked', 'Completed', 'Cancelled'])} for _ in range(BOOKINGS)]
+    db.session.execute(Appointment.__table__.insert(), rows)
+    db.session.commit()
+
+    for _ in range(BOOKINGS):
+        day = today + timedelta(days=rng.randrange(5))
+        start = _random_time(rng)
+        duration = rng.choice(DURATION_CHOICES)
+        intervals = [(row['appointment_time'], slot_end(row['appointment_time'], row['duration_minutes']))
+                     for row in rows if row['appointment_date'] == day and row['status'] != 'Cancelled']
+        expected = _overlaps(intervals, start, slot_end(start, duration))
+        assert check_double_booking(1, day, start, duration) == expected, (day, start, duration)
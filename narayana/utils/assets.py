@@ -0,0 +1,127 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+
+from flask import current_app, request, send_from_directory, url_for, abort
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip variants are built without it
+    brotli = None
+
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+ASSET_EXTENSIONS = ('.css', '.js')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+def minify_css(text):
+    """Strip comments and insignificant whitespace from a stylesheet"""
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+    # Only after the colon: a space before it can be a descendant combinator
+    text = re.sub(r':\s+', ':', text)
+    text = text.replace(';}', '}')
+    return text.strip()
+
+def minify_js(text):
+    """Drop blank lines and surrounding whitespace; anything smarter needs a real JS parser"""
+    return '\n'.join(line.strip() for line in text.splitlines() if line.strip())
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+def _source_files(static_folder):
+    dist = os.path.join(static_folder, DIST_DIR)
+    for root, dirs, files in os.walk(static_folder):
+        if os.path.abspath(root).startswith(os.path.abspath(dist)):
+            continue
+        for name in sorted(files):
+            if name.endswith(ASSET_EXTENSIONS) and not name.endswith(('.min.css', '.min.js')):
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, static_folder).replace(os.sep, '/'), path
+
+def build_assets(static_folder):
+    """Minify, fingerprint and pre-compress every CSS/JS file under `static_folder`.
+
+    Output goes to static/dist as name.<hash>.ext plus .gz (and .br when
+    the brotli package is installed) variants. The manifest maps each
+    source path to its fingerprinted path. Returns the manifest.
+    """
+    dist = os.path.join(static_folder, DIST_DIR)
+    if os.path.isdir(dist):
+        shutil.rmtree(dist)
+    os.makedirs(dist)
+
+    manifest = {}
+    for logical, path in _source_files(static_folder):
+        base, ext = os.path.splitext(logical)
+        with open(path, encoding='utf-8') as handle:
+            content = MINIFIERS[ext](handle.read()).encode('utf-8')
+        digest = hashlib.sha256(content).hexdigest()[:12]
+        hashed = f'{base}.{digest}{ext}'
+
+        target = os.path.join(dist, hashed)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as handle:
+            handle.write(content)
+        with open(target + '.gz', 'wb') as handle:
+            # mtime=0 keeps the output byte-identical between builds
+            handle.write(gzip.compress(content, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(target + '.br', 'wb') as handle:
+                handle.write(brotli.compress(content, quality=11))
+        manifest[logical] = hashed
+
+    with open(os.path.join(dist, MANIFEST_NAME), 'w') as handle:
+        json.dump(manifest, handle, indent=2, sort_keys=True)
+    return manifest
+
+def load_manifest(static_folder):
+    path = os.path.join(static_folder, DIST_DIR, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as handle:
+        return json.load(handle)
+
+def asset_url(filename):
+    """URL of the built, fingerprinted asset, or the plain static file if it was not built.
+
+    Debug mode always uses the source file so edits show up without a rebuild.
+    """
+    hashed = current_app.extensions['assets'].get(filename)
+    if hashed is None or current_app.debug:
+        return url_for('static', filename=filename)
+    return url_for('serve_asset', filename=hashed)
+
+def serve_asset(filename):
+    """Serve a fingerprinted file, pre-compressed when the client accepts it"""
+    dist = os.path.join(current_app.static_folder, DIST_DIR)
+    if filename == MANIFEST_NAME or filename.endswith(('.gz', '.br')):
+        abort(404)
+
+    accepted = request.accept_encodings
+    for encoding, suffix in ENCODINGS:
+        if accepted[encoding] and os.path.exists(os.path.join(dist, filename + suffix)):
+            response = send_from_directory(dist, filename + suffix,
+                                           mimetype=_mimetype(filename), max_age=31536000)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(dist, filename, max_age=31536000)
+
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+def _mimetype(filename):
+    return 'text/css' if filename.endswith('.css') else 'application/javascript'
+
+def init_assets(app):
+    """Register the /assets route and the asset_url template helper"""
+    app.extensions['assets'] = load_manifest(app.static_folder)
+    app.add_url_rule('/assets/<path:filename>', 'serve_asset', serve_asset)
+    app.jinja_env.globals['asset_url'] = asset_url
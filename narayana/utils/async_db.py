@@ -0,0 +1,52 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+class AsyncSQLitePool:
+    """A fixed-size pool of aiosqlite connections.
+
+    aiosqlite runs each connection on its own thread, so a pool of N
+    connections lets N queries run while the event loop keeps serving
+    other requests. Requires the optional `aiosqlite` package.
+    """
+
+    def __init__(self, database, size=8):
+        self.database = database
+        self.size = size
+        self._connections = asyncio.Queue()
+        self._opened = False
+        self._open_lock = None
+
+    async def open(self):
+        import aiosqlite
+
+        if self._open_lock is None:
+            self._open_lock = asyncio.Lock()
+        async with self._open_lock:
+            if self._opened:
+                return
+            for _ in range(self.size):
+                connection = await aiosqlite.connect(self.database)
+                await connection.execute('PRAGMA query_only = ON')
+                self._connections.put_nowait(connection)
+            self._opened = True
+
+    async def close(self):
+        while not self._connections.empty():
+            connection = self._connections.get_nowait()
+            await connection.close()
+        self._opened = False
+
+    @asynccontextmanager
+    async def connection(self):
+        if not self._opened:
+            await self.open()
+        connection = await self._connections.get()
+        try:
+            yield connection
+        finally:
+            self._connections.put_nowait(connection)
+
+    async def fetchall(self, sql, params=()):
+        async with self.connection() as connection:
+            async with connection.execute(sql, params) as cursor:
+                return await cursor.fetchall()
@@ -0,0 +1,192 @@
+from collections import defaultdict, namedtuple
+from datetime import time, timedelta
+from sqlalchemy import or_
+from models import db, Appointment, Availability, AvailabilityRule
+from utils.intervals import IntervalIndex, add_minutes, merge_intervals
+
+# The default daily schedule: 1-hour slots from 9 AM to 6 PM with a lunch break
+SLOT_TIMES = (
+    (time(9, 0), time(10, 0)),
+    (time(10, 0), time(11, 0)),
+    (time(11, 0), time(12, 0)),
+    (time(12, 0), time(13, 0)),
+    (time(14, 0), time(15, 0)),
+    (time(15, 0), time(16, 0)),
+    (time(16, 0), time(17, 0)),
+    (time(17, 0), time(18, 0)),
+)
+WORKING_HOURS = merge_intervals(SLOT_TIMES)
+
+# Appointment lengths patients can book; slots still start on the hourly grid
+DEFAULT_DURATION_MINUTES = 60
+DURATION_CHOICES = (15, 30, 45, 60, 90, 120)
+MAX_DURATION_MINUTES = max(DURATION_CHOICES)
+
+WEEKDAY_NAMES = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+# What an all-day rule blocks: midnight through time.max, so every slot overlaps it
+ALL_DAY = (time.min, time.max)
+
+Slot = namedtuple('Slot', 'date start_time end_time')
+
+def slot_end(start_time, duration_minutes=None):
+    return add_minutes(start_time, duration_minutes or DEFAULT_DURATION_MINUTES)
+
+def within_working_hours(start, end):
+    return any(open_at <= start and end <= close_at for open_at, close_at in WORKING_HOURS)
+
+def weekday_mask(weekdays):
+    """Bitmask for an iterable of weekday numbers (0 = Monday)"""
+    mask = 0
+    for weekday in weekdays:
+        mask |= 1 << int(weekday)
+    return mask
+
+def mask_weekdays(mask):
+    return [weekday for weekday in range(7) if mask & (1 << weekday)]
+
+def describe_rule(rule):
+    """Human readable summary, e.g. "Fri, 12:00-18:00 from 2024-03-01" """
+    days = ', '.join(WEEKDAY_NAMES[weekday] for weekday in mask_weekdays(rule.weekdays or 0)) or 'Every day'
+    hours = f'{rule.start_time:%H:%M}-{rule.end_time:%H:%M}' if rule.start_time else 'all day'
+    if rule.end_date is None:
+        period = f'from {rule.start_date}'
+    elif rule.end_date == rule.start_date:
+        period = f'on {rule.start_date}'
+    else:
+        period = f'{rule.start_date} to {rule.end_date}'
+    return f'{days}, {hours} {period}'
+
+def rule_interval(rule, day):
+    """The (start, end) time interval `rule` blocks on `day`, or None if it does not apply"""
+    if day < rule.start_date or (rule.end_date is not None and day > rule.end_date):
+        return None
+    if rule.weekdays and not rule.weekdays & (1 << day.weekday()):
+        return None
+    if rule.start_time is None:
+        return ALL_DAY
+    return rule.start_time, rule.end_time
+
+class Schedule:
+    """Blocked time per doctor and day from single-slot blocks and rules.
+
+    Built by load_schedule() from two queries; every check after that is
+    an O(log n) lookup in an IntervalIndex built once per doctor-day.
+    """
+
+    def __init__(self, rules=(), blocks=()):
+        self._rules = defaultdict(list)
+        for rule in rules:
+            self._rules[rule.doctor_id].append(rule)
+        self._blocks = defaultdict(list)
+        for doctor_id, day, start, end in blocks:
+            self._blocks[(doctor_id, day)].append((start, end))
+        self._indexes = {}
+
+    def rule_doctor_ids(self):
+        return set(self._rules)
+
+    def blocked(self, doctor_id, day):
+        key = (doctor_id, day)
+        index = self._indexes.get(key)
+        if index is None:
+            intervals = list(self._blocks.get(key, ()))
+            for rule in self._rules.get(doctor_id, ()):
+                interval = rule_interval(rule, day)
+                if interval:
+                    intervals.append(interval)
+            index = self._indexes[key] = IntervalIndex(intervals)
+        return index
+
+    def is_blocked(self, doctor_id, day, start, end):
+        return self.blocked(doctor_id, day).overlaps(start, end)
+
+    def open_slots(self, doctor_id, day, duration_minutes=None):
+        """(start, end) of every slot on the default grid that fits the working hours and no block"""
+        blocked = self.blocked(doctor_id, day)
+        slots = []
+        for start, _ in SLOT_TIMES:
+            end = slot_end(start, duration_minutes)
+            if within_working_hours(start, end) and not blocked.overlaps(start, end):
+                slots.append((start, end))
+        return slots
+
+def load_schedule(doctor_ids=None, start=None, end=None, blocks=True):
+    """Load the rules, and unless blocks=False the single-slot blocks, overlapping [start, end]"""
+    rules = AvailabilityRule.query
+    if doctor_ids is not None:
+        rules = rules.filter(AvailabilityRule.doctor_id.in_(doctor_ids))
+    if end:
+        rules = rules.filter(AvailabilityRule.start_date <= end)
+    if start:
+        rules = rules.filter(or_(AvailabilityRule.end_date == None, AvailabilityRule.end_date >= start))
+
+    block_rows = []
+    if blocks:
+        query = db.session.query(
+            Availability.doctor_id, Availability.date, Availability.start_time, Availability.end_time
+        ).filter(Availability.is_available == False)
+        if doctor_ids is not None:
+            query = query.filter(Availability.doctor_id.in_(doctor_ids))
+        if start:
+            query = query.filter(Availability.date >= start)
+        if end:
+            query = query.filter(Availability.date <= end)
+        block_rows = query.all()
+
+    return Schedule(rules.all(), block_rows)
+
+def is_blocked(doctor_id, day, start_time, end_time=None):
+    """Whether a doctor is unavailable for any part of [start_time, end_time) on `day`"""
+    schedule = load_schedule([doctor_id], day, day)
+    return schedule.is_blocked(doctor_id, day, start_time, end_time or slot_end(start_time))
+
+def load_bookings(doctor_id, start_date, end_date):
+    """{day: IntervalIndex} of a doctor's booked and completed appointments"""
+    intervals = defaultdict(list)
+    for day, start_time, duration in db.session.query(
+        Appointment.appointment_date, Appointment.appointment_time, Appointment.duration_minutes
+    ).filter(
+        Appointment.doctor_id == doctor_id,
+        Appointment.appointment_date >= start_date,
+        Appointment.appointment_date <= end_date,
+        Appointment.status.in_(['Booked', 'Completed'])
+    ):
+        intervals[day].append((start_time, slot_end(start_time, duration)))
+    return defaultdict(IntervalIndex, {day: IntervalIndex(values) for day, values in intervals.items()})
+
+def available_slots(doctor_id, start_date, end_date, duration_minutes=None):
+    """Open slots of `duration_minutes` for a doctor between two dates, in order.
+
+    Two queries for the whole range (blocks and rules, then bookings);
+    each candidate slot is then checked against both interval indexes.
+    """
+    schedule = load_schedule([doctor_id], start_date, end_date)
+    bookings = load_bookings(doctor_id, start_date, end_date)
+
+    slots = []
+    day = start_date
+    while day <= end_date:
+        for start_time, end_time in schedule.open_slots(doctor_id, day, duration_minutes):
+            if not bookings[day].overlaps(start_time, end_time):
+                slots.append(Slot(day, start_time, end_time))
+        day += timedelta(days=1)
+    return slots
+
+def rule_conflicts(rule):
+    """Booked appointments of the rule's doctor that fall in time the rule blocks"""
+    query = Appointment.query.filter(
+        Appointment.doctor_id == rule.doctor_id,
+        Appointment.appointment_date >= rule.start_date,
+        Appointment.status == 'Booked'
+    )
+    if rule.end_date is not None:
+        query = query.filter(Appointment.appointment_date <= rule.end_date)
+
+    conflicts = []
+    for appointment in query.order_by(Appointment.appointment_date, Appointment.appointment_time):
+        interval = rule_interval(rule, appointment.appointment_date)
+        end = slot_end(appointment.appointment_time, appointment.duration_minutes)
+        if interval and interval[0] < end and appointment.appointment_time < interval[1]:
+            conflicts.append(appointment)
+    return conflicts
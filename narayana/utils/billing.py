@@ -0,0 +1,180 @@
+from datetime import datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from flask import current_app
+from sqlalchemy import func, insert, update
+from models import db, Appointment, Bill, Doctor, Patient, Notification, AuditLog
+from utils.notifications import publish_unread_count
+from utils import signals
+
+CHARGE_FIELDS = ('consultation_fee', 'lab_charges', 'medicine_charges', 'procedure_charges', 'other_charges')
+
+# Each rule taxes the listed charge components at the given rate.
+# Override with app.config['BILLING_TAX_RULES'].
+DEFAULT_TAX_RULES = [
+    {'name': 'Service tax', 'rate': '0.05', 'applies_to': CHARGE_FIELDS}
+]
+
+CENT = Decimal('0.01')
+
+def to_cents(value):
+    """Convert a form value, float or Decimal to integer cents.
+
+    Raises InvalidOperation for anything that is not a finite,
+    non-negative amount (including 'nan' and 'inf').
+    """
+    if value in (None, ''):
+        return 0
+    amount = Decimal(str(value).strip())
+    if not amount.is_finite() or amount < 0:
+        raise InvalidOperation(f'Not a valid amount: {value!r}')
+    return int(amount.quantize(CENT, rounding=ROUND_HALF_UP) * 100)
+
+def from_cents(cents):
+    """Convert integer cents to the float stored in Bill columns"""
+    return float(Decimal(cents) / 100)
+
+def get_tax_rules():
+    try:
+        return current_app.config.get('BILLING_TAX_RULES', DEFAULT_TAX_RULES)
+    except RuntimeError:
+        return DEFAULT_TAX_RULES
+
+def compute_bill(charges, discount=0, tax_rules=None):
+    """Compute subtotal, tax and total for a set of charges in integer cents.
+
+    `charges` maps charge field names to amounts. Returns a dict of Bill
+    column values, rounded to whole cents before being stored as floats.
+    Raises InvalidOperation for invalid amounts and for a discount larger
+    than the subtotal plus tax.
+    """
+    tax_rules = tax_rules if tax_rules is not None else get_tax_rules()
+    cents = {field: to_cents(charges.get(field)) for field in CHARGE_FIELDS}
+    discount_cents = to_cents(discount)
+
+    subtotal = sum(cents.values())
+    tax = 0
+    for rule in tax_rules:
+        base = sum(cents[field] for field in rule.get('applies_to', CHARGE_FIELDS))
+        tax += int((Decimal(base) * Decimal(str(rule['rate']))).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+    if discount_cents > subtotal + tax:
+        raise InvalidOperation(f'Discount {discount!r} exceeds the bill')
+    total = subtotal + tax - discount_cents
+
+    values = {field: from_cents(amount) for field, amount in cents.items()}
+    values.update({
+        'subtotal': from_cents(subtotal),
+        'tax_amount': from_cents(tax),
+        'discount_amount': from_cents(discount_cents),
+        'total_amount': from_cents(total)
+    })
+    return values
+
+def generate_bills(actor_user_id, appointment_date=None, appointment_ids=None, charges=None):
+    """Create bills for completed appointments that do not have one yet.
+
+    Each bill starts from the doctor's consultation fee plus any extra
+    `charges`. Bills, patient notifications and audit rows are inserted in
+    bulk and committed in a single transaction. Returns the number of
+    bills created.
+    """
+    charges = charges or {}
+    query = db.session.query(
+        Appointment.id,
+        Appointment.patient_id,
+        Appointment.doctor_id,
+        Appointment.appointment_date,
+        Doctor.consultation_fee,
+        Patient.user_id
+    ).join(Doctor, Appointment.doctor_id == Doctor.id).join(
+        Patient, Appointment.patient_id == Patient.id
+    ).outerjoin(Bill, Bill.appointment_id == Appointment.id).filter(
+        Appointment.status == 'Completed',
+        Bill.id.is_(None)
+    )
+
+    if appointment_date:
+        query = query.filter(Appointment.appointment_date == appointment_date)
+    if appointment_ids:
+        query = query.filter(Appointment.id.in_(appointment_ids))
+
+    now = datetime.utcnow()
+    tax_rules = get_tax_rules()
+    bills, notifications = [], []
+
+    for appointment_id, patient_id, doctor_id, appt_date, fee, patient_user_id in query:
+        values = compute_bill(dict(charges, consultation_fee=charges.get('consultation_fee', fee or 0)),
+                              tax_rules=tax_rules)
+        values.update(appointment_id=appointment_id, patient_id=patient_id, doctor_id=doctor_id,
+                      payment_status='Pending', created_at=now, updated_at=now)
+        bills.append(values)
+        notifications.append({
+            'user_id': patient_user_id,
+            'message': f'Bill generated for your appointment on {appt_date}. Amount: ${values["total_amount"]:.2f}',
+            'is_read': False,
+            'created_at': now
+        })
+
+    if bills:
+        last_id = db.session.query(func.max(Bill.id)).scalar() or 0
+        db.session.execute(insert(Bill), bills)
+        # Audit rows point at the new bills; their ids follow the previous maximum
+        bill_ids = dict(db.session.query(Bill.appointment_id, Bill.id).filter(Bill.id > last_id))
+        audits = [{
+            'user_id': actor_user_id,
+            'action': 'CREATE',
+            'entity_type': 'Bill',
+            'entity_id': bill_ids[bill['appointment_id']],
+            'details': f'Generated bill for appointment {bill["appointment_id"]}',
+            'created_at': now
+        } for bill in bills]
+        db.session.execute(insert(Notification), notifications)
+        db.session.execute(insert(AuditLog), audits)
+    db.session.commit()
+    for user_id in {notification['user_id'] for notification in notifications}:
+        publish_unread_count(user_id)
+    if bills:
+        signals.bill_changed.send(patient_ids={bill['patient_id'] for bill in bills},
+                                  appointment_ids=[bill['appointment_id'] for bill in bills])
+    return len(bills)
+
+def recompute_bills(bill_ids=None, batch_size=1000):
+    """Recompute stored totals from charge components with the current tax rules.
+
+    Without `bill_ids` only unpaid bills that are not in a claim batch
+    are recomputed; paid and claimed amounts have already been settled or
+    sent to the insurer. Rows are read as plain tuples in primary-key
+    order and written back with executemany UPDATEs, one batch at a time,
+    in one transaction.
+    """
+    columns = [Bill.id, Bill.appointment_id, Bill.doctor_id, Bill.payment_status, Bill.payment_date,
+               Bill.discount_amount] + [getattr(Bill, field) for field in CHARGE_FIELDS]
+    query = db.session.query(*columns).order_by(Bill.id)
+    if bill_ids:
+        query = query.filter(Bill.id.in_(bill_ids))
+    else:
+        query = query.filter(Bill.payment_status != 'Paid', Bill.claim_batch_id.is_(None))
+
+    tax_rules = get_tax_rules()
+    appointment_ids = []
+    doctor_days = set()
+    last_id = 0
+    while True:
+        rows = query.filter(Bill.id > last_id).limit(batch_size).all()
+        if not rows:
+            break
+        batch = []
+        for bill_id, appointment_id, doctor_id, status, payment_date, discount, *charges in rows:
+            values = compute_bill(dict(zip(CHARGE_FIELDS, charges)), discount=discount, tax_rules=tax_rules)
+            values['id'] = bill_id
+            batch.append(values)
+            appointment_ids.append(appointment_id)
+            if status == 'Paid' and payment_date:
+                # Revenue rollups count paid bills on their payment day
+                doctor_days.add((doctor_id, payment_date.date()))
+        db.session.execute(update(Bill), batch)
+        last_id = rows[-1][0]
+
+    db.session.commit()
+    if appointment_ids:
+        signals.bill_changed.send(appointment_ids=appointment_ids, doctor_days=doctor_days)
+    return len(appointment_ids)
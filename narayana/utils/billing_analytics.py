@@ -0,0 +1,136 @@
+from collections import defaultdict
+from datetime import datetime, date, timedelta
+from sqlalchemy import func
+from models import db, Bill, Doctor, User
+
+def _empty_bucket():
+    return {'bills': 0, 'billed': 0.0, 'revenue': 0.0, 'pending': 0.0, 'insurance': 0.0}
+
+def _add(bucket, status, count, amount, insurance):
+    bucket['bills'] += count
+    bucket['billed'] += amount
+    if status == 'Paid':
+        bucket['revenue'] += amount
+        bucket['insurance'] += insurance
+    elif status == 'Pending':
+        bucket['pending'] += amount
+
+def _finish(groups, key_name):
+    """Turn a dict of buckets into a sorted list of rows"""
+    rows = []
+    for key in sorted(groups, key=lambda k: (k is None, k)):
+        bucket = groups[key]
+        bucket[key_name] = key
+        bucket['insurance_share'] = (bucket['insurance'] / bucket['revenue']) if bucket['revenue'] else 0.0
+        rows.append(bucket)
+    return rows
+
+def _parse_day(value):
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+def _bill_filters(query, start_date, end_date, doctor_id):
+    if start_date:
+        query = query.filter(Bill.created_at >= datetime.combine(start_date, datetime.min.time()))
+    if end_date:
+        query = query.filter(Bill.created_at < datetime.combine(end_date + timedelta(days=1), datetime.min.time()))
+    if doctor_id:
+        query = query.filter(Bill.doctor_id == doctor_id)
+    return query
+
+def bill_aggregates(start_date=None, end_date=None, doctor_id=None):
+    """Aggregate bills in SQL along the time axis and the entity axis.
+
+    Returns two lists of small grouped rows: (day, status, count, amount,
+    insurance) and (doctor_id, method, status, count, amount, insurance).
+    Their size is bounded by days and doctors x methods, not by bills, so
+    every report is rolled up in Python from a few thousand rows at most.
+    """
+    day = func.date(Bill.created_at)
+    measures = (
+        func.count(Bill.id),
+        func.coalesce(func.sum(Bill.total_amount), 0.0),
+        func.coalesce(func.sum(Bill.insurance_amount), 0.0)
+    )
+    
+    by_day = _bill_filters(
+        db.session.query(day, Bill.payment_status, *measures),
+        start_date, end_date, doctor_id
+    ).group_by(day, Bill.payment_status).all()
+    
+    by_entity = _bill_filters(
+        db.session.query(Bill.doctor_id, Bill.payment_method, Bill.payment_status, *measures),
+        start_date, end_date, doctor_id
+    ).group_by(Bill.doctor_id, Bill.payment_method, Bill.payment_status).all()
+    
+    return by_day, by_entity
+
+def billing_summary(start_date=None, end_date=None, doctor_id=None):
+    """Revenue broken down by day, week, month, doctor, specialization and payment method"""
+    totals = _empty_bucket()
+    paid_bills = 0
+    by_day = defaultdict(_empty_bucket)
+    by_week = defaultdict(_empty_bucket)
+    by_month = defaultdict(_empty_bucket)
+    by_doctor = defaultdict(_empty_bucket)
+    by_specialization = defaultdict(_empty_bucket)
+    by_method = defaultdict(_empty_bucket)
+    
+    day_rows, entity_rows = bill_aggregates(start_date, end_date, doctor_id)
+    
+    for day, status, count, amount, insurance in day_rows:
+        if day is None:
+            continue
+        day = _parse_day(day)
+        iso_year, iso_week, _ = day.isocalendar()
+        _add(by_day[day.isoformat()], status, count, amount, insurance)
+        _add(by_week[f'{iso_year}-W{iso_week:02d}'], status, count, amount, insurance)
+        _add(by_month[day.strftime('%Y-%m')], status, count, amount, insurance)
+    
+    doctors = {
+        doc_id: (username, specialization)
+        for doc_id, username, specialization in db.session.query(
+            Doctor.id, User.username, Doctor.specialization
+        ).join(User, Doctor.user_id == User.id)
+    }
+    
+    for doc_id, method, status, count, amount, insurance in entity_rows:
+        username, specialization = doctors.get(doc_id, (None, None))
+        _add(totals, status, count, amount, insurance)
+        _add(by_doctor[doc_id], status, count, amount, insurance)
+        _add(by_specialization[specialization], status, count, amount, insurance)
+        _add(by_method[method or 'Unpaid'], status, count, amount, insurance)
+        if status == 'Paid':
+            paid_bills += count
+    
+    doctor_rows = _finish(by_doctor, 'doctor_id')
+    for row in doctor_rows:
+        row['doctor'] = doctors.get(row['doctor_id'], (None, None))[0]
+    
+    totals['paid_bills'] = paid_bills
+    totals['insurance_share'] = (totals['insurance'] / totals['revenue']) if totals['revenue'] else 0.0
+    
+    return {
+        'totals': totals,
+        'by_day': _finish(by_day, 'day'),
+        'by_week': _finish(by_week, 'week'),
+        'by_month': _finish(by_month, 'month'),
+        'by_doctor': doctor_rows,
+        'by_specialization': _finish(by_specialization, 'specialization'),
+        'by_payment_method': _finish(by_method, 'payment_method')
+    }
+
+def patient_bill_totals(patient_id):
+    """Billed, paid and pending totals for one patient in a single grouped query"""
+    rows = db.session.query(
+        Bill.payment_status,
+        func.coalesce(func.sum(Bill.total_amount), 0.0)
+    ).filter(Bill.patient_id == patient_id).group_by(Bill.payment_status).all()
+
+    totals = {status: amount for status, amount in rows}
+    return {
+        'total_billed': sum(totals.values()),
+        'total_paid': totals.get('Paid', 0.0),
+        'total_pending': totals.get('Pending', 0.0)
+    }
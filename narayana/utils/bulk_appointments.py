@@ -0,0 +1,214 @@
+from collections import defaultdict
+from datetime import date, datetime
+from sqlalchemy import delete, insert, update
+from models import db, Appointment, AuditLog, Notification, Patient, ReminderLog
+from utils import signals
+from utils.availability import load_schedule, slot_end, within_working_hours
+from utils.intervals import IntervalIndex
+from utils.notifications import publish_unread_count
+
+BULK_ACTIONS = {'cancel': 'cancelled', 'complete': 'completed', 'reschedule': 'rescheduled'}
+STATUS_AFTER = {'cancel': 'Cancelled', 'complete': 'Completed'}
+
+def parse_bulk_form(form):
+    """Turn a bulk action form into keyword arguments for bulk_update_appointments.
+
+    Raises ValueError with a message for the user when the form is incomplete.
+    """
+    action = form.get('action')
+    if action not in BULK_ACTIONS:
+        raise ValueError('Choose an action')
+
+    options = {'action': action, 'reason': form.get('reason') or None}
+    try:
+        if form.get('scope') == 'range':
+            start, end = form.get('start_date'), form.get('end_date')
+            if not start:
+                raise ValueError('Choose the first date of the range')
+            options['start_date'] = datetime.strptime(start, '%Y-%m-%d').date()
+            options['end_date'] = datetime.strptime(end, '%Y-%m-%d').date() if end else options['start_date']
+        else:
+            options['appointment_ids'] = [int(value) for value in form.getlist('appointment_ids') if value.isdigit()]
+            if not options['appointment_ids']:
+                raise ValueError('Select at least one appointment')
+
+        if action == 'reschedule':
+            if not form.get('new_date'):
+                raise ValueError('Choose the date to move the appointments to')
+            options['new_date'] = datetime.strptime(form.get('new_date'), '%Y-%m-%d').date()
+            if options['new_date'] < date.today():
+                raise ValueError('Appointments cannot be moved to a past date')
+            if form.get('new_time'):
+                options['new_time'] = datetime.strptime(form.get('new_time'), '%H:%M').time()
+    except ValueError as exc:
+        if 'does not match format' in str(exc) or 'unconverted data' in str(exc):
+            raise ValueError('Please enter valid dates and times')
+        raise
+    return options
+
+def _result(row, ok, message):
+    return {
+        'appointment_id': row.id if row else None,
+        'date': row.appointment_date if row else None,
+        'time': row.appointment_time if row else None,
+        'ok': ok,
+        'message': message
+    }
+
+def bulk_update_appointments(actor_user_id, action, appointment_ids=None, doctor_id=None,
+                             start_date=None, end_date=None, new_date=None, new_time=None, reason=None):
+    """Cancel, complete or reschedule many appointments in one transaction.
+
+    Appointments are chosen by id or by date range. With `doctor_id` only
+    that doctor's appointments are touched; other ids are reported as
+    errors. Only booked appointments change. Reschedule moves each one to
+    `new_date`, at `new_time` if given or its current time otherwise,
+    unless that overlaps blocked time or another booking, including ones
+    moved earlier in the same batch, or is already in the past. Reminders
+    sent for the old date are forgotten, so the new date gets its own.
+
+    Status changes, patient notifications and audit rows are written with
+    executemany statements and committed together. Returns one result
+    dict per selected appointment, in date order.
+    """
+    done = BULK_ACTIONS[action]
+    query = db.session.query(
+        Appointment.id,
+        Appointment.doctor_id,
+        Appointment.patient_id,
+        Appointment.appointment_date,
+        Appointment.appointment_time,
+        Appointment.duration_minutes,
+        Appointment.status,
+        Patient.user_id
+    ).join(Patient, Appointment.patient_id == Patient.id)
+    if appointment_ids is not None:
+        query = query.filter(Appointment.id.in_(appointment_ids))
+    else:
+        query = query.filter(Appointment.status == 'Booked')
+        if doctor_id:
+            query = query.filter(Appointment.doctor_id == doctor_id)
+    if start_date:
+        query = query.filter(Appointment.appointment_date >= start_date)
+    if end_date:
+        query = query.filter(Appointment.appointment_date <= end_date)
+    rows = query.order_by(Appointment.appointment_date, Appointment.appointment_time, Appointment.id).all()
+
+    results = []
+    for missing in sorted(set(appointment_ids or ()) - {row.id for row in rows}):
+        results.append(dict(_result(None, False, 'Appointment not found'), appointment_id=missing))
+
+    eligible = []
+    for row in rows:
+        if doctor_id and row.doctor_id != doctor_id:
+            results.append(_result(row, False, 'Not your appointment'))
+        elif row.status != 'Booked':
+            results.append(_result(row, False, f'Only booked appointments can be {done}'))
+        else:
+            eligible.append(row)
+
+    if action == 'reschedule':
+        changes, placed = _reschedule(eligible, new_date, new_time, results)
+    else:
+        changes = [{'id': row.id, 'status': STATUS_AFTER[action]} for row in eligible]
+        placed = eligible
+        for row in eligible:
+            results.append(_result(row, True, done.capitalize()))
+
+    now = datetime.utcnow()
+    notifications, audits = [], []
+    for row in placed:
+        when = f'{row.appointment_date} at {row.appointment_time.strftime("%H:%M")}'
+        if action == 'reschedule':
+            moved_to = next(change for change in changes if change['id'] == row.id)
+            message = (f'Your appointment on {when} has been moved to {moved_to["appointment_date"]} '
+                       f'at {moved_to["appointment_time"].strftime("%H:%M")}')
+        elif action == 'cancel':
+            message = f'Your appointment on {when} has been cancelled'
+        else:
+            message = f'Your appointment on {row.appointment_date} has been completed'
+        if reason and action != 'complete':
+            message += f': {reason}'
+        notifications.append({'user_id': row.user_id, 'message': message, 'is_read': False, 'created_at': now})
+        audits.append({
+            'user_id': actor_user_id,
+            'action': 'UPDATE',
+            'entity_type': 'Appointment',
+            'entity_id': row.id,
+            'details': f'Bulk {action}: appointment {row.id} on {when}' + (f' ({reason})' if reason else ''),
+            'created_at': now
+        })
+
+    if changes:
+        db.session.execute(update(Appointment), changes)
+        db.session.execute(insert(Notification), notifications)
+        db.session.execute(insert(AuditLog), audits)
+        if action == 'reschedule':
+            db.session.execute(delete(ReminderLog).where(ReminderLog.appointment_id.in_([row.id for row in placed])))
+    db.session.commit()
+
+    if changes:
+        for user_id in {row.user_id for row in placed}:
+            publish_unread_count(user_id)
+        doctor_days = {(row.doctor_id, row.appointment_date) for row in placed}
+        doctor_days |= {(row.doctor_id, new_date) for row in placed} if action == 'reschedule' else set()
+        signals.appointment_changed.send(doctor_ids={row.doctor_id for row in placed},
+                                         patient_ids={row.patient_id for row in placed},
+                                         appointment_ids=[row.id for row in placed],
+                                         doctor_days=doctor_days)
+
+    results.sort(key=lambda result: (result['date'] is None, result['date'] or '', result['time'] or '',
+                                     result['appointment_id']))
+    return results
+
+def _reschedule(rows, new_date, new_time, results):
+    """Place each row on new_date; returns (update dicts, rows moved) and appends results"""
+    doctor_ids = {row.doctor_id for row in rows}
+    schedule = load_schedule(doctor_ids, new_date, new_date)
+
+    # Bookings on the target day, including batch rows already on it,
+    # which release their old interval only when they move
+    bookings = defaultdict(IntervalIndex)
+    for other_doctor, start, duration in db.session.query(
+        Appointment.doctor_id, Appointment.appointment_time, Appointment.duration_minutes
+    ).filter(
+        Appointment.doctor_id.in_(doctor_ids),
+        Appointment.appointment_date == new_date,
+        Appointment.status.in_(['Booked', 'Completed'])
+    ):
+        bookings[other_doctor].add(start, slot_end(start, duration))
+
+    now = datetime.now()
+    changes, placed = [], []
+    for row in rows:
+        index = bookings[row.doctor_id]
+        current = (row.appointment_time, slot_end(row.appointment_time, row.duration_minutes))
+        start = new_time or row.appointment_time
+        end = slot_end(start, row.duration_minutes)
+        if row.appointment_date == new_date:
+            if start == row.appointment_time:
+                results.append(_result(row, False, 'Already scheduled at that time'))
+                continue
+            index.remove(*current)
+
+        if datetime.combine(new_date, start) <= now:
+            message = 'That time has already passed'
+        elif not within_working_hours(start, end):
+            message = 'Outside working hours'
+        elif schedule.is_blocked(row.doctor_id, new_date, start, end):
+            message = 'Doctor is unavailable at that time'
+        elif index.overlaps(start, end):
+            message = 'Conflicts with another booking'
+        else:
+            message = None
+
+        if message:
+            if row.appointment_date == new_date:
+                index.add(*current)
+            results.append(_result(row, False, message))
+            continue
+        index.add(start, end)
+        changes.append({'id': row.id, 'appointment_date': new_date, 'appointment_time': start})
+        placed.append(row)
+        results.append(_result(row, True, f'Moved to {new_date} at {start.strftime("%H:%M")}'))
+    return changes, placed
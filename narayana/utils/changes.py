@@ -0,0 +1,145 @@
+from datetime import datetime, timedelta
+from sqlalchemy import event, func, inspect, select
+from models import db, Appointment, Bill, ChangeEvent, Treatment
+from utils.shards import RoutingSession
+
+# Models whose changes downstream systems (lab, pharmacy, accounting) follow
+TRACKED_MODELS = (Appointment, Treatment, Bill)
+TRACKED_TABLES = {model.__table__.name: model for model in TRACKED_MODELS}
+
+DEFAULT_BATCH_SIZE = 1000
+MAX_BATCH_SIZE = 10000
+
+class CursorExpired(Exception):
+    """The events after a consumer's cursor were purged; it has to resync from the tables"""
+
+# Only updates list their columns; an insert or delete concerns the whole row
+def _event(entity, entity_id, operation, columns, now):
+    return {'entity': entity, 'entity_id': entity_id, 'operation': operation,
+            'changed_columns': ','.join(columns), 'created_at': now}
+
+def _write(connection, events):
+    # Core insert on the connection: part of the same transaction as the
+    # change itself, and invisible to the ORM events that produced it
+    if events:
+        connection.execute(ChangeEvent.__table__.insert(), events)
+
+def _changed_columns(state):
+    return [attr.key for attr in state.mapper.column_attrs if state.attrs[attr.key].history.has_changes()]
+
+def _set_columns(statement, parameters):
+    # _values keeps insertion order, including for ordered_values()
+    return [getattr(key, 'key', key) for key in (statement._values or {})] + list(parameters or {})
+
+def _after_flush(session, flush_context):
+    now = datetime.utcnow()
+    events = []
+    for objects, operation in ((session.new, 'insert'), (session.dirty, 'update'), (session.deleted, 'delete')):
+        for obj in objects:
+            if not isinstance(obj, TRACKED_MODELS):
+                continue
+            state = inspect(obj)
+            columns = _changed_columns(state) if operation == 'update' else []
+            if operation == 'update' and not columns:
+                continue
+            events.append(_event(state.mapper.local_table.name, state.mapper.primary_key_from_instance(obj)[0],
+                                 operation, columns, now))
+    _write(session.connection(), events)
+
+def _on_orm_execute(state):
+    # Bulk INSERT/UPDATE/DELETE statements skip the unit of work, so
+    # after_flush never sees them; capture them here instead
+    if not (state.is_insert or state.is_update or state.is_delete):
+        return None
+    table = getattr(state.statement, 'table', None)
+    model = TRACKED_TABLES.get(getattr(table, 'name', None))
+    if model is None:
+        return None
+
+    primary_key = model.__table__.c.id
+    rows = state.parameters if state.is_executemany else [state.parameters or {}]
+    now = datetime.utcnow()
+
+    if state.is_insert:
+        if not state.is_executemany or state.statement._returning:
+            return None
+        if all(row.get('id') is not None for row in rows):
+            ids = [row['id'] for row in rows]
+            result = state.invoke_statement()
+        else:
+            # SQLite gives each new row the next rowid, and this transaction
+            # holds the write lock, so the new ids follow the current maximum
+            # in parameter order. (RETURNING gets slow on large executemany
+            # batches.)
+            last_id = state.session.execute(select(func.max(primary_key))).scalar() or 0
+            result = state.invoke_statement()
+            ids = state.session.execute(
+                select(primary_key).where(primary_key > last_id).order_by(primary_key)
+            ).scalars().all()
+        _write(state.session.connection(), [
+            _event(table.name, entity_id, 'insert', (), now) for entity_id in ids
+        ])
+        return result
+
+    operation = 'update' if state.is_update else 'delete'
+    if state.is_executemany:
+        # Bulk UPDATE by primary key: every parameter set names its row
+        events = [_event(table.name, row['id'], operation, [key for key in row if key != 'id'], now)
+                  for row in rows]
+        result = state.invoke_statement()
+    else:
+        # UPDATE/DELETE ... WHERE: find the rows it will touch first
+        query = select(primary_key)
+        if state.statement.whereclause is not None:
+            query = query.where(state.statement.whereclause)
+        ids = state.session.execute(query).scalars().all()
+        columns = [] if state.is_delete else _set_columns(state.statement, state.parameters)
+        events = [_event(table.name, entity_id, operation, columns, now) for entity_id in ids]
+        result = state.invoke_statement()
+    _write(state.session.connection(), events)
+    return result
+
+def connect_change_capture():
+    """Record every change to the tracked models in change_events"""
+    if not event.contains(RoutingSession, 'after_flush', _after_flush):
+        event.listen(RoutingSession, 'after_flush', _after_flush)
+        event.listen(RoutingSession, 'do_orm_execute', _on_orm_execute)
+
+def get_changes(after=0, limit=DEFAULT_BATCH_SIZE, entities=None):
+    """Events with a sequence number above `after`, oldest first.
+
+    Returns (events, next_cursor, has_more); pass next_cursor back as
+    `after` to resume. Raises CursorExpired when events after a non-zero
+    cursor have been purged. A cursor of 0 starts at the oldest event kept.
+    """
+    if after:
+        oldest = db.session.query(func.min(ChangeEvent.id)).scalar()
+        if oldest is not None and after < oldest - 1:
+            raise CursorExpired(f'Events up to {oldest - 1} have been purged')
+
+    query = db.session.query(
+        ChangeEvent.id, ChangeEvent.entity, ChangeEvent.entity_id,
+        ChangeEvent.operation, ChangeEvent.changed_columns, ChangeEvent.created_at
+    ).filter(ChangeEvent.id > after)
+    if entities:
+        query = query.filter(ChangeEvent.entity.in_(entities))
+    rows = query.order_by(ChangeEvent.id).limit(limit + 1).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    events = [{
+        'seq': seq,
+        'entity': entity,
+        'entity_id': entity_id,
+        'operation': operation,
+        'columns': columns.split(',') if columns else [],
+        'at': created_at.isoformat() if created_at else None
+    } for seq, entity, entity_id, operation, columns, created_at in rows]
+    return events, rows[-1][0] if rows else after, has_more
+
+def purge_change_events(retention_days):
+    """Delete change events older than the retention window; returns the number deleted"""
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    deleted = ChangeEvent.query.filter(ChangeEvent.created_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
@@ -0,0 +1,199 @@
+import os
+import re
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import case, func, select, update
+from sqlalchemy.orm import aliased
+from models import db, Appointment, AuditLog, Bill, ClaimBatch, Doctor, Patient, User
+from utils import signals
+from utils.exports import DEFAULT_CHUNK_SIZE, iter_chunks, write_csv
+from utils.shards import current_facility
+
+# Bills per claim file; larger queues for one insurer are split
+DEFAULT_MAX_BILLS = 5000
+
+# Share of a bill claimed from the insurer when the bill has no insurance amount yet
+DEFAULT_COVERAGE = 0.8
+
+def _eligible(query):
+    # Not batched or claimed yet, not cancelled, and the patient is insured.
+    # claim_batch_id IS NULL is answered from ix_bills_claim_batch.
+    return query.join(Patient, Bill.patient_id == Patient.id).where(
+        Bill.claim_batch_id.is_(None),
+        Bill.insurance_claimed.is_not(True),
+        Bill.payment_status != 'Cancelled',
+        Bill.total_amount > 0,
+        Patient.insurance_provider.is_not(None),
+        Patient.insurance_provider != ''
+    )
+
+def claim_queue():
+    """Bills waiting to be claimed, per insurer: [{'insurance_provider', 'bills', 'billed'}]"""
+    rows = db.session.execute(_eligible(select(
+        Patient.insurance_provider, func.count(Bill.id), func.coalesce(func.sum(Bill.total_amount), 0.0)
+    )).group_by(Patient.insurance_provider).order_by(Patient.insurance_provider))
+    return [{'insurance_provider': provider, 'bills': bills, 'billed': round(billed, 2)}
+            for provider, bills, billed in rows]
+
+def create_claim_batches(actor_user_id, max_bills=None):
+    """Put every eligible bill into a claim batch for its patient's insurer and commit.
+
+    Each batch takes up to `max_bills` bills with one set-based UPDATE
+    that also re-checks eligibility, so concurrent runs never put a bill
+    in two batches. Returns the new batches.
+    """
+    max_bills = max_bills or current_app.config.get('CLAIM_BATCH_SIZE', DEFAULT_MAX_BILLS)
+    coverage = current_app.config.get('CLAIM_COVERAGE', DEFAULT_COVERAGE)
+    now = datetime.utcnow()
+    batches = []
+    for queued in claim_queue():
+        provider = queued['insurance_provider']
+        while True:
+            batch = ClaimBatch(insurance_provider=provider, status='Pending', created_by=actor_user_id,
+                               created_at=now)
+            db.session.add(batch)
+            db.session.flush()
+            bill_ids = _eligible(select(Bill.id)).where(
+                Patient.insurance_provider == provider
+            ).order_by(Bill.id).limit(max_bills)
+            assigned = db.session.execute(update(Bill).where(Bill.id.in_(bill_ids.scalar_subquery())).values(
+                claim_batch_id=batch.id,
+                claim_status='Batched',
+                insurance_amount=case(
+                    (Bill.insurance_amount > 0, Bill.insurance_amount),
+                    else_=func.round(Bill.total_amount * coverage, 2)
+                ),
+                updated_at=now
+            ).execution_options(synchronize_session=False)).rowcount
+            if not assigned:
+                db.session.delete(batch)
+                break
+            batch.bill_count, batch.claimed_amount = db.session.execute(
+                select(func.count(Bill.id), func.coalesce(func.sum(Bill.insurance_amount), 0.0)).where(
+                    Bill.claim_batch_id == batch.id
+                )
+            ).one()
+            batch.claimed_amount = round(batch.claimed_amount, 2)
+            db.session.add(AuditLog(user_id=actor_user_id, action='CREATE', entity_type='ClaimBatch',
+                                    entity_id=batch.id,
+                                    details=f'Batched {batch.bill_count} bills for {provider}'))
+            batches.append(batch)
+            if assigned < max_bills:
+                break
+    db.session.commit()
+    return batches
+
+def _claim_lines_query(batch_id):
+    patient_user = aliased(User)
+    doctor_user = aliased(User)
+    return select(
+        Bill.claim_batch_id.label('batch_id'),
+        Bill.id.label('bill_id'),
+        Patient.insurance_provider,
+        Patient.insurance_number,
+        Patient.medical_id,
+        patient_user.username.label('patient'),
+        Appointment.appointment_date,
+        doctor_user.username.label('doctor'),
+        Doctor.specialization,
+        Bill.consultation_fee,
+        Bill.lab_charges,
+        Bill.medicine_charges,
+        Bill.procedure_charges,
+        Bill.other_charges,
+        Bill.tax_amount,
+        Bill.discount_amount,
+        Bill.total_amount,
+        Bill.insurance_amount.label('claimed_amount')
+    ).join(Patient, Bill.patient_id == Patient.id).join(
+        patient_user, Patient.user_id == patient_user.id
+    ).join(Appointment, Bill.appointment_id == Appointment.id).join(
+        Doctor, Bill.doctor_id == Doctor.id
+    ).join(doctor_user, Doctor.user_id == doctor_user.id).where(
+        Bill.claim_batch_id == batch_id
+    ).order_by(Bill.id)
+
+def claims_dir():
+    """Where the current facility's claim files are written"""
+    base = current_app.config.get('CLAIMS_DIR') or os.path.join(current_app.instance_path, 'claims')
+    return os.path.join(base, current_facility())
+
+def claim_filename(batch):
+    provider = re.sub(r'[^a-z0-9]+', '-', batch.insurance_provider.lower()).strip('-') or 'insurer'
+    return f'claims-{batch.id:06d}-{provider}.csv'
+
+def claim_file_path(batch):
+    """Path of the batch's written claim file, or None if there is none"""
+    if not batch.filename:
+        return None
+    path = os.path.join(claims_dir(), batch.filename)
+    return path if os.path.isfile(path) else None
+
+def submit_claim_batch(batch_id):
+    """Write a batch's claim file and mark its bills claimed; returns the batch.
+
+    Safe to run again for a batch that failed: its bills stay assigned to
+    it, the file is rewritten in full under a temporary name and moved into
+    place, and the bills are marked claimed in the same transaction as
+    the batch is completed. A completed batch is left alone.
+    """
+    batch = db.session.get(ClaimBatch, batch_id)
+    if batch is None or batch.status == 'Completed':
+        return batch
+
+    attempts = (batch.attempts or 0) + 1
+    try:
+        os.makedirs(claims_dir(), exist_ok=True)
+        filename = claim_filename(batch)
+        path = os.path.join(claims_dir(), filename)
+        rows = write_csv(iter_chunks(_claim_lines_query(batch.id),
+                                     current_app.config.get('EXPORT_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)),
+                         path + '.tmp')
+        os.replace(path + '.tmp', path)
+
+        now = datetime.utcnow()
+        claimed = db.session.execute(update(Bill).where(
+            Bill.claim_batch_id == batch.id,
+            Bill.claim_status.is_distinct_from('Claimed')
+        ).values(claim_status='Claimed', insurance_claimed=True, updated_at=now).execution_options(
+            synchronize_session=False
+        )).rowcount
+        batch.status = 'Completed'
+        batch.filename = filename
+        batch.bill_count = rows
+        batch.attempts = attempts
+        batch.error = None
+        batch.completed_at = now
+        db.session.commit()
+    except Exception as exc:
+        db.session.rollback()
+        batch = db.session.get(ClaimBatch, batch_id)
+        batch.status = 'Failed'
+        batch.attempts = attempts
+        batch.error = str(exc)
+        db.session.commit()
+        return batch
+
+    if claimed:
+        patient_ids = db.session.execute(
+            select(Bill.patient_id).where(Bill.claim_batch_id == batch.id).distinct()
+        ).scalars().all()
+        signals.bill_changed.send(patient_ids=patient_ids)
+    return batch
+
+def process_claims(actor_user_id, max_bills=None):
+    """Batch the claim queue, then write every pending or failed batch's file.
+
+    Returns (batches created, batches completed, batches failed).
+    """
+    created = create_claim_batches(actor_user_id, max_bills)
+    pending = db.session.execute(
+        select(ClaimBatch.id).where(ClaimBatch.status.in_(('Pending', 'Failed'))).order_by(ClaimBatch.id)
+    ).scalars().all()
+    completed = failed = 0
+    for batch_id in pending:
+        if submit_claim_batch(batch_id).status == 'Completed':
+            completed += 1
+        else:
+            failed += 1
+    return len(created), completed, failed
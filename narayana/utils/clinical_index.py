@@ -0,0 +1,294 @@
+import csv
+import re
+import unicodedata
+from datetime import date, datetime, timedelta
+from sqlalchemy import and_, delete, func, insert, or_, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import aliased
+from models import db, Appointment, ClinicalCode, ClinicalTerm, Doctor, Patient, Treatment, User
+
+FIELDS = ('diagnosis', 'prescription')
+
+# Code mappings may name phrases of up to this many normalized words
+MAX_PHRASE_WORDS = 3
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+MAX_TREND_MONTHS = 60
+
+# Keeps each IN (...) list well under SQLite's bound-parameter limit
+REFRESH_BATCH_SIZE = 500
+
+# Filler, frequency and dosage-form words carry nothing to search for
+STOPWORDS = frozenset('''
+    a an and as at by due for from in into of on or per the to with without
+    daily once twice thrice times day days week weeks hourly morning night bedtime needed prn
+    tab tabs tablet tablets cap caps capsule capsules dose doses drop drops puff puffs
+'''.split())
+
+_TOKEN = re.compile(r'[a-z0-9]+(?:\.[a-z0-9]+)*')
+_DOSE = re.compile(r'^\d+(?:\.\d+)?(?:mg|mcg|ug|g|kg|ml|l|iu|units?|x)?$')
+
+def normalize(text):
+    """Lowercase, ASCII-folded search tokens of `text`, without stopwords and doses"""
+    if not text:
+        return []
+    folded = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode().lower()
+    return [token for token in _TOKEN.findall(folded)
+            if len(token) > 1 and token not in STOPWORDS and not _DOSE.match(token)]
+
+def load_code_map():
+    """{(field, normalized term or phrase): code}"""
+    return {(field, term): code for field, term, code in
+            db.session.query(ClinicalCode.field, ClinicalCode.term, ClinicalCode.code)}
+
+def extract_terms(field, text, code_map):
+    """{term: code or None} for `text`: every token, plus each mapped phrase it contains"""
+    tokens = normalize(text)
+    terms = {token: code_map.get((field, token)) for token in tokens}
+    for size in range(2, MAX_PHRASE_WORDS + 1):
+        for start in range(len(tokens) - size + 1):
+            phrase = ' '.join(tokens[start:start + size])
+            code = code_map.get((field, phrase))
+            if code:
+                terms[phrase] = code
+    return terms
+
+def _source_query():
+    return db.session.query(
+        Treatment.id, Appointment.patient_id, Appointment.doctor_id, Appointment.appointment_date,
+        Treatment.diagnosis, Treatment.prescription
+    ).join(Appointment, Treatment.appointment_id == Appointment.id)
+
+def _postings(rows, code_map):
+    postings = []
+    for treatment_id, patient_id, doctor_id, appointment_date, diagnosis, prescription in rows:
+        for field, text in (('diagnosis', diagnosis), ('prescription', prescription)):
+            for term, code in extract_terms(field, text, code_map).items():
+                postings.append({'term': term, 'field': field, 'code': code, 'treatment_id': treatment_id,
+                                 'patient_id': patient_id, 'doctor_id': doctor_id,
+                                 'appointment_date': appointment_date})
+    return postings
+
+def index_treatments(treatment_ids):
+    """Re-derive the postings of the given treatments in the current transaction.
+
+    The caller commits, so a treatment and its index entries are saved
+    together. Returns the number of postings written.
+    """
+    treatment_ids = sorted({treatment_id for treatment_id in treatment_ids if treatment_id})
+    code_map = load_code_map()
+    written = 0
+    for offset in range(0, len(treatment_ids), REFRESH_BATCH_SIZE):
+        batch = treatment_ids[offset:offset + REFRESH_BATCH_SIZE]
+        db.session.execute(delete(ClinicalTerm).where(ClinicalTerm.treatment_id.in_(batch)))
+        postings = _postings(_source_query().filter(Treatment.id.in_(batch)), code_map)
+        if postings:
+            db.session.execute(insert(ClinicalTerm), postings)
+        written += len(postings)
+    return written
+
+def rebuild_clinical_index(batch_size=5000):
+    """Recompute the whole index from the treatments table and commit; returns the number of postings"""
+    db.session.execute(delete(ClinicalTerm))
+    code_map = load_code_map()
+    query = _source_query().order_by(Treatment.id)
+    written = 0
+    last_id = 0
+    while True:
+        rows = query.filter(Treatment.id > last_id).limit(batch_size).all()
+        if not rows:
+            break
+        postings = _postings(rows, code_map)
+        if postings:
+            db.session.execute(insert(ClinicalTerm), postings)
+        written += len(postings)
+        last_id = rows[-1][0]
+    db.session.commit()
+    return written
+
+def load_codes(path):
+    """Upsert code mappings from a CSV with field, term, code and optional system and description columns.
+
+    Terms are normalized like treatment text, so 'Type 2 Diabetes' and
+    'type-2 diabetes' map alike. Returns the number of mappings loaded;
+    rebuild the index afterwards to apply them to existing treatments.
+    """
+    rows = []
+    with open(path, newline='', encoding='utf-8') as handle:
+        for line, record in enumerate(csv.DictReader(handle), start=2):
+            field = (record.get('field') or '').strip().lower()
+            term = ' '.join(normalize(record.get('term')))
+            code = (record.get('code') or '').strip().upper()
+            if field not in FIELDS or not term or not code:
+                raise ValueError(f'Line {line}: needs a field ({" or ".join(FIELDS)}), a term and a code')
+            if len(term.split()) > MAX_PHRASE_WORDS:
+                raise ValueError(f'Line {line}: terms are limited to {MAX_PHRASE_WORDS} words')
+            rows.append({'field': field, 'term': term, 'code': code,
+                         'system': (record.get('system') or '').strip() or None,
+                         'description': (record.get('description') or '').strip() or None})
+    if rows:
+        statement = sqlite_insert(ClinicalCode)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['field', 'term'],
+            set_={column: statement.excluded[column] for column in ('code', 'system', 'description')}
+        ), rows)
+    db.session.commit()
+    return len(rows)
+
+def _criteria(text, field):
+    """One ClinicalTerm condition per thing a match must contain.
+
+    A known code matches its postings; otherwise every token must appear,
+    and a trailing `*` makes the last one a prefix.
+    """
+    text = (text or '').strip()
+    fields = [field] if field else list(FIELDS)
+    code = db.session.query(ClinicalCode.code).filter(
+        ClinicalCode.code == text.upper(),
+        ClinicalCode.field.in_(fields)
+    ).first()
+    if code:
+        return fields, [ClinicalTerm.code == code[0]]
+
+    tokens = normalize(text.rstrip('*'))
+    if not tokens:
+        raise ValueError('Enter a diagnosis, drug or code to search for')
+    phrase = ' '.join(tokens)
+    if len(tokens) > 1 and db.session.query(ClinicalCode.id).filter(
+        ClinicalCode.term == phrase,
+        ClinicalCode.field.in_(fields)
+    ).first():
+        # Mapped phrases are indexed whole
+        return fields, [ClinicalTerm.term == phrase]
+
+    criteria = [ClinicalTerm.term == token for token in tokens]
+    if text.endswith('*'):
+        # Tokens only contain [a-z0-9.], all of which sort before '{'
+        criteria[-1] = and_(ClinicalTerm.term >= tokens[-1], ClinicalTerm.term < tokens[-1] + '{')
+    return fields, criteria
+
+def _matches(text, field=None, start=None, end=None, doctor_id=None):
+    """Select of (treatment_id, patient_id, doctor_id, appointment_date), one row per matching treatment"""
+    fields, criteria = _criteria(text, field)
+    first, *rest = criteria
+    query = select(
+        ClinicalTerm.treatment_id, ClinicalTerm.patient_id, ClinicalTerm.doctor_id, ClinicalTerm.appointment_date
+    ).where(first, ClinicalTerm.field.in_(fields)).distinct()
+    for condition in rest:
+        query = query.where(ClinicalTerm.treatment_id.in_(
+            select(ClinicalTerm.treatment_id).where(condition, ClinicalTerm.field.in_(fields))
+        ))
+    if start:
+        query = query.where(ClinicalTerm.appointment_date >= start)
+    if end:
+        query = query.where(ClinicalTerm.appointment_date <= end)
+    if doctor_id:
+        query = query.where(ClinicalTerm.doctor_id == doctor_id)
+    return query.subquery()
+
+def encode_cursor(row):
+    return f'{row["appointment_date"].isoformat()}_{row["treatment_id"]}'
+
+def decode_cursor(cursor):
+    """Parse a cursor into (appointment_date, treatment_id), or None if it is malformed"""
+    try:
+        appointment_date, treatment_id = cursor.rsplit('_', 1)
+        return date.fromisoformat(appointment_date), int(treatment_id)
+    except (AttributeError, ValueError):
+        return None
+
+def search_treatments(text, field=None, start=None, end=None, doctor_id=None, cursor=None,
+                      limit=DEFAULT_PAGE_SIZE):
+    """Treatments whose diagnosis or prescription matches `text`, most recent first.
+
+    Returns (summary, results, next_cursor). The summary counts matching
+    treatments and distinct patients; results are plain dicts with the
+    patient, doctor and treatment text. Raises ValueError for an empty
+    search.
+    """
+    matches = _matches(text, field, start, end, doctor_id)
+    treatments, patients = db.session.execute(
+        select(func.count(), func.count(func.distinct(matches.c.patient_id))).select_from(matches)
+    ).one()
+
+    patient_user = aliased(User)
+    doctor_user = aliased(User)
+    query = select(
+        matches.c.treatment_id, matches.c.appointment_date, matches.c.patient_id, matches.c.doctor_id,
+        patient_user.username.label('patient_name'), Patient.medical_id,
+        doctor_user.username.label('doctor_name'), Doctor.specialization,
+        Treatment.diagnosis, Treatment.prescription
+    ).join(Treatment, Treatment.id == matches.c.treatment_id).join(
+        Patient, Patient.id == matches.c.patient_id
+    ).join(patient_user, Patient.user_id == patient_user.id).join(
+        Doctor, Doctor.id == matches.c.doctor_id
+    ).join(doctor_user, Doctor.user_id == doctor_user.id)
+
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        appointment_date, treatment_id = position
+        query = query.where(or_(
+            matches.c.appointment_date < appointment_date,
+            and_(matches.c.appointment_date == appointment_date, matches.c.treatment_id < treatment_id)
+        ))
+    rows = [row._asdict() for row in db.session.execute(
+        query.order_by(matches.c.appointment_date.desc(), matches.c.treatment_id.desc()).limit(limit + 1)
+    )]
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return {'treatments': treatments, 'patients': patients}, rows[:limit], next_cursor
+
+def _months(start, end):
+    current = start.replace(day=1)
+    while current <= end:
+        yield current
+        current = (current + timedelta(days=32)).replace(day=1)
+
+def clinical_trend(text, field=None, start=None, end=None, doctor_id=None):
+    """Matching treatments and distinct patients per month from `start` to `end`, empty months included"""
+    matches = _matches(text, field, start, end, doctor_id)
+    month = func.strftime('%Y-%m', matches.c.appointment_date)
+    counts = {key: (treatments, patients) for key, treatments, patients in db.session.execute(
+        select(month, func.count(), func.count(func.distinct(matches.c.patient_id))).group_by(month)
+    )}
+    return [{'month': current.strftime('%Y-%m'),
+             'treatments': counts.get(current.strftime('%Y-%m'), (0, 0))[0],
+             'patients': counts.get(current.strftime('%Y-%m'), (0, 0))[1]}
+            for current in _months(start, end)]
+
+def top_terms(field, start=None, end=None, doctor_id=None, limit=15):
+    """The most frequent terms of `field`, with their codes, by number of treatments"""
+    treatments = func.count(ClinicalTerm.treatment_id)
+    query = db.session.query(ClinicalTerm.term, func.max(ClinicalTerm.code), treatments).filter(
+        ClinicalTerm.field == field
+    )
+    if start:
+        query = query.filter(ClinicalTerm.appointment_date >= start)
+    if end:
+        query = query.filter(ClinicalTerm.appointment_date <= end)
+    if doctor_id:
+        query = query.filter(ClinicalTerm.doctor_id == doctor_id)
+    return [{'term': term, 'code': code, 'treatments': count}
+            for term, code, count in query.group_by(ClinicalTerm.term).order_by(treatments.desc()).limit(limit)]
+
+def parse_clinical_args(args, today=None):
+    """Validate clinical search arguments; returns keyword arguments for search_treatments() and clinical_trend().
+
+    The range defaults to the last 12 months. Raises ValueError with a
+    message for the user on bad input.
+    """
+    today = today or date.today()
+    field = args.get('field') or None
+    if field and field not in FIELDS:
+        raise ValueError(f'field must be one of {", ".join(FIELDS)}')
+    try:
+        end = datetime.strptime(args['end'], '%Y-%m-%d').date() if args.get('end') else today
+        start = (datetime.strptime(args['start'], '%Y-%m-%d').date() if args.get('start')
+                 else (end - timedelta(days=365)).replace(day=1))
+    except ValueError:
+        raise ValueError('Dates must be in YYYY-MM-DD format')
+    if start > end:
+        raise ValueError('start must not be after end')
+    if len(list(_months(start, end))) > MAX_TREND_MONTHS:
+        raise ValueError(f'Searches are limited to {MAX_TREND_MONTHS} months')
+    return {'text': (args.get('q') or '').strip(), 'field': field, 'start': start, 'end': end}
@@ -0,0 +1,306 @@
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import Integer, delete, func, insert, select, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import (db, Appointment, Availability, Bill, Doctor, DoctorDailyStats, DoctorHourlyStats, Rating,
+                    SpecializationDailyStats, User)
+from utils import signals
+from utils.availability import SLOT_TIMES, load_schedule
+
+STAT_FIELDS = ('booked', 'completed', 'cancelled', 'available_slots', 'revenue', 'rating_sum', 'rating_count')
+STATUS_FIELDS = {'Booked': 'booked', 'Completed': 'completed', 'Cancelled': 'cancelled'}
+# Kept by the hourly and specialization rollups that serve utils.trends
+TREND_FIELDS = ('booked', 'completed', 'cancelled', 'revenue')
+
+def _empty_cell():
+    cell = dict.fromkeys(STAT_FIELDS, 0)
+    cell['revenue'] = 0.0
+    cell['available_slots'] = len(SLOT_TIMES)
+    return cell
+
+def _as_date(value):
+    # func.date() returns ISO strings on SQLite
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+def _scoped(query, doctor_column, day_column, doctor_ids, start, end, timestamps=False):
+    if doctor_ids is not None:
+        query = query.filter(doctor_column.in_(doctor_ids))
+    if timestamps:
+        if start:
+            query = query.filter(day_column >= datetime.combine(start, time.min))
+        if end:
+            query = query.filter(day_column < datetime.combine(end + timedelta(days=1), time.min))
+    else:
+        if start:
+            query = query.filter(day_column >= start)
+        if end:
+            query = query.filter(day_column <= end)
+    return query
+
+def compute_doctor_days(doctor_ids=None, start=None, end=None, include=()):
+    """Compute rollup values from the source tables with four grouped queries.
+
+    Returns {(doctor_id, day): values} for every doctor-day in range that
+    has appointments, blocked slots, payments or ratings, plus the
+    (doctor_id, day) pairs in `include`. Available slots come from the
+    availability engine, so availability rules count as well.
+    """
+    cells = defaultdict(_empty_cell)
+
+    appointments = _scoped(db.session.query(
+        Appointment.doctor_id, Appointment.appointment_date, Appointment.status, func.count(Appointment.id)
+    ), Appointment.doctor_id, Appointment.appointment_date, doctor_ids, start, end).group_by(
+        Appointment.doctor_id, Appointment.appointment_date, Appointment.status
+    )
+    for doctor_id, day, status, count in appointments:
+        field = STATUS_FIELDS.get(status)
+        if field:
+            cells[(doctor_id, day)][field] += count
+
+    # Days with single-slot blocks get a row even without other activity
+    blocked_days = _scoped(db.session.query(
+        Availability.doctor_id, Availability.date
+    ), Availability.doctor_id, Availability.date, doctor_ids, start, end).filter(
+        Availability.is_available == False
+    ).distinct()
+    for key in list(blocked_days) + list(include):
+        cells.setdefault(tuple(key), _empty_cell())
+
+    paid_day = func.date(Bill.payment_date)
+    revenue = _scoped(db.session.query(
+        Bill.doctor_id, paid_day, func.sum(Bill.total_amount)
+    ), Bill.doctor_id, Bill.payment_date, doctor_ids, start, end, timestamps=True).filter(
+        Bill.payment_status == 'Paid'
+    ).group_by(Bill.doctor_id, paid_day)
+    for doctor_id, day, amount in revenue:
+        cells[(doctor_id, _as_date(day))]['revenue'] = round(amount or 0.0, 2)
+
+    rated_day = func.date(Rating.created_at)
+    ratings = _scoped(db.session.query(
+        Rating.doctor_id, rated_day, func.sum(Rating.rating), func.count(Rating.id)
+    ), Rating.doctor_id, Rating.created_at, doctor_ids, start, end, timestamps=True).group_by(
+        Rating.doctor_id, rated_day
+    )
+    for doctor_id, day, total, count in ratings:
+        cell = cells[(doctor_id, _as_date(day))]
+        cell['rating_sum'] = total or 0
+        cell['rating_count'] = count
+
+    schedule = load_schedule(doctor_ids, start, end)
+    for (doctor_id, day), cell in cells.items():
+        cell['available_slots'] = len(schedule.open_slots(doctor_id, day))
+    return cells
+
+def compute_doctor_hours(doctor_ids=None, start=None, end=None):
+    """Hourly appointment counts (by start time) and revenue (by payment time).
+
+    Returns {(doctor_id, day, hour): values} for every hour in range with
+    any activity, from two grouped queries.
+    """
+    cells = defaultdict(lambda: dict(dict.fromkeys(TREND_FIELDS, 0), revenue=0.0))
+
+    hour = func.cast(func.strftime('%H', Appointment.appointment_time), Integer)
+    appointments = _scoped(db.session.query(
+        Appointment.doctor_id, Appointment.appointment_date, hour, Appointment.status, func.count(Appointment.id)
+    ), Appointment.doctor_id, Appointment.appointment_date, doctor_ids, start, end).group_by(
+        Appointment.doctor_id, Appointment.appointment_date, hour, Appointment.status
+    )
+    for doctor_id, day, hour_of_day, status, count in appointments:
+        field = STATUS_FIELDS.get(status)
+        if field:
+            cells[(doctor_id, day, hour_of_day)][field] += count
+
+    paid_day = func.date(Bill.payment_date)
+    paid_hour = func.cast(func.strftime('%H', Bill.payment_date), Integer)
+    revenue = _scoped(db.session.query(
+        Bill.doctor_id, paid_day, paid_hour, func.sum(Bill.total_amount)
+    ), Bill.doctor_id, Bill.payment_date, doctor_ids, start, end, timestamps=True).filter(
+        Bill.payment_status == 'Paid'
+    ).group_by(Bill.doctor_id, paid_day, paid_hour)
+    for doctor_id, day, hour_of_day, amount in revenue:
+        cells[(doctor_id, _as_date(day), hour_of_day)]['revenue'] = round(amount or 0.0, 2)
+    return cells
+
+def _refresh_doctor_hours(doctor_days):
+    """Replace the hourly rows of the given (doctor_id, day) pairs; the caller commits"""
+    days = [day for _, day in doctor_days]
+    cells = compute_doctor_hours({doctor_id for doctor_id, _ in doctor_days}, min(days), max(days))
+    db.session.execute(delete(DoctorHourlyStats).where(
+        tuple_(DoctorHourlyStats.doctor_id, DoctorHourlyStats.day).in_(list(doctor_days))
+    ))
+    rows = [dict(values, doctor_id=doctor_id, day=day, hour=hour)
+            for (doctor_id, day, hour), values in cells.items() if (doctor_id, day) in doctor_days]
+    if rows:
+        db.session.execute(insert(DoctorHourlyStats), rows)
+
+def _refresh_specialization_days(days=None):
+    """Re-sum specialization_daily_stats for `days` (all days when None) from the daily rollups; the caller commits"""
+    totals = select(
+        DoctorDailyStats.day, Doctor.specialization,
+        *[func.sum(getattr(DoctorDailyStats, field)) for field in TREND_FIELDS]
+    ).join(Doctor, DoctorDailyStats.doctor_id == Doctor.id).group_by(DoctorDailyStats.day, Doctor.specialization)
+    cleared = delete(SpecializationDailyStats)
+    if days is not None:
+        totals = totals.where(DoctorDailyStats.day.in_(days))
+        cleared = cleared.where(SpecializationDailyStats.day.in_(days))
+    db.session.execute(cleared)
+    db.session.execute(insert(SpecializationDailyStats).from_select(('day', 'specialization') + TREND_FIELDS, totals))
+
+def refresh_doctor_days(doctor_days):
+    """Recompute and upsert the rollup rows for the given (doctor_id, day) pairs"""
+    doctor_days = {(doctor_id, day) for doctor_id, day in doctor_days if doctor_id and day}
+    if not doctor_days:
+        return 0
+
+    days = [day for _, day in doctor_days]
+    cells = compute_doctor_days({doctor_id for doctor_id, _ in doctor_days}, min(days), max(days),
+                                include=doctor_days)
+    now = datetime.utcnow()
+    rows = [dict(cells[key], doctor_id=key[0], day=key[1], updated_at=now) for key in doctor_days]
+
+    statement = sqlite_insert(DoctorDailyStats)
+    statement = statement.on_conflict_do_update(
+        index_elements=['doctor_id', 'day'],
+        set_={field: statement.excluded[field] for field in STAT_FIELDS + ('updated_at',)}
+    )
+    db.session.execute(statement, rows)
+    _refresh_doctor_hours(doctor_days)
+    _refresh_specialization_days(sorted(set(days)))
+    db.session.commit()
+    return len(rows)
+
+def rollup_days(doctor_id, start, end=None):
+    """(doctor_id, day) pairs of a doctor's existing rollup rows from `start` through `end`.
+
+    An availability rule can cover an unbounded range; only days that
+    already have a row need refreshing, the others are derived on read.
+    """
+    query = db.session.query(DoctorDailyStats.day).filter(
+        DoctorDailyStats.doctor_id == doctor_id,
+        DoctorDailyStats.day >= start
+    )
+    if end:
+        query = query.filter(DoctorDailyStats.day <= end)
+    return [(doctor_id, day) for day, in query]
+
+def rebuild_doctor_stats(batch_size=5000):
+    """Recompute every doctor and specialization rollup row from scratch; returns the number of doctor-day rows"""
+    cells = compute_doctor_days()
+    now = datetime.utcnow()
+    rows = [dict(values, doctor_id=doctor_id, day=day, updated_at=now)
+            for (doctor_id, day), values in cells.items()]
+    hourly = [dict(values, doctor_id=doctor_id, day=day, hour=hour)
+              for (doctor_id, day, hour), values in compute_doctor_hours().items()]
+
+    db.session.execute(delete(DoctorDailyStats))
+    db.session.execute(delete(DoctorHourlyStats))
+    for offset in range(0, len(rows), batch_size):
+        db.session.execute(insert(DoctorDailyStats), rows[offset:offset + batch_size])
+    for offset in range(0, len(hourly), batch_size):
+        db.session.execute(insert(DoctorHourlyStats), hourly[offset:offset + batch_size])
+    _refresh_specialization_days()
+    db.session.commit()
+    return len(rows)
+
+def _days(start, end):
+    return [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+
+def _utilization(booked, completed, available_slots):
+    return round((booked + completed) / available_slots, 4) if available_slots else 0.0
+
+def doctor_performance(start, end):
+    """Per-doctor totals over [start, end] read from the rollup table.
+
+    Days without a rollup row had no activity and the full default
+    schedule available, less any availability rules, which the
+    utilization denominator accounts for.
+    """
+    period_days = (end - start).days + 1
+    schedule = load_schedule(start=start, end=end, blocks=False)
+    ruled = schedule.rule_doctor_ids()
+    row_days = defaultdict(set)
+    if ruled:
+        for doctor_id, day in db.session.query(DoctorDailyStats.doctor_id, DoctorDailyStats.day).filter(
+            DoctorDailyStats.doctor_id.in_(ruled),
+            DoctorDailyStats.day >= start,
+            DoctorDailyStats.day <= end
+        ):
+            row_days[doctor_id].add(day)
+
+    totals = db.session.query(
+        DoctorDailyStats.doctor_id,
+        func.count(DoctorDailyStats.id),
+        *[func.sum(getattr(DoctorDailyStats, field)) for field in STAT_FIELDS]
+    ).filter(
+        DoctorDailyStats.day >= start,
+        DoctorDailyStats.day <= end
+    ).group_by(DoctorDailyStats.doctor_id)
+    by_doctor = {row[0]: (row[1], dict(zip(STAT_FIELDS, row[2:]))) for row in totals}
+
+    performance = []
+    doctors = db.session.query(Doctor.id, User.username, Doctor.specialization, Doctor.rating).join(
+        User, Doctor.user_id == User.id
+    ).order_by(User.username)
+    for doctor_id, username, specialization, rating in doctors:
+        row_count, values = by_doctor.get(doctor_id, (0, dict.fromkeys(STAT_FIELDS, 0)))
+        values = {field: value or 0 for field, value in values.items()}
+        if doctor_id in ruled:
+            available = values['available_slots'] + sum(
+                len(schedule.open_slots(doctor_id, day)) for day in _days(start, end) if day not in row_days[doctor_id]
+            )
+        else:
+            available = values['available_slots'] + len(SLOT_TIMES) * (period_days - row_count)
+        performance.append({
+            'doctor_id': doctor_id,
+            'username': username,
+            'specialization': specialization,
+            'booked': values['booked'],
+            'completed': values['completed'],
+            'cancelled': values['cancelled'],
+            'available_slots': available,
+            'utilization': _utilization(values['booked'], values['completed'], available),
+            'revenue': round(values['revenue'], 2),
+            'rating': rating or 0.0,
+            'period_rating': round(values['rating_sum'] / values['rating_count'], 2) if values['rating_count'] else None
+        })
+    return performance
+
+def doctor_trend(doctor_id, start, end):
+    """One entry per day in [start, end] for a doctor, read from the rollup table"""
+    rows = {row.day: row for row in DoctorDailyStats.query.filter(
+        DoctorDailyStats.doctor_id == doctor_id,
+        DoctorDailyStats.day >= start,
+        DoctorDailyStats.day <= end
+    )}
+    schedule = load_schedule([doctor_id], start, end, blocks=False)
+
+    trend = []
+    for day in _days(start, end):
+        row = rows.get(day)
+        if row:
+            values = {field: getattr(row, field) or 0 for field in STAT_FIELDS}
+        else:
+            values = _empty_cell()
+            values['available_slots'] = len(schedule.open_slots(doctor_id, day))
+        values['day'] = day
+        values['utilization'] = _utilization(values['booked'], values['completed'], values['available_slots'])
+        values['rating'] = round(values['rating_sum'] / values['rating_count'], 2) if values['rating_count'] else None
+        trend.append(values)
+    return trend
+
+def trend_totals(trend):
+    """Sum a doctor_trend() series into period totals"""
+    totals = {field: sum(day[field] for day in trend) for field in STAT_FIELDS}
+    totals['revenue'] = round(totals['revenue'], 2)
+    totals['utilization'] = _utilization(totals['booked'], totals['completed'], totals['available_slots'])
+    totals['rating'] = round(totals['rating_sum'] / totals['rating_count'], 2) if totals['rating_count'] else None
+    return totals
+
+def _on_change(sender, doctor_days=(), **extra):
+    refresh_doctor_days(doctor_days)
+
+def connect_doctor_stats():
+    """Keep the rollups current from appointment, availability, bill and rating signals"""
+    for signal in (signals.appointment_changed, signals.availability_changed,
+                   signals.bill_changed, signals.rating_changed):
+        signal.connect(_on_change)
@@ -0,0 +1,346 @@
+import csv
+import glob
+import json
+import os
+import re
+import socket
+import time
+import uuid
+from datetime import date, datetime, time as dt_time, timedelta
+from decimal import Decimal
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+from models import db, Appointment, Bill, AuditLog, Doctor, Patient, User
+from utils.shards import current_facility, facility_context
+
+EXPORT_FORMATS = ('csv', 'parquet')
+DEFAULT_CHUNK_SIZE = 5000
+
+# Job ids are uuid4 hex strings; anything else never names a job file
+JOB_ID = re.compile(r'[0-9a-f]{32}')
+
+def _appointments_query():
+    doctor_user = aliased(User)
+    patient_user = aliased(User)
+    return select(
+        Appointment.id,
+        Appointment.appointment_date,
+        Appointment.appointment_time,
+        Appointment.status,
+        Appointment.doctor_id,
+        doctor_user.username.label('doctor'),
+        Doctor.specialization,
+        Appointment.patient_id,
+        patient_user.username.label('patient'),
+        Patient.medical_id,
+        Appointment.created_at
+    ).join(Doctor, Appointment.doctor_id == Doctor.id).join(
+        doctor_user, Doctor.user_id == doctor_user.id
+    ).join(Patient, Appointment.patient_id == Patient.id).join(
+        patient_user, Patient.user_id == patient_user.id
+    )
+
+def _bills_query():
+    return select(
+        Bill.id,
+        Bill.appointment_id,
+        Bill.patient_id,
+        Bill.doctor_id,
+        Bill.consultation_fee,
+        Bill.lab_charges,
+        Bill.medicine_charges,
+        Bill.procedure_charges,
+        Bill.other_charges,
+        Bill.subtotal,
+        Bill.tax_amount,
+        Bill.discount_amount,
+        Bill.total_amount,
+        Bill.payment_status,
+        Bill.payment_method,
+        Bill.payment_date,
+        Bill.transaction_id,
+        Bill.insurance_claimed,
+        Bill.insurance_amount,
+        Bill.created_at
+    )
+
+def _audit_logs_query():
+    return select(
+        AuditLog.id,
+        AuditLog.created_at,
+        AuditLog.user_id,
+        User.username,
+        AuditLog.action,
+        AuditLog.entity_type,
+        AuditLog.entity_id,
+        AuditLog.details
+    ).join(User, AuditLog.user_id == User.id)
+
+# resource -> (query builder, date column, status column, ordering column)
+EXPORTS = {
+    'appointments': (_appointments_query, Appointment.appointment_date, Appointment.status, Appointment.id),
+    'bills': (_bills_query, Bill.created_at, Bill.payment_status, Bill.id),
+    'audit_logs': (_audit_logs_query, AuditLog.created_at, AuditLog.action, AuditLog.id)
+}
+
+def build_export_query(resource, start_date=None, end_date=None, status=None):
+    if resource not in EXPORTS:
+        raise ValueError(f'Unknown export resource: {resource}')
+
+    build, date_column, status_column, order_column = EXPORTS[resource]
+    query = build()
+    if isinstance(date_column.type, db.DateTime):
+        start_date = datetime.combine(start_date, datetime.min.time()) if start_date else None
+        end_date = datetime.combine(end_date, datetime.min.time()) if end_date else None
+    if start_date:
+        query = query.where(date_column >= start_date)
+    if end_date:
+        # Half-open range so datetime columns include the whole end day
+        query = query.where(date_column < end_date + timedelta(days=1))
+    if status:
+        query = query.where(status_column == status)
+    return query.order_by(order_column)
+
+def iter_chunks(query, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield (column names, list of row tuples) chunks from a server-side cursor"""
+    result = db.session.execute(query.execution_options(stream_results=True, yield_per=chunk_size))
+    columns = list(result.keys())
+    empty = True
+    for partition in result.partitions(chunk_size):
+        empty = False
+        yield columns, [tuple(row) for row in partition]
+    if empty:
+        yield columns, []
+
+def _format_value(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+def write_csv(chunks, path):
+    rows = 0
+    with open(path, 'w', newline='') as handle:
+        writer = csv.writer(handle)
+        header_written = False
+        for columns, chunk in chunks:
+            if not header_written:
+                writer.writerow(columns)
+                header_written = True
+            writer.writerows([[_format_value(value) for value in row] for row in chunk])
+            rows += len(chunk)
+    return rows
+
+def _arrow_type(pa, column_type):
+    # Checked most specific first: DateTime is not a Date subclass, but
+    # Boolean and Integer must not fall through to the string default
+    python_type = None
+    try:
+        python_type = column_type.python_type
+    except NotImplementedError:
+        pass
+    if python_type is bool:
+        return pa.bool_()
+    if python_type is int:
+        return pa.int64()
+    if python_type is float or python_type is Decimal:
+        return pa.float64()
+    if python_type is datetime:
+        return pa.timestamp('us')
+    if python_type is date:
+        return pa.date32()
+    if python_type is dt_time:
+        return pa.time64('us')
+    return pa.string()
+
+def write_parquet(chunks, path, column_types):
+    """Write each chunk as one Parquet row group; requires pyarrow.
+
+    The schema comes from the query's column types, not from the first
+    chunk, so a column that happens to be all NULL there keeps its type.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError('pyarrow is required for parquet exports (pip install pyarrow)')
+
+    rows = 0
+    writer = None
+    try:
+        for columns, chunk in chunks:
+            if writer is None:
+                schema = pa.schema([(name, _arrow_type(pa, column_type))
+                                    for name, column_type in zip(columns, column_types)])
+                writer = pq.ParquetWriter(path, schema, compression='zstd')
+            table = pa.Table.from_arrays(
+                [pa.array([row[i] for row in chunk], type=field.type) for i, field in enumerate(writer.schema)],
+                schema=writer.schema
+            )
+            writer.write_table(table)
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+def run_export(resource, fmt, path, start_date=None, end_date=None, status=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Stream one export to `path` and return throughput statistics"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f'Unknown export format: {fmt}')
+
+    started = time.perf_counter()
+    query = build_export_query(resource, start_date, end_date, status)
+    chunks = iter_chunks(query, chunk_size)
+    if fmt == 'parquet':
+        rows = write_parquet(chunks, path, [column.type for column in query.selected_columns])
+    else:
+        rows = write_csv(chunks, path)
+    seconds = time.perf_counter() - started
+    return {
+        'rows': rows,
+        'seconds': round(seconds, 3),
+        'rows_per_second': int(rows / seconds) if seconds else rows,
+        'bytes': os.path.getsize(path) if os.path.exists(path) else 0
+    }
+
+class ExportJobs:
+    """Export jobs queued by request workers and run by the export worker.
+
+    Each job's state is a JSON file next to its export in
+    instance/exports, so any worker process can report its status and
+    serve the download. The exports themselves are written by
+    `flask --app app process-exports`, a separate process, so a large
+    CSV or Parquet file never holds up requests or notification streams
+    (gevent workers would run a thread pool as greenlets on the same
+    core). A running job records the worker's host and pid; if that
+    process is gone, the job is marked Failed when it is next loaded.
+    """
+
+    @staticmethod
+    def _export_dir(app=None):
+        return os.path.join((app or current_app).instance_path, 'exports')
+
+    @staticmethod
+    def _save(job, export_dir):
+        # Write and rename, so readers in other workers never see half a file
+        path = os.path.join(export_dir, f'{job["id"]}.json')
+        with open(path + '.tmp', 'w') as handle:
+            json.dump(job, handle)
+        os.replace(path + '.tmp', path)
+
+    @staticmethod
+    def _worker_alive(job):
+        if 'worker_host' not in job:
+            return False  # started by a thread pool in a web worker, which is gone
+        if job['worker_host'] != socket.gethostname():
+            return True  # another host's worker; it cannot be checked from here
+        try:
+            os.kill(job['worker_pid'], 0)
+        except ProcessLookupError:
+            return False
+        except (OSError, KeyError, TypeError):
+            pass
+        return True
+
+    def _load(self, path):
+        try:
+            with open(path) as handle:
+                job = json.load(handle)
+        except (OSError, ValueError):
+            return None
+        if job.get('status') == 'Running' and not self._worker_alive(job):
+            job['status'] = 'Failed'
+            job['error'] = 'The export worker stopped before the export finished'
+            self._save(job, os.path.dirname(path))
+        return job
+
+    def submit(self, resource, fmt, start_date=None, end_date=None, status=None, requested_by=None):
+        """Queue an export for the export worker and return the job"""
+        export_dir = self._export_dir()
+        os.makedirs(export_dir, exist_ok=True)
+
+        job_id = uuid.uuid4().hex
+        filename = f'{resource}-{datetime.utcnow().strftime("%Y%m%d%H%M%S")}-{job_id[:8]}.{fmt}'
+        job = {
+            'id': job_id,
+            'resource': resource,
+            'format': fmt,
+            'start_date': start_date.isoformat() if start_date else None,
+            'end_date': end_date.isoformat() if end_date else None,
+            'status_filter': status,
+            'requested_by': requested_by,
+            'facility': current_facility(),
+            'status': 'Queued',
+            'filename': filename,
+            'path': os.path.join(export_dir, filename),
+            'created_at': datetime.utcnow().isoformat(),
+            'error': None
+        }
+        self._save(job, export_dir)
+        return job
+
+    def _claim(self, job, export_dir):
+        # Only one worker process may run a job: the first to create its lock file
+        try:
+            os.close(os.open(os.path.join(export_dir, f'{job["id"]}.lock'), os.O_CREAT | os.O_EXCL))
+        except FileExistsError:
+            return False
+        job.update(status='Running', worker_host=socket.gethostname(), worker_pid=os.getpid())
+        self._save(job, export_dir)
+        return True
+
+    def _run(self, app, job, export_dir):
+        with facility_context(job['facility'], app):
+            try:
+                job.update(run_export(job['resource'], job['format'], job['path'],
+                                      date.fromisoformat(job['start_date']) if job['start_date'] else None,
+                                      date.fromisoformat(job['end_date']) if job['end_date'] else None,
+                                      job['status_filter'],
+                                      app.config.get('EXPORT_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)))
+                job['status'] = 'Completed'
+            except Exception as exc:
+                job['status'] = 'Failed'
+                job['error'] = str(exc)
+            finally:
+                self._save(job, export_dir)
+                db.session.remove()
+
+    def process_queued(self):
+        """Run every queued job of every facility, oldest first; returns the number run"""
+        app = current_app._get_current_object()
+        export_dir = self._export_dir(app)
+        jobs = [job for job in map(self._load, glob.glob(os.path.join(export_dir, '*.json')))
+                if job and job['status'] == 'Queued']
+        processed = 0
+        for job in sorted(jobs, key=lambda job: job['created_at']):
+            if self._claim(job, export_dir):
+                self._run(app, job, export_dir)
+                processed += 1
+        return processed
+
+    def get(self, job_id):
+        """The job, if it was started at the current facility"""
+        if not JOB_ID.fullmatch(job_id or ''):
+            return None
+        job = self._load(os.path.join(self._export_dir(), f'{job_id}.json'))
+        return job if job and job['facility'] == current_facility() else None
+
+    def all(self, limit=100):
+        """The current facility's most recent jobs, newest first"""
+        facility = current_facility()
+        paths = glob.glob(os.path.join(self._export_dir(), '*.json'))
+        jobs = [job for job in map(self._load, paths) if job and job['facility'] == facility]
+        return sorted(jobs, key=lambda job: job['created_at'], reverse=True)[:limit]
+
+def run_export_worker(interval=5, log=print):
+    """Run queued export jobs every `interval` seconds until interrupted"""
+    while True:
+        processed = export_jobs.process_queued()
+        if processed:
+            log(f'{datetime.now().isoformat(timespec="seconds")} ran {processed} exports')
+        time.sleep(interval)
+
+export_jobs = ExportJobs()
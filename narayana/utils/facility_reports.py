@@ -0,0 +1,49 @@
+from datetime import timedelta
+from models import Appointment, Doctor, Patient
+from utils.doctor_stats import TREND_FIELDS
+from utils.shards import facility_names, map_facilities
+from utils.trends import appointment_trend, trend_summary
+
+SNAPSHOT_FIELDS = ('doctors', 'patients', 'appointments_today') + TREND_FIELDS + ('appointments',)
+
+def facility_snapshot(today, days=30):
+    """Headline numbers for the current facility: head counts plus rollup totals for the last `days` days"""
+    totals = trend_summary(appointment_trend(today - timedelta(days=days - 1), today))
+    totals.update({
+        'doctors': Doctor.query.count(),
+        'patients': Patient.query.count(),
+        'appointments_today': Appointment.query.filter(
+            Appointment.appointment_date == today,
+            Appointment.status != 'Cancelled'
+        ).count()
+    })
+    return totals
+
+def facilities_report(today, days=30):
+    """facility_snapshot() of every shard, queried in parallel, with a combined total row"""
+    names = facility_names()
+    snapshots = map_facilities(facility_snapshot, today, days)
+    rows = [dict(snapshot, facility=code, name=names.get(code, code)) for code, snapshot in snapshots.items()]
+    totals = {field: sum(row[field] for row in rows) for field in SNAPSHOT_FIELDS}
+    totals['revenue'] = round(totals['revenue'], 2)
+    return rows, totals
+
+def combined_trend(start, end, bucket='day', specialization=None, status=None):
+    """appointment_trend() summed across every facility, plus each facility's totals.
+
+    Every shard returns the same buckets for the same range, so the
+    series are added point by point.
+    """
+    per_facility = map_facilities(appointment_trend, start, end, bucket,
+                                  specialization=specialization, status=status)
+    series = None
+    for facility_series in per_facility.values():
+        if series is None:
+            series = [dict(point) for point in facility_series]
+            continue
+        for point, other in zip(series, facility_series):
+            for field in TREND_FIELDS + ('appointments',):
+                point[field] += other[field]
+    for point in series:
+        point['revenue'] = round(point['revenue'], 2)
+    return series, {code: trend_summary(facility_series) for code, facility_series in per_facility.items()}
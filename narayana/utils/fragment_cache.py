@@ -0,0 +1,202 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, has_request_context
+from jinja2 import nodes
+from jinja2.ext import Extension
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, CacheVersion
+from utils import signals
+from utils.shards import current_facility
+
+class EntityVersions:
+    """Change counters per entity, optionally scoped to one row.
+
+    Fragment and view-data keys include the versions they depend on, so
+    bumping a counter makes every older entry unreachable; the LRUs evict
+    them. The counters live in the cache_versions table of each
+    facility's database (ids repeat across shards), so a bump in one
+    worker process invalidates the entries cached by all of them. Reads
+    are memoized for the rest of the request.
+    """
+
+    def _memo(self):
+        return g.setdefault('cache_versions', {}) if has_request_context() else {}
+
+    def get(self, entity, entity_id=None):
+        key = (entity, entity_id or 0)
+        memo = self._memo()
+        if key not in memo:
+            memo[key] = db.session.query(CacheVersion.version).filter_by(
+                entity=entity, entity_id=key[1]
+            ).scalar() or 0
+        return memo[key]
+
+    def bump(self, entity, entity_ids=()):
+        """Increment the entity's counter and those of `entity_ids`, and commit"""
+        keys = [0] + sorted({entity_id for entity_id in entity_ids if entity_id})
+        statement = sqlite_insert(CacheVersion)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['entity', 'entity_id'],
+            set_={'version': CacheVersion.version + 1}
+        ), [{'entity': entity, 'entity_id': entity_id, 'version': 1} for entity_id in keys])
+        db.session.commit()
+        memo = self._memo()
+        for entity_id in keys:
+            memo.pop((entity, entity_id), None)
+
+class FragmentCache:
+    """Thread-safe LRU of rendered template fragments with render-time metrics.
+
+    Each worker process keeps its own entries; the shared version
+    counters make a change visible to every worker on its next lookup.
+    Entries also expire after `ttl` seconds.
+    """
+
+    def __init__(self, max_entries=1000, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _stat(self, name):
+        stat = self._stats.get(name)
+        if stat is None:
+            stat = self._stats[name] = {'hits': 0, 'misses': 0, 'evictions': 0, 'render_seconds': 0.0}
+        return stat
+
+    def get_or_render(self, key, render):
+        """Return the cached fragment for `key`, rendering it on a miss.
+
+        `key` is a tuple of hashable parts whose first item names the
+        fragment in the metrics.
+        """
+        name = key[0]
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self._stat(name)['hits'] += 1
+                return entry[1]
+
+        started = time.perf_counter()
+        html = render()
+        elapsed = time.perf_counter() - started
+
+        with self._lock:
+            stat = self._stat(name)
+            stat['misses'] += 1
+            stat['render_seconds'] += elapsed
+            self._entries[key] = (time.monotonic() + self.ttl, html)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._stat(evicted[0])['evictions'] += 1
+        return html
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def metrics(self):
+        """Per-fragment hit rate and render times, busiest first"""
+        with self._lock:
+            stats = {name: dict(stat) for name, stat in self._stats.items()}
+            entries = {}
+            for key in self._entries:
+                entries[key[0]] = entries.get(key[0], 0) + 1
+
+        rows = []
+        for name, stat in stats.items():
+            lookups = stat['hits'] + stat['misses']
+            avg_render = stat['render_seconds'] / stat['misses'] if stat['misses'] else 0.0
+            rows.append({
+                'name': name,
+                'entries': entries.get(name, 0),
+                'hits': stat['hits'],
+                'misses': stat['misses'],
+                'evictions': stat['evictions'],
+                'hit_rate': stat['hits'] / lookups if lookups else 0.0,
+                'avg_render_ms': avg_render * 1000,
+                'saved_ms': stat['hits'] * avg_render * 1000
+            })
+        rows.sort(key=lambda row: row['hits'] + row['misses'], reverse=True)
+        return rows
+
+class FragmentCacheExtension(Extension):
+    """Adds `{% cache 'name', key_part, ... %}...{% endcache %}` to templates.
+
+    Key parts are evaluated on every render, so include everything the
+    fragment depends on: ids, today's date, and cache_version(...) for
+    the entities it displays.
+    """
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            parts.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        key = nodes.Tuple(parts, 'load')
+        return nodes.CallBlock(self.call_method('_render', [key]), [], [], body).set_lineno(lineno)
+
+    def _render(self, key, caller):
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+        # Rows with the same id in another facility's shard are different rows
+        return cache.get_or_render((key[0], current_facility()) + key[1:], caller)
+
+versions = EntityVersions()
+fragment_cache = FragmentCache()
+
+def init_fragment_cache(app):
+    """Enable the {% cache %} tag; FRAGMENT_CACHE_SIZE = 0 renders fragments uncached"""
+    fragment_cache.max_entries = app.config.get('FRAGMENT_CACHE_SIZE', 1000)
+    fragment_cache.ttl = app.config.get('FRAGMENT_CACHE_TTL', 300)
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.fragment_cache = fragment_cache if fragment_cache.max_entries else None
+    app.jinja_env.globals['cache_version'] = versions.get
+
+def _doctor_ids(doctor_days):
+    return {doctor_id for doctor_id, _ in doctor_days}
+
+# 'doctor_stats' covers everything in a doctor's rollups: appointments,
+# availability, ratings and bill payments
+@signals.appointment_changed.connect
+def _on_appointment_changed(sender, doctor_ids=(), patient_ids=(), doctor_days=(), **extra):
+    versions.bump('appointments')
+    versions.bump('doctor_schedule', doctor_ids)
+    versions.bump('patient_schedule', patient_ids)
+    versions.bump('doctor_stats', set(doctor_ids) | _doctor_ids(doctor_days))
+
+@signals.availability_changed.connect
+def _on_availability_changed(sender, doctor_ids=(), **extra):
+    versions.bump('availability', doctor_ids)
+    versions.bump('doctor_stats', doctor_ids)
+
+@signals.rating_changed.connect
+def _on_rating_changed(sender, doctor_ids=(), **extra):
+    versions.bump('doctor', doctor_ids)
+    versions.bump('doctor_stats', doctor_ids)
+
+@signals.doctor_changed.connect
+def _on_doctor_changed(sender, doctor_ids=(), **extra):
+    versions.bump('doctor', doctor_ids)
+
+@signals.patient_changed.connect
+def _on_patient_changed(sender, patient_ids=(), **extra):
+    versions.bump('patient', patient_ids)
+
+@signals.bill_changed.connect
+def _on_bill_changed(sender, patient_ids=(), doctor_days=(), **extra):
+    versions.bump('bills', patient_ids)
+    versions.bump('doctor_stats', _doctor_ids(doctor_days))
@@ -0,0 +1,66 @@
+from bisect import bisect_left, insort
+from datetime import date, datetime, time, timedelta
+from itertools import accumulate
+
+_DAY = date(2000, 1, 1)
+
+def add_minutes(start, minutes):
+    """`start` + `minutes` as a time of day, clamped to the same day"""
+    moment = datetime.combine(_DAY, start) + timedelta(minutes=minutes)
+    if moment.date() > _DAY:
+        return time.max
+    if moment.date() < _DAY:
+        return time.min
+    return moment.time()
+
+def merge_intervals(intervals):
+    """Sort and merge overlapping or touching (start, end) intervals"""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+class IntervalIndex:
+    """Half-open [start, end) intervals answering overlap queries in O(log n).
+
+    Intervals are kept sorted by start next to a running maximum of their
+    ends, so "does anything overlap [start, end)?" is one binary search:
+    of the intervals starting before `end`, the one reaching furthest
+    decides. Intervals may overlap each other. Values only need to be
+    comparable (times of day, minutes, datetimes).
+    """
+
+    def __init__(self, intervals=()):
+        self._intervals = sorted(intervals)
+        self._reindex()
+
+    def _reindex(self):
+        self._starts = [start for start, _ in self._intervals]
+        self._max_ends = list(accumulate((end for _, end in self._intervals), max))
+
+    def __len__(self):
+        return len(self._intervals)
+
+    def __iter__(self):
+        return iter(self._intervals)
+
+    def add(self, start, end):
+        insort(self._intervals, (start, end))
+        self._reindex()
+
+    def remove(self, start, end):
+        self._intervals.remove((start, end))
+        self._reindex()
+
+    def overlaps(self, start, end):
+        index = bisect_left(self._starts, end)
+        return index > 0 and self._max_ends[index - 1] > start
+
+    def overlapping(self, start, end):
+        """The intervals that overlap [start, end), in start order"""
+        index = bisect_left(self._starts, end)
+        return [interval for interval in self._intervals[:index] if interval[1] > start]
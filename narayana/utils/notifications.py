@@ -1,18 +1,109 @@
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_
 from models import db, Notification
+from utils.pubsub import hub
+from utils.shards import current_facility
+
+DEFAULT_PAGE_SIZE = 20
 
 def create_notification(user_id, message):
     """Create a notification for a user"""
     notification = Notification(user_id=user_id, message=message)
     db.session.add(notification)
     db.session.commit()
+    publish_notification(notification)
+
+def stream_key(user_id):
+    """Hub key for a user's live streams; user ids repeat across facility shards"""
+    return (current_facility(), user_id)
+
+def publish_notification(notification):
+    """Push a committed notification to the user's live streams"""
+    key = stream_key(notification.user_id)
+    if hub.has_subscribers(key):
+        hub.publish(key, 'notification', {
+            'id': notification.id,
+            'message': notification.message,
+            'created_at': notification.created_at.isoformat() if notification.created_at else None,
+            'unread_count': get_unread_count(notification.user_id)
+        })
+
+def publish_unread_count(user_id):
+    """Push the current unread count to the user's live streams"""
+    key = stream_key(user_id)
+    if hub.has_subscribers(key):
+        hub.publish(key, 'unread', {'unread_count': get_unread_count(user_id)})
 
 def get_unread_count(user_id):
     """Get count of unread notifications for a user"""
     return Notification.query.filter_by(user_id=user_id, is_read=False).count()
 
-def mark_as_read(notification_id):
-    """Mark a notification as read"""
-    notification = Notification.query.get(notification_id)
-    if notification:
-        notification.is_read = True
-        db.session.commit()
+def encode_cursor(notification):
+    return f'{notification.created_at.isoformat()}_{notification.id}'
+
+def decode_cursor(cursor):
+    """Parse a cursor into (created_at, id), or None if it is malformed"""
+    try:
+        created_at, notification_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(created_at), int(notification_id)
+    except (AttributeError, ValueError):
+        return None
+
+def get_inbox_page(user_id, cursor=None, limit=DEFAULT_PAGE_SIZE, unread_only=False):
+    """One page of a user's inbox, newest first, using a keyset cursor.
+
+    Returns (notifications, next_cursor); next_cursor is None on the last
+    page. Served from the (user_id, created_at, id) index, so the cost of
+    a page does not grow with the size of the inbox.
+    """
+    query = Notification.query.filter(Notification.user_id == user_id)
+    if unread_only:
+        query = query.filter(Notification.is_read == False)
+
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        created_at, notification_id = position
+        query = query.filter(or_(
+            Notification.created_at < created_at,
+            and_(Notification.created_at == created_at, Notification.id < notification_id)
+        ))
+
+    rows = query.order_by(Notification.created_at.desc(), Notification.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+def mark_read(user_id, notification_ids=None):
+    """Mark all, or the given, unread notifications of a user as read with one UPDATE.
+
+    Only the user's own notifications are touched. Returns the number of
+    notifications changed.
+    """
+    query = Notification.query.filter(Notification.user_id == user_id, Notification.is_read == False)
+    if notification_ids is not None:
+        if not notification_ids:
+            return 0
+        query = query.filter(Notification.id.in_(notification_ids))
+
+    changed = query.update({Notification.is_read: True}, synchronize_session=False)
+    db.session.commit()
+    if changed:
+        publish_unread_count(user_id)
+    return changed
+
+def mark_as_read(notification_id, user_id):
+    """Mark a single notification owned by `user_id` as read"""
+    return mark_read(user_id, [notification_id])
+
+def purge_read_notifications(retention_days):
+    """Delete read notifications older than the retention window.
+
+    Unread notifications are kept regardless of age, so unread counts are
+    never affected. Returns the number of rows deleted.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    deleted = Notification.query.filter(
+        Notification.is_read == True,
+        Notification.created_at < cutoff
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
@@ -0,0 +1,68 @@
+import json
+import queue
+import threading
+
+class Subscription:
+    """One listener's event queue; slow listeners drop events instead of blocking publishers"""
+
+    def __init__(self, user_id, maxsize=100):
+        self.user_id = user_id
+        self.queue = queue.Queue(maxsize=maxsize)
+
+    def get(self, timeout):
+        """Next event, or None if nothing arrived within `timeout` seconds"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+class NotificationHub:
+    """In-process pub/sub keyed by user id.
+
+    Subscribers only receive events published by the same process, so
+    each worker serves the streams of the users connected to it.
+    Notifications created by another worker or a CLI command never pass
+    through this hub; the stream picks them up from the unread count it
+    re-reads on every heartbeat. Waiting
+    on a subscription is a plain queue.get, which yields cooperatively
+    under gevent/eventlet workers.
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            listeners = self._subscribers.get(subscription.user_id)
+            if listeners:
+                listeners.discard(subscription)
+                if not listeners:
+                    del self._subscribers[subscription.user_id]
+
+    def has_subscribers(self, user_id):
+        return user_id in self._subscribers
+
+    def publish(self, user_id, event, data):
+        with self._lock:
+            listeners = list(self._subscribers.get(user_id, ()))
+        for subscription in listeners:
+            try:
+                subscription.queue.put_nowait((event, data))
+            except queue.Full:
+                pass
+
+    def connection_count(self):
+        with self._lock:
+            return sum(len(listeners) for listeners in self._subscribers.values())
+
+def format_sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+hub = NotificationHub()
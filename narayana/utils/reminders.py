@@ -0,0 +1,99 @@
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import and_, insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, Appointment, Doctor, Patient, User, Notification, ReminderLog
+from utils.notifications import publish_unread_count
+
+# Reminder name -> how far ahead of the appointment it is sent
+REMINDER_WINDOWS = {
+    '24h': timedelta(hours=24),
+    '1h': timedelta(hours=1)
+}
+
+def _due_appointments(window, now, lead, after_id, limit):
+    """Booked appointments starting within `lead` of now with no reminder logged for `window`.
+
+    Scans the (appointment_date, appointment_time) index over the few
+    dates the window covers; the exact start-time check is done on the
+    combined date and time.
+    """
+    horizon = now + lead
+    query = db.session.query(
+        Appointment.id,
+        Appointment.appointment_date,
+        Appointment.appointment_time,
+        Patient.user_id,
+        User.username
+    ).join(Patient, Appointment.patient_id == Patient.id).join(
+        Doctor, Appointment.doctor_id == Doctor.id
+    ).join(User, Doctor.user_id == User.id).outerjoin(
+        ReminderLog, and_(ReminderLog.appointment_id == Appointment.id, ReminderLog.window == window)
+    ).filter(
+        Appointment.appointment_date >= now.date(),
+        Appointment.appointment_date <= horizon.date(),
+        Appointment.status == 'Booked',
+        Appointment.id > after_id,
+        ReminderLog.id.is_(None)
+    ).order_by(Appointment.id).limit(limit)
+
+    rows = query.all()
+    due = [row for row in rows
+           if now < datetime.combine(row.appointment_date, row.appointment_time) <= horizon]
+    last_id = rows[-1].id if rows else None
+    return due, last_id
+
+def send_due_reminders(now=None, windows=None, batch_size=5000):
+    """Create reminder notifications for upcoming appointments in bulk.
+
+    Each batch claims its appointments in reminder_logs (unique per
+    appointment and window) and inserts the matching notifications in the
+    same transaction, so a restarted or concurrent run never sends a
+    reminder twice. Returns the number of reminders sent per window.
+    """
+    now = now or datetime.now()
+    windows = windows or REMINDER_WINDOWS
+    sent = {}
+
+    for window, lead in windows.items():
+        sent[window] = 0
+        after_id = 0
+        while True:
+            due, last_id = _due_appointments(window, now, lead, after_id, batch_size)
+            if last_id is None:
+                break
+            after_id = last_id
+            if not due:
+                continue
+
+            claimed = set(db.session.execute(
+                sqlite_insert(ReminderLog).on_conflict_do_nothing().returning(ReminderLog.appointment_id),
+                [{'appointment_id': row.id, 'window': window, 'sent_at': now} for row in due]
+            ).scalars())
+
+            notifications = [{
+                'user_id': row.user_id,
+                'message': f'Reminder: your appointment with Dr. {row.username} is on '
+                           f'{row.appointment_date} at {row.appointment_time.strftime("%H:%M")}',
+                'is_read': False,
+                'created_at': now
+            } for row in due if row.id in claimed]
+            if notifications:
+                db.session.execute(insert(Notification), notifications)
+            db.session.commit()
+
+            for user_id in {notification['user_id'] for notification in notifications}:
+                publish_unread_count(user_id)
+            sent[window] += len(notifications)
+
+    return sent
+
+def run_reminder_worker(interval=300, log=print):
+    """Send due reminders every `interval` seconds until interrupted"""
+    while True:
+        started = time.perf_counter()
+        sent = send_due_reminders()
+        log(f'{datetime.now().isoformat(timespec="seconds")} sent {sent} '
+            f'in {time.perf_counter() - started:.2f}s')
+        db.session.remove()
+        time.sleep(interval)
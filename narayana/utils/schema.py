@@ -0,0 +1,47 @@
+from sqlalchemy import inspect, text
+from models import db
+from utils.shards import facility_engine
+
+def upgrade_schema():
+    """Bring an existing database up to date with the models.
+
+    db.create_all() only creates missing tables. This also adds columns
+    and indexes that were introduced after a table was first created, so
+    deployments with an existing database.db keep working without a
+    migration tool. Returns a list of the changes applied.
+    """
+    engine = facility_engine()
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    applied = []
+
+    with engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=connection.dialect)
+                default = ''
+                if column.default is not None and column.default.is_scalar:
+                    default = f' DEFAULT {_literal(column.default.arg)}'
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}{default}'))
+                applied.append(f'{table.name}.{column.name}')
+
+            existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(connection)
+                    applied.append(index.name)
+
+    return applied
+
+def _literal(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, (int, float)):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
@@ -0,0 +1,95 @@
+import json
+from datetime import time
+from flask import Response
+from sqlalchemy import func, select
+from sqlalchemy.orm import aliased
+from models import Doctor, Patient, Appointment, User
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def isoformat(value):
+    return value.isoformat() if value is not None else None
+
+def sqlite_time(value):
+    """Normalize a raw SQLite time string ('HH:MM:SS.ffffff') to time.isoformat()"""
+    return time.fromisoformat(value).isoformat() if value else value
+
+class RowEncoder:
+    """Encodes SQL row tuples for one resource straight to JSON bytes.
+
+    The row-to-dict conversion is generated and compiled once per
+    resource, so encoding a row is a single dict display with the
+    converters inlined. Uses orjson when installed, which serializes
+    dates and times itself, and the stdlib encoder otherwise.
+    """
+
+    def __init__(self, fields, converters=None, backend=None):
+        self.fields = tuple(fields)
+        self.backend = backend or ('orjson' if orjson else 'json')
+        converters = dict(converters or {})
+        if self.backend == 'orjson':
+            # orjson emits date/time isoformat natively
+            converters = {name: fn for name, fn in converters.items() if fn is not isoformat}
+
+        namespace = {}
+        items = []
+        for index, name in enumerate(self.fields):
+            if name in converters:
+                namespace[f'c{index}'] = converters[name]
+                items.append(f'{name!r}: c{index}(r[{index}])')
+            else:
+                items.append(f'{name!r}: r[{index}]')
+        source = f'def to_dicts(rows):\n    return [{{{", ".join(items)}}} for r in rows]\n'
+        exec(compile(source, f'<RowEncoder {",".join(self.fields)}>', 'exec'), namespace)
+        self.to_dicts = namespace['to_dicts']
+        self._stdlib = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+    def encode(self, rows):
+        items = self.to_dicts(rows)
+        if self.backend == 'orjson':
+            return orjson.dumps(items)
+        return self._stdlib.encode(items).encode('utf-8')
+
+def json_response(body, status=200):
+    return Response(body, status=status, mimetype='application/json')
+
+class Resource:
+    def __init__(self, query, encoder):
+        self.query = query
+        self.encoder = encoder
+
+_doctor_user = aliased(User)
+_patient_user = aliased(User)
+
+# The /api resources: one joined SELECT each, with a matching encoder
+RESOURCES = {
+    'doctors': Resource(
+        select(Doctor.id, User.username, User.email, User.phone, Doctor.specialization, Doctor.rating)
+        .join(User, Doctor.user_id == User.id).order_by(Doctor.id),
+        RowEncoder(('id', 'username', 'email', 'phone', 'specialization', 'rating'))
+    ),
+    'patients': Resource(
+        select(Patient.id, User.username, User.email, User.phone, Patient.medical_id)
+        .join(User, Patient.user_id == User.id).order_by(Patient.id),
+        RowEncoder(('id', 'username', 'email', 'phone', 'medical_id'))
+    ),
+    'appointments': Resource(
+        select(Appointment.id, _doctor_user.username, _patient_user.username,
+               Appointment.appointment_date, Appointment.appointment_time, Appointment.status,
+               Appointment.duration_minutes)
+        .join(Doctor, Appointment.doctor_id == Doctor.id)
+        .join(_doctor_user, Doctor.user_id == _doctor_user.id)
+        .join(Patient, Appointment.patient_id == Patient.id)
+        .join(_patient_user, Patient.user_id == _patient_user.id)
+        .order_by(Appointment.id),
+        RowEncoder(('id', 'doctor', 'patient', 'date', 'time', 'status', 'duration_minutes'),
+                   {'date': isoformat, 'time': isoformat})
+    ),
+    'specializations': Resource(
+        select(Doctor.specialization, func.count(Doctor.id)).group_by(Doctor.specialization),
+        RowEncoder(('specialization', 'count'))
+    )
+}
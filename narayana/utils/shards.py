@@ -0,0 +1,168 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from flask import abort, current_app, flash, g, has_app_context, redirect, request, session, url_for
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+DEFAULT_FACILITY = 'main'
+
+# The only endpoints where an anonymous request may choose its facility
+FACILITY_SELECT_ENDPOINTS = ('shared.login', 'shared.register')
+
+def facility_bind_key(facility):
+    return f'facility:{facility}'
+
+def current_facility():
+    """The facility whose shard this app context reads and writes"""
+    if not has_app_context():
+        return DEFAULT_FACILITY
+    return g.get('facility') or current_app.config.get('FACILITY', DEFAULT_FACILITY)
+
+def facility_codes():
+    """Configured facility codes, `main` first"""
+    return list(current_app.config.get('FACILITY_DATABASES') or [current_facility()])
+
+class RoutingSession(Session):
+    """A Flask-SQLAlchemy session bound to the current facility's shard.
+
+    Every model lives in every shard, so the engine is picked by facility,
+    not by model. The scoped session is per app context, so a request
+    only ever talks to one shard; use facility_context() to reach another.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is not None:
+            return bind
+        facility = current_facility()
+        if facility == DEFAULT_FACILITY:
+            return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        return self._db.engines[facility_bind_key(facility)]
+
+def facility_engine():
+    from models import db
+    return db.session.get_bind()
+
+@contextmanager
+def facility_context(facility, app=None):
+    """Push an app context, with its own database session, bound to `facility`'s shard"""
+    app = app or current_app._get_current_object()
+    with app.app_context():
+        g.facility = facility
+        yield
+
+def map_facilities(fn, *args, **kwargs):
+    """Run fn(*args, **kwargs) against every shard in parallel; returns {facility: result}"""
+    app = current_app._get_current_object()
+    codes = facility_codes()
+
+    def run(facility):
+        with facility_context(facility, app):
+            return fn(*args, **kwargs)
+
+    if len(codes) == 1:
+        return {codes[0]: run(codes[0])}
+    with ThreadPoolExecutor(max_workers=min(len(codes), 8), thread_name_prefix='shard') as executor:
+        return dict(zip(codes, executor.map(run, codes)))
+
+def facility_names():
+    """{code: name} from each shard's own Facility row, read once per process"""
+    app = current_app._get_current_object()
+    names = app.extensions.get('facility_names')
+    if names is None:
+        from models import Facility
+
+        def name():
+            facility = Facility.query.first()
+            return facility.name if facility else None
+
+        names = {code: found or code.title() for code, found in map_facilities(name).items()}
+        app.extensions['facility_names'] = names
+    return names
+
+def parse_facility_databases(value):
+    """Parse `code=url,code=url` (the FACILITY_DATABASES environment variable)"""
+    databases = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        code, separator, url = item.partition('=')
+        if not separator or not code.strip() or not url.strip():
+            raise ValueError(f'FACILITY_DATABASES entries must look like code=url, got {item!r}')
+        databases[code.strip()] = url.strip()
+    return databases
+
+def init_shards(app):
+    """Register a SQLAlchemy bind per facility shard; call before db.init_app(app).
+
+    The `main` facility's database is SQLALCHEMY_DATABASE_URI;
+    FACILITY_DATABASES maps other facility codes to their own database
+    URLs. FACILITY is the facility used when a request does not pick
+    one, and by CLI commands and workers.
+    """
+    databases = app.config.get('FACILITY_DATABASES') or {}
+    if isinstance(databases, str):
+        databases = parse_facility_databases(databases)
+    if DEFAULT_FACILITY in databases:
+        raise ValueError(f'The {DEFAULT_FACILITY!r} facility uses SQLALCHEMY_DATABASE_URI; '
+                         'list only the other facilities in FACILITY_DATABASES')
+    databases = {DEFAULT_FACILITY: app.config['SQLALCHEMY_DATABASE_URI'], **databases}
+    app.config['FACILITY_DATABASES'] = databases
+
+    facility = app.config.setdefault('FACILITY', DEFAULT_FACILITY)
+    if facility not in databases:
+        raise ValueError(f'FACILITY {facility!r} is not one of the configured facilities: {", ".join(databases)}')
+
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    for code, url in databases.items():
+        if code != DEFAULT_FACILITY:
+            binds[facility_bind_key(code)] = url
+    app.config['SQLALCHEMY_BINDS'] = binds
+    app.before_request(_select_facility)
+    app.context_processor(_inject_facilities)
+
+def tune_shard_engines(app):
+    """Size SQLite's page cache and memory map so each shard's hot pages stay in memory"""
+    from models import db
+
+    cache_kib = app.config.get('SQLITE_CACHE_MB', 64) * 1024
+    mmap_bytes = app.config.get('SQLITE_MMAP_MB', 256) * 1024 * 1024
+
+    def on_connect(connection, record):
+        cursor = connection.cursor()
+        cursor.execute(f'PRAGMA cache_size = -{int(cache_kib)}')
+        cursor.execute(f'PRAGMA mmap_size = {int(mmap_bytes)}')
+        cursor.close()
+
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', on_connect)
+
+def _inject_facilities():
+    # The facility picker and name are only shown when there is more than one
+    if len(current_app.config['FACILITY_DATABASES']) < 2:
+        return {'facilities': {}, 'facility': current_facility()}
+    return {'facilities': facility_names(), 'facility': current_facility()}
+
+def _select_facility():
+    # Signed-in users stay on the facility they signed in to. Before that,
+    # only the login and registration forms may pick one, since the user
+    # then authenticates against (or registers in) that facility's
+    # database; every other anonymous request uses the default facility
+    if 'user_id' in session:
+        facility = session.get('facility')
+    elif request.endpoint in FACILITY_SELECT_ENDPOINTS:
+        facility = request.values.get('facility')
+    elif 'facility' in request.values:
+        abort(400, 'Sign in to use another facility')
+    else:
+        facility = None
+    if not facility:
+        return None
+    if facility not in current_app.config['FACILITY_DATABASES']:
+        if 'user_id' in session:
+            session.clear()
+            flash('Your facility is no longer available. Please log in again.', 'error')
+            return redirect(url_for('shared.login'))
+        abort(404)
+    g.facility = facility
+    return None
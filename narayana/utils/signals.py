@@ -0,0 +1,24 @@
+from blinker import Namespace
+
+# Sent by routes and bulk helpers after the change is committed. Receivers
+# (fragment cache, rollups, ...) get the ids of the rows they may depend on.
+# `doctor_days` lists the (doctor_id, date) pairs whose daily rollups changed.
+_signals = Namespace()
+
+# doctor_ids, patient_ids, appointment_ids, doctor_days (appointment dates)
+appointment_changed = _signals.signal('appointment-changed')
+
+# doctor_ids, doctor_days (dates of the blocked or unblocked slots)
+availability_changed = _signals.signal('availability-changed')
+
+# doctor_ids, appointment_ids, doctor_days (rating dates): doctors whose ratings (and average rating) changed
+rating_changed = _signals.signal('rating-changed')
+
+# doctor_ids: doctors whose profile or account changed
+doctor_changed = _signals.signal('doctor-changed')
+
+# patient_ids: patients whose profile or account changed
+patient_changed = _signals.signal('patient-changed')
+
+# patient_ids, appointment_ids, doctor_days (payment dates): patients whose bills were created or changed
+bill_changed = _signals.signal('bill-changed')
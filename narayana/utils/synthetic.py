@@ -0,0 +1,203 @@
+import random
+from datetime import datetime, date, time, timedelta
+from sqlalchemy import func, insert, update
+from werkzeug.security import generate_password_hash
+from models import (db, User, Doctor, Patient, Availability, Appointment, Treatment,
+                    Rating, Bill, Notification, AuditLog)
+from utils.doctor_stats import rebuild_doctor_stats
+from utils.timeline import rebuild_timeline
+from utils.clinical_index import rebuild_clinical_index
+
+SYNTHETIC_PASSWORD = 'password123'
+
+SPECIALIZATIONS = ['Cardiology', 'Neurology', 'Pediatrics', 'Orthopedics', 'Dermatology',
+                   'Oncology', 'Psychiatry', 'General Medicine', 'ENT', 'Ophthalmology']
+DIAGNOSES = ['Hypertension', 'Type 2 diabetes', 'Migraine', 'Seasonal allergies', 'Bronchitis',
+             'Lower back pain', 'Anxiety disorder', 'Eczema', 'Otitis media', 'Conjunctivitis']
+PRESCRIPTIONS = ['Amlodipine 5mg daily', 'Metformin 500mg twice daily', 'Sumatriptan 50mg as needed',
+                 'Cetirizine 10mg daily', 'Amoxicillin 500mg three times daily', 'Ibuprofen 400mg as needed',
+                 'Sertraline 50mg daily', 'Hydrocortisone cream 1%', 'Paracetamol 500mg as needed']
+PAYMENT_METHODS = ['Cash', 'Card', 'Insurance', 'Online']
+INSURERS = ['MediShield', 'CareFirst', 'HealthPlus', None]
+SLOT_TIMES = [time(9, 0), time(10, 0), time(11, 0), time(12, 0),
+              time(14, 0), time(15, 0), time(16, 0), time(17, 0)]
+
+DEFAULT_SCALE = {
+    'doctors': 200,
+    'patients': 20000,
+    'appointments': 100000,
+    'availability_blocks': 2000,
+    'notifications_per_appointment': 2,
+    'days_back': 365,
+    'days_ahead': 30
+}
+
+def _next_id(model):
+    return (db.session.query(func.max(model.id)).scalar() or 0) + 1
+
+class _BulkWriter:
+    """Buffers rows per table and flushes them with executemany inserts"""
+
+    def __init__(self, chunk_size):
+        self.chunk_size = chunk_size
+        self.buffers = {}
+        self.counts = {}
+
+    def add(self, model, row):
+        buffer = self.buffers.setdefault(model, [])
+        buffer.append(row)
+        if len(buffer) >= self.chunk_size:
+            self.flush(model)
+
+    def flush(self, model=None):
+        models = [model] if model else list(self.buffers)
+        for target in models:
+            rows = self.buffers.get(target)
+            if rows:
+                db.session.execute(insert(target), rows)
+                self.counts[target.__tablename__] = self.counts.get(target.__tablename__, 0) + len(rows)
+                self.buffers[target] = []
+
+def generate_synthetic_data(seed=42, chunk_size=10000, progress=None, **scale):
+    """Bulk-load a deterministic synthetic hospital.
+
+    The same seed and scale always produce the same data. Usernames are
+    prefixed with `syn<seed>_` and every synthetic account uses
+    SYNTHETIC_PASSWORD. Rows are written with executemany inserts in
+    chunks and committed in batches. Returns row counts per table.
+    """
+    scale = dict(DEFAULT_SCALE, **scale)
+    rng = random.Random(seed)
+    writer = _BulkWriter(chunk_size)
+    prefix = f'syn{seed}_'
+    password_hash = generate_password_hash(SYNTHETIC_PASSWORD)
+    now = datetime.utcnow()
+    today = date.today()
+
+    def report(message):
+        if progress:
+            progress(message)
+
+    # Users, doctors and patients
+    user_id = _next_id(User)
+    doctor_id = _next_id(Doctor)
+    patient_id = _next_id(Patient)
+    writer.add(User, {'id': user_id, 'username': f'{prefix}admin', 'email': f'{prefix}admin@synthetic.local',
+                      'password_hash': password_hash, 'role': 'admin', 'is_active': True, 'created_at': now})
+    user_id += 1
+
+    doctors = []
+    for i in range(scale['doctors']):
+        writer.add(User, {'id': user_id, 'username': f'{prefix}dr{i}', 'email': f'{prefix}dr{i}@synthetic.local',
+                          'password_hash': password_hash, 'role': 'doctor', 'full_name': f'Doctor {i}',
+                          'phone': f'9{i:09d}', 'is_active': True, 'created_at': now})
+        writer.add(Doctor, {'id': doctor_id, 'user_id': user_id,
+                            'specialization': SPECIALIZATIONS[i % len(SPECIALIZATIONS)],
+                            'consultation_fee': float(rng.choice([30, 50, 75, 100, 150])),
+                            'experience_years': rng.randint(1, 35)})
+        doctors.append((doctor_id, user_id))
+        user_id += 1
+        doctor_id += 1
+
+    patients = []
+    for i in range(scale['patients']):
+        writer.add(User, {'id': user_id, 'username': f'{prefix}pt{i}', 'email': f'{prefix}pt{i}@synthetic.local',
+                          'password_hash': password_hash, 'role': 'patient', 'full_name': f'Patient {i}',
+                          'phone': f'8{i:09d}', 'is_active': True, 'created_at': now})
+        writer.add(Patient, {'id': patient_id, 'user_id': user_id, 'medical_id': f'{prefix.upper()}{i:08d}',
+                             'insurance_provider': rng.choice(INSURERS)})
+        patients.append((patient_id, user_id))
+        user_id += 1
+        patient_id += 1
+
+    writer.flush()
+    db.session.commit()
+    report(f'{len(doctors)} doctors, {len(patients)} patients')
+
+    # Availability blocks in the upcoming window
+    for _ in range(scale['availability_blocks']):
+        block_start = rng.choice(SLOT_TIMES)
+        writer.add(Availability, {'doctor_id': rng.choice(doctors)[0],
+                                  'date': today + timedelta(days=rng.randint(0, scale['days_ahead'])),
+                                  'start_time': block_start,
+                                  'end_time': time(block_start.hour + 1, 0),
+                                  'is_available': False})
+    writer.flush()
+    db.session.commit()
+
+    # Appointments and everything hanging off them
+    appointment_id = _next_id(Appointment)
+    day_span = scale['days_back'] + scale['days_ahead']
+    taken = set()
+    for _ in range(scale['appointments']):
+        doc, doc_user = rng.choice(doctors)
+        pat, pat_user = rng.choice(patients)
+        for _attempt in range(10):
+            appt_date = today - timedelta(days=scale['days_back']) + timedelta(days=rng.randint(0, day_span))
+            appt_time = rng.choice(SLOT_TIMES)
+            if (doc, appt_date, appt_time) not in taken:
+                break
+        taken.add((doc, appt_date, appt_time))
+
+        if appt_date < today:
+            status = rng.choices(['Completed', 'Cancelled'], weights=[85, 15])[0]
+        else:
+            status = rng.choices(['Booked', 'Cancelled'], weights=[90, 10])[0]
+        created = datetime.combine(appt_date, appt_time) - timedelta(days=rng.randint(1, 14))
+
+        writer.add(Appointment, {'id': appointment_id, 'doctor_id': doc, 'patient_id': pat,
+                                 'appointment_date': appt_date, 'appointment_time': appt_time,
+                                 'status': status, 'created_at': created})
+        writer.add(AuditLog, {'user_id': pat_user, 'action': 'CREATE', 'entity_type': 'Appointment',
+                              'entity_id': appointment_id, 'details': f'Booked appointment with doctor {doc}',
+                              'created_at': created})
+        for n in range(scale['notifications_per_appointment']):
+            writer.add(Notification, {'user_id': doc_user if n % 2 else pat_user,
+                                      'message': f'Your appointment is confirmed for {appt_date} at {appt_time}',
+                                      'is_read': appt_date < today, 'created_at': created})
+
+        if status == 'Completed':
+            visit = datetime.combine(appt_date, appt_time)
+            writer.add(Treatment, {'appointment_id': appointment_id, 'diagnosis': rng.choice(DIAGNOSES),
+                                   'prescription': rng.choice(PRESCRIPTIONS), 'created_at': visit})
+            if rng.random() < 0.4:
+                writer.add(Rating, {'appointment_id': appointment_id, 'doctor_id': doc, 'patient_id': pat,
+                                    'rating': rng.choices([1, 2, 3, 4, 5], weights=[2, 3, 10, 35, 50])[0],
+                                    'created_at': visit + timedelta(days=1)})
+            subtotal = float(rng.choice([30, 50, 75, 100, 150]) + rng.choice([0, 0, 20, 45, 120]))
+            tax = round(subtotal * 0.05, 2)
+            method = rng.choice(PAYMENT_METHODS)
+            paid = rng.random() < 0.8
+            writer.add(Bill, {'appointment_id': appointment_id, 'patient_id': pat, 'doctor_id': doc,
+                              'consultation_fee': subtotal, 'subtotal': subtotal, 'tax_amount': tax,
+                              'total_amount': subtotal + tax,
+                              'payment_status': 'Paid' if paid else 'Pending',
+                              'payment_method': method if paid else None,
+                              'payment_date': visit + timedelta(days=2) if paid else None,
+                              'insurance_claimed': paid and method == 'Insurance',
+                              'insurance_amount': round((subtotal + tax) * 0.8, 2) if paid and method == 'Insurance' else 0.0,
+                              'created_at': visit, 'updated_at': visit})
+
+        appointment_id += 1
+        if appointment_id % (chunk_size * 10) == 0:
+            writer.flush()
+            db.session.commit()
+            report(f'{writer.counts.get("appointments", 0)} appointments')
+
+    writer.flush()
+
+    # Keep Doctor.rating consistent with the generated ratings
+    averages = db.session.query(Rating.doctor_id, func.avg(Rating.rating)).filter(
+        Rating.doctor_id.in_([doc for doc, _ in doctors])
+    ).group_by(Rating.doctor_id).all()
+    if averages:
+        db.session.execute(update(Doctor), [{'id': doc, 'rating': round(avg, 2)} for doc, avg in averages])
+
+    db.session.commit()
+    
+    # Bulk inserts bypass the change signals, so rebuild the rollups, timeline and clinical index
+    writer.counts['doctor_daily_stats'] = rebuild_doctor_stats()
+    writer.counts['patient_timeline'] = rebuild_timeline()
+    writer.counts['clinical_terms'] = rebuild_clinical_index()
+    report('done')
+    return writer.counts
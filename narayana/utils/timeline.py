@@ -0,0 +1,153 @@
+from datetime import date, datetime
+from sqlalchemy import and_, delete, insert, or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, Appointment, Bill, Doctor, Rating, TimelineEntry, Treatment, User
+from utils import signals
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Keeps each IN (...) list well under SQLite's bound-parameter limit
+REFRESH_BATCH_SIZE = 500
+
+ENTRY_FIELDS = ('appointment_id', 'patient_id', 'doctor_id', 'appointment_date', 'appointment_time',
+                'doctor_name', 'specialization', 'diagnosis', 'prescription', 'treatment_notes',
+                'treatment_recorded_at', 'bill_id', 'bill_total', 'bill_status', 'rating', 'feedback')
+
+def _source_query():
+    """Completed appointments joined to everything a timeline entry shows, one row each"""
+    return db.session.query(
+        Appointment.id, Appointment.patient_id, Appointment.doctor_id,
+        Appointment.appointment_date, Appointment.appointment_time,
+        User.username, Doctor.specialization,
+        Treatment.diagnosis, Treatment.prescription, Treatment.notes, Treatment.created_at,
+        Bill.id, Bill.total_amount, Bill.payment_status,
+        Rating.rating, Rating.feedback
+    ).join(Doctor, Appointment.doctor_id == Doctor.id).join(
+        User, Doctor.user_id == User.id
+    ).outerjoin(Treatment, Treatment.appointment_id == Appointment.id).outerjoin(
+        Bill, Bill.appointment_id == Appointment.id
+    ).outerjoin(Rating, Rating.appointment_id == Appointment.id).filter(
+        Appointment.status == 'Completed'
+    )
+
+def _entries(rows, now):
+    # Later rows win if an appointment has more than one bill
+    entries = {}
+    for row in rows:
+        entry = dict(zip(ENTRY_FIELDS, row))
+        entry['updated_at'] = now
+        entries[entry['appointment_id']] = entry
+    return list(entries.values())
+
+def refresh_timeline(appointment_ids):
+    """Re-derive the timeline entries of the given appointments and commit.
+
+    Completed appointments are upserted; any other status removes the
+    entry, so a status change in either direction is picked up.
+    Returns the number of entries written.
+    """
+    appointment_ids = sorted({appointment_id for appointment_id in appointment_ids if appointment_id})
+    written = 0
+    now = datetime.utcnow()
+    for offset in range(0, len(appointment_ids), REFRESH_BATCH_SIZE):
+        batch = appointment_ids[offset:offset + REFRESH_BATCH_SIZE]
+        entries = _entries(_source_query().filter(Appointment.id.in_(batch)), now)
+
+        stale = set(batch) - {entry['appointment_id'] for entry in entries}
+        if stale:
+            db.session.execute(delete(TimelineEntry).where(TimelineEntry.appointment_id.in_(stale)))
+        if entries:
+            statement = sqlite_insert(TimelineEntry)
+            statement = statement.on_conflict_do_update(
+                index_elements=['appointment_id'],
+                set_={field: statement.excluded[field] for field in ENTRY_FIELDS[1:] + ('updated_at',)}
+            )
+            db.session.execute(statement, entries)
+        written += len(entries)
+    db.session.commit()
+    return written
+
+def refresh_doctor_entries(doctor_ids):
+    """Refresh every entry of the given doctors, e.g. after a profile change"""
+    doctor_ids = [doctor_id for doctor_id in doctor_ids if doctor_id]
+    if not doctor_ids:
+        return 0
+    appointment_ids = db.session.query(TimelineEntry.appointment_id).filter(
+        TimelineEntry.doctor_id.in_(doctor_ids)
+    )
+    return refresh_timeline([appointment_id for appointment_id, in appointment_ids])
+
+def rebuild_timeline(batch_size=5000):
+    """Recompute every timeline entry from scratch; returns the number of entries written"""
+    entries = _entries(_source_query().order_by(Appointment.id), datetime.utcnow())
+
+    db.session.execute(delete(TimelineEntry))
+    for offset in range(0, len(entries), batch_size):
+        db.session.execute(insert(TimelineEntry), entries[offset:offset + batch_size])
+    db.session.commit()
+    return len(entries)
+
+def encode_cursor(entry):
+    return f'{entry.appointment_date.isoformat()}_{entry.appointment_id}'
+
+def decode_cursor(cursor):
+    """Parse a cursor into (appointment_date, appointment_id), or None if it is malformed"""
+    try:
+        appointment_date, appointment_id = cursor.rsplit('_', 1)
+        return date.fromisoformat(appointment_date), int(appointment_id)
+    except (AttributeError, ValueError):
+        return None
+
+def get_timeline_page(patient_id, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """One page of a patient's timeline, most recent visit first.
+
+    Returns (entries, next_cursor); next_cursor is None on the last page.
+    A page is a single range scan of the (patient_id, appointment_date,
+    appointment_id) index with no joins.
+    """
+    query = TimelineEntry.query.filter(TimelineEntry.patient_id == patient_id)
+
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        appointment_date, appointment_id = position
+        query = query.filter(or_(
+            TimelineEntry.appointment_date < appointment_date,
+            and_(TimelineEntry.appointment_date == appointment_date, TimelineEntry.appointment_id < appointment_id)
+        ))
+
+    rows = query.order_by(TimelineEntry.appointment_date.desc(),
+                          TimelineEntry.appointment_id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+def serialize_entry(entry):
+    return {
+        'appointment_id': entry.appointment_id,
+        'date': entry.appointment_date.isoformat(),
+        'time': entry.appointment_time.strftime('%H:%M'),
+        'doctor_id': entry.doctor_id,
+        'doctor_name': entry.doctor_name,
+        'specialization': entry.specialization,
+        'diagnosis': entry.diagnosis,
+        'prescription': entry.prescription,
+        'notes': entry.treatment_notes,
+        'treatment_recorded_at': entry.treatment_recorded_at.isoformat() if entry.treatment_recorded_at else None,
+        'bill_id': entry.bill_id,
+        'bill_total': entry.bill_total,
+        'bill_status': entry.bill_status,
+        'rating': entry.rating,
+        'feedback': entry.feedback
+    }
+
+def _on_change(sender, appointment_ids=(), **extra):
+    refresh_timeline(appointment_ids)
+
+def _on_doctor_changed(sender, doctor_ids=(), **extra):
+    refresh_doctor_entries(doctor_ids)
+
+def connect_timeline():
+    """Keep timeline entries current from appointment, bill, rating and doctor signals"""
+    for signal in (signals.appointment_changed, signals.bill_changed, signals.rating_changed):
+        signal.connect(_on_change)
+    signals.doctor_changed.connect(_on_doctor_changed)
@@ -0,0 +1,144 @@
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import func
+from models import db, Doctor, DoctorDailyStats, DoctorHourlyStats, SpecializationDailyStats
+from utils.doctor_stats import TREND_FIELDS
+
+BUCKETS = ('hour', 'day', 'week', 'month')
+STATUSES = {'Booked': 'booked', 'Completed': 'completed', 'Cancelled': 'cancelled'}
+
+# Hourly series are read from the hourly rollups, one row per active
+# doctor-hour, so their range is capped to keep responses small
+MAX_HOURLY_DAYS = 92
+
+def bucket_start(moment, bucket):
+    """The start of the bucket containing `moment` (a date, or a datetime for hours)"""
+    if bucket == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    if bucket == 'week':
+        return moment - timedelta(days=moment.weekday())
+    if bucket == 'month':
+        return moment.replace(day=1)
+    return moment
+
+def _next_bucket(start, bucket):
+    if bucket == 'hour':
+        return start + timedelta(hours=1)
+    if bucket == 'week':
+        return start + timedelta(days=7)
+    if bucket == 'month':
+        return (start + timedelta(days=32)).replace(day=1)
+    return start + timedelta(days=1)
+
+def _filtered(query, model, doctor_id, specialization):
+    if doctor_id:
+        query = query.filter(model.doctor_id == doctor_id)
+    if specialization:
+        query = query.join(Doctor, model.doctor_id == Doctor.id).filter(Doctor.specialization == specialization)
+    return query
+
+def appointment_trend(start, end, bucket='day', doctor_id=None, specialization=None, status=None):
+    """Appointment counts and revenue over [start, end] in `bucket`-sized buckets.
+
+    Served from rollups maintained by utils.doctor_stats, so the cost
+    depends on the number of days in range, not on appointment volume:
+    hour buckets from doctor_hourly_stats, larger ones from
+    specialization_daily_stats (at most a few rows per day) or, for one
+    doctor, doctor_daily_stats, grouped by day in SQL and downsampled here.
+    Appointments count by their date and revenue by payment date.
+    Every bucket is returned, empty ones with zeros; `appointments` is the
+    count for `status`, or all statuses when None.
+    """
+    if bucket == 'hour':
+        hour = DoctorHourlyStats.hour
+        query = _filtered(db.session.query(
+            DoctorHourlyStats.day, hour,
+            *[func.sum(getattr(DoctorHourlyStats, field)) for field in TREND_FIELDS]
+        ), DoctorHourlyStats, doctor_id, specialization).filter(
+            DoctorHourlyStats.day >= start,
+            DoctorHourlyStats.day <= end
+        ).group_by(DoctorHourlyStats.day, hour)
+        rows = [(datetime.combine(day, time(hour_of_day)), values) for day, hour_of_day, *values in query]
+        first, last = datetime.combine(start, time.min), datetime.combine(end, time(23))
+    else:
+        model = DoctorDailyStats if doctor_id else SpecializationDailyStats
+        query = db.session.query(
+            model.day, *[func.sum(getattr(model, field)) for field in TREND_FIELDS]
+        ).filter(model.day >= start, model.day <= end)
+        if doctor_id:
+            query = _filtered(query, model, doctor_id, specialization)
+        elif specialization:
+            query = query.filter(model.specialization == specialization)
+        rows = [(day, values) for day, *values in query.group_by(model.day)]
+        first, last = start, end
+
+    buckets = {}
+    for moment, values in rows:
+        key = bucket_start(moment, bucket)
+        totals = buckets.get(key)
+        if totals is None:
+            buckets[key] = [value or 0 for value in values]
+        else:
+            for index, value in enumerate(values):
+                totals[index] += value or 0
+
+    empty = (0,) * len(TREND_FIELDS)
+    count_field = STATUSES[status] if status else None
+    series = []
+    current = bucket_start(first, bucket)
+    while current <= last:
+        values = dict(zip(TREND_FIELDS, buckets.get(current, empty)))
+        values['revenue'] = round(values['revenue'] or 0.0, 2)
+        if count_field:
+            values['appointments'] = values[count_field]
+        else:
+            values['appointments'] = values['booked'] + values['completed'] + values['cancelled']
+        values['start'] = current
+        series.append(values)
+        current = _next_bucket(current, bucket)
+    return series
+
+def trend_summary(series):
+    """Totals of an appointment_trend() series"""
+    totals = {field: sum(point[field] for point in series) for field in TREND_FIELDS + ('appointments',)}
+    totals['revenue'] = round(totals['revenue'] or 0.0, 2)
+    return totals
+
+def serialize_point(point):
+    start = point['start']
+    return dict(point, start=start.isoformat(timespec='minutes') if isinstance(start, datetime) else start.isoformat())
+
+def parse_trend_args(args, today=None):
+    """Validate trend query arguments; returns keyword arguments for appointment_trend().
+
+    Raises ValueError with a message for the client on bad input.
+    """
+    today = today or date.today()
+    bucket = args.get('bucket', 'day')
+    if bucket not in BUCKETS:
+        raise ValueError(f'bucket must be one of {", ".join(BUCKETS)}')
+    status = args.get('status') or None
+    if status and status not in STATUSES:
+        raise ValueError(f'status must be one of {", ".join(STATUSES)}')
+
+    try:
+        end = datetime.strptime(args['end'], '%Y-%m-%d').date() if args.get('end') else today
+        start = datetime.strptime(args['start'], '%Y-%m-%d').date() if args.get('start') else end - timedelta(days=29)
+    except ValueError:
+        raise ValueError('Dates must be in YYYY-MM-DD format')
+    if start > end:
+        raise ValueError('start must not be after end')
+    if bucket == 'hour' and (end - start).days >= MAX_HOURLY_DAYS:
+        raise ValueError(f'Hourly trends are limited to {MAX_HOURLY_DAYS} days')
+
+    doctor_id = args.get('doctor_id')
+    if doctor_id is not None and not str(doctor_id).isdigit():
+        raise ValueError('doctor_id must be an integer')
+
+    return {
+        'start': start,
+        'end': end,
+        'bucket': bucket,
+        'doctor_id': int(doctor_id) if doctor_id else None,
+        'specialization': args.get('specialization') or None,
+        'status': status
+    }
@@ -1,5 +1,7 @@
 from datetime import datetime, date, time, timedelta
-from models import Appointment
+from models import db, Appointment
+from utils.availability import MAX_DURATION_MINUTES, slot_end
+from utils.intervals import add_minutes
 
 def validate_email(email):
     """Basic email validation"""
@@ -17,18 +19,28 @@ def validate_rating(rating):
     except (ValueError, TypeError):
         return False
 
-def check_double_booking(doctor_id, appointment_date, appointment_time, exclude_appointment_id=None):
-    """Check if doctor has conflicting appointment"""
-    query = Appointment.query.filter_by(
-        doctor_id=doctor_id,
-        appointment_date=appointment_date,
-        appointment_time=appointment_time
-    ).filter(Appointment.status.in_(['Booked', 'Completed']))
+def check_double_booking(doctor_id, appointment_date, appointment_time, duration_minutes=None,
+                         exclude_appointment_id=None):
+    """Check if doctor has an appointment overlapping [appointment_time, + duration_minutes).
+
+    The (doctor_id, appointment_date, appointment_time) index narrows the
+    scan to appointments starting less than the longest bookable duration
+    before the new one ends; their end times are compared in Python.
+    """
+    start = appointment_time
+    end = slot_end(start, duration_minutes)
+    query = db.session.query(Appointment.appointment_time, Appointment.duration_minutes).filter(
+        Appointment.doctor_id == doctor_id,
+        Appointment.appointment_date == appointment_date,
+        Appointment.appointment_time < end,
+        Appointment.appointment_time >= add_minutes(start, -MAX_DURATION_MINUTES),
+        Appointment.status.in_(['Booked', 'Completed'])
+    )
     
     if exclude_appointment_id:
         query = query.filter(Appointment.id != exclude_appointment_id)
     
-    return query.first() is not None
+    return any(slot_end(other_start, other_duration) > start for other_start, other_duration in query)
 
 def is_within_7_days(target_date):
     """Check if date is within next 7 days"""
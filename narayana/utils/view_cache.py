@@ -0,0 +1,174 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, session
+
+from utils.shards import current_facility, facility_context
+
+class ViewCache:
+    """Thread-safe LRU of computed view data with a TTL and stale-while-revalidate.
+
+    Routes cache the plain data a page needs (lists of dicts, rollup
+    totals), never ORM objects, under a key of route name, role, user and
+    the entity versions the data depends on. A version bump from a change
+    signal makes older entries unreachable at once. Otherwise an entry is
+    fresh for `ttl` seconds; for `stale_ttl` seconds after that it is
+    still served while one background thread recomputes it, so only the
+    first request after a long idle spell pays for the queries. Entries
+    are per worker process, but the version counters are shared through
+    the database, so a bump in any worker reaches every worker's keys.
+    """
+
+    def __init__(self, max_entries=1000, ttl=30, stale_ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _stat(self, name):
+        stat = self._stats.get(name)
+        if stat is None:
+            stat = self._stats[name] = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'refreshes': 0,
+                                        'refresh_errors': 0, 'evictions': 0, 'invalidations': 0,
+                                        'compute_seconds': 0.0, 'serve_seconds': 0.0}
+        return stat
+
+    def _store(self, key, value, elapsed):
+        now = time.monotonic()
+        self._entries[key] = (now + self.ttl, now + self.ttl + self.stale_ttl, value)
+        self._entries.move_to_end(key)
+        self._stat(key[0])['compute_seconds'] += elapsed
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            self._stat(evicted[0])['evictions'] += 1
+
+    def get(self, key, compute):
+        """Return the data cached for `key`, computing it on a miss.
+
+        `key` is a tuple of hashable parts whose first item names the view
+        in the metrics. `compute` must only use the database and its
+        closure, not the request, since it may run in a background thread.
+        """
+        started = time.perf_counter()
+        name = key[0]
+        with self._lock:
+            entry = self._entries.get(key)
+            now = time.monotonic()
+            found = entry is not None and now < entry[1]
+            refresh = False
+            if found:
+                self._entries.move_to_end(key)
+                if now < entry[0]:
+                    self._stat(name)['hits'] += 1
+                else:
+                    self._stat(name)['stale_hits'] += 1
+                    refresh = key not in self._refreshing
+                    self._refreshing.add(key)
+                self._stat(name)['serve_seconds'] += time.perf_counter() - started
+        if found:
+            if refresh:
+                self._refresh_later(key, compute)
+            return entry[2]
+
+        computed = time.perf_counter()
+        value = compute()
+        elapsed = time.perf_counter() - computed
+        with self._lock:
+            stat = self._stat(name)
+            stat['misses'] += 1
+            self._store(key, value, elapsed)
+            stat['serve_seconds'] += time.perf_counter() - started
+        return value
+
+    def _refresh_later(self, key, compute):
+        app = current_app._get_current_object()
+        facility = current_facility()
+
+        def run():
+            try:
+                with facility_context(facility, app):
+                    started = time.perf_counter()
+                    value = compute()
+                    elapsed = time.perf_counter() - started
+                with self._lock:
+                    self._stat(key[0])['refreshes'] += 1
+                    self._store(key, value, elapsed)
+            except Exception:
+                app.logger.exception('Refreshing cached view data %s failed', key[0])
+                with self._lock:
+                    self._stat(key[0])['refresh_errors'] += 1
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, name=f'view-cache-{key[0]}', daemon=True).start()
+
+    def invalidate(self, name=None, user_ids=None):
+        """Drop entries for view `name` (all views when None), optionally only those of `user_ids`"""
+        user_ids = set(user_ids) if user_ids is not None else None
+        with self._lock:
+            dropped = [key for key in self._entries
+                       if (name is None or key[0] == name) and (user_ids is None or key[2] in user_ids)]
+            for key in dropped:
+                del self._entries[key]
+                self._stat(key[0])['invalidations'] += 1
+        return len(dropped)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def metrics(self):
+        """Per-view hit rates and latencies, busiest first"""
+        with self._lock:
+            stats = {name: dict(stat) for name, stat in self._stats.items()}
+            entries = {}
+            for key in self._entries:
+                entries[key[0]] = entries.get(key[0], 0) + 1
+
+        rows = []
+        for name, stat in stats.items():
+            lookups = stat['hits'] + stat['stale_hits'] + stat['misses']
+            computes = stat['misses'] + stat['refreshes']
+            rows.append({
+                'name': name,
+                'entries': entries.get(name, 0),
+                'hits': stat['hits'],
+                'stale_hits': stat['stale_hits'],
+                'misses': stat['misses'],
+                'refreshes': stat['refreshes'],
+                'refresh_errors': stat['refresh_errors'],
+                'evictions': stat['evictions'],
+                'invalidations': stat['invalidations'],
+                'hit_rate': (stat['hits'] + stat['stale_hits']) / lookups if lookups else 0.0,
+                'avg_compute_ms': stat['compute_seconds'] / computes * 1000 if computes else 0.0,
+                'avg_serve_ms': stat['serve_seconds'] / lookups * 1000 if lookups else 0.0
+            })
+        rows.sort(key=lambda row: row['hits'] + row['stale_hits'] + row['misses'], reverse=True)
+        return rows
+
+view_cache = ViewCache()
+
+def init_view_cache(app):
+    """Configure the view-data cache; VIEW_CACHE_SIZE = 0 computes every view uncached"""
+    view_cache.max_entries = app.config.get('VIEW_CACHE_SIZE', 1000)
+    view_cache.ttl = app.config.get('VIEW_CACHE_TTL', 30)
+    view_cache.stale_ttl = app.config.get('VIEW_CACHE_STALE_TTL', 300)
+    view_cache.clear()
+
+def cached_view(name, compute, *depends_on, shared=False):
+    """View data for the current user, cached under (name, role, user_id, facility, *depends_on).
+
+    Pass the day the data is for and the entity versions it depends on,
+    e.g. ``versions.get('doctor_stats', doctor.id)``. With shared=True
+    every user of the role gets the same entry.
+    """
+    if not view_cache.max_entries:
+        return compute()
+    user_id = None if shared else session.get('user_id')
+    key = (name, session.get('role'), user_id, current_facility()) + tuple(depends_on)
+    return view_cache.get(key, compute)
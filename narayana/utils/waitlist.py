@@ -0,0 +1,198 @@
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import insert, update
+from models import db, Appointment, AuditLog, Doctor, Notification, Patient, User, WaitlistEntry
+from utils import signals
+from utils.availability import load_bookings, load_schedule
+from utils.notifications import publish_unread_count
+
+# How long a held slot waits for the patient to confirm it
+HOLD_MINUTES = 30
+
+MAX_WAITLIST_DAYS = 60
+
+def _first_open_slot(schedule, bookings, doctor_id, day, duration_minutes, now):
+    for start, end in schedule.open_slots(doctor_id, day, duration_minutes):
+        if datetime.combine(day, start) > now and not bookings.overlaps(start, end):
+            return start, end
+    return None
+
+def match_waitlist(doctor_days, now=None):
+    """Give freed slots on the given doctor-days to the patients waiting for them.
+
+    Called from change signals, so a cancellation, reschedule or unblock
+    is matched as it happens instead of patients polling doctor pages.
+    Each doctor-day costs one query on the (doctor_id, status,
+    start_date) index; only days with waiters load the schedule and
+    bookings. Waiters are served first come, first served: each gets the
+    earliest open slot of their length, booked outright with
+    auto_confirm, otherwise held for HOLD_MINUTES. Returns the number of
+    slots given out.
+    """
+    now = now or datetime.now()
+    placed = []
+    for doctor_id, day in sorted(set(doctor_days)):
+        if day < now.date():
+            continue
+        waiters = WaitlistEntry.query.filter(
+            WaitlistEntry.doctor_id == doctor_id,
+            WaitlistEntry.status == 'Waiting',
+            WaitlistEntry.start_date <= day,
+            WaitlistEntry.end_date >= day
+        ).order_by(WaitlistEntry.created_at, WaitlistEntry.id).all()
+        if not waiters:
+            continue
+
+        schedule = load_schedule([doctor_id], day, day)
+        bookings = load_bookings(doctor_id, day, day)[day]
+        booked_patients = {patient_id for patient_id, in db.session.query(Appointment.patient_id).filter(
+            Appointment.doctor_id == doctor_id,
+            Appointment.appointment_date == day,
+            Appointment.status == 'Booked'
+        )}
+        for entry in waiters:
+            if entry.patient_id in booked_patients:
+                continue
+            slot = _first_open_slot(schedule, bookings, doctor_id, day, entry.duration_minutes, now)
+            if slot is None:
+                continue
+
+            appointment = Appointment(doctor_id=doctor_id, patient_id=entry.patient_id, appointment_date=day,
+                                      appointment_time=slot[0], duration_minutes=entry.duration_minutes,
+                                      status='Booked')
+            db.session.add(appointment)
+            entry.appointment = appointment
+            if entry.auto_confirm:
+                entry.status = 'Booked'
+            else:
+                entry.status = 'Held'
+                entry.hold_expires_at = min(now + timedelta(minutes=HOLD_MINUTES), datetime.combine(day, slot[0]))
+            bookings.add(*slot)
+            booked_patients.add(entry.patient_id)
+            placed.append(entry)
+
+    if not placed:
+        return 0
+    db.session.flush()
+
+    users = dict(db.session.query(Patient.id, Patient.user_id).filter(
+        Patient.id.in_({entry.patient_id for entry in placed})
+    ).all())
+    doctors = dict(db.session.query(Doctor.id, User.username).join(User, Doctor.user_id == User.id).filter(
+        Doctor.id.in_({entry.doctor_id for entry in placed})
+    ).all())
+    notifications, audits = [], []
+    for entry in placed:
+        appointment = entry.appointment
+        when = f'{appointment.appointment_date} at {appointment.appointment_time.strftime("%H:%M")}'
+        if entry.status == 'Booked':
+            message = f'A slot opened up: your appointment with Dr. {doctors[entry.doctor_id]} is booked for {when}'
+        else:
+            message = (f'A slot opened up with Dr. {doctors[entry.doctor_id]} on {when}. It is held for you '
+                       f'until {entry.hold_expires_at.strftime("%H:%M")}; confirm it on your waitlist page')
+        notifications.append({'user_id': users[entry.patient_id], 'message': message,
+                              'is_read': False, 'created_at': datetime.utcnow()})
+        audits.append({'user_id': users[entry.patient_id], 'action': 'CREATE', 'entity_type': 'Appointment',
+                       'entity_id': appointment.id, 'created_at': datetime.utcnow(),
+                       'details': f'{entry.status} from waitlist entry {entry.id} with doctor {entry.doctor_id}'})
+    db.session.execute(insert(Notification), notifications)
+    db.session.execute(insert(AuditLog), audits)
+    db.session.commit()
+
+    for user_id in set(users.values()):
+        publish_unread_count(user_id)
+    signals.appointment_changed.send(doctor_ids={entry.doctor_id for entry in placed},
+                                     patient_ids={entry.patient_id for entry in placed},
+                                     appointment_ids=[entry.appointment_id for entry in placed],
+                                     doctor_days={(entry.doctor_id, entry.appointment.appointment_date)
+                                                  for entry in placed})
+    return len(placed)
+
+def release_holds(entries, status):
+    """Cancel the held appointments of `entries` and mark them `status` (Expired or Cancelled).
+
+    The appointment_changed signal that follows offers the freed slots
+    to the next patients in line.
+    """
+    entries = [entry for entry in entries if entry.status == 'Held']
+    if not entries:
+        return 0
+
+    appointments = Appointment.query.filter(Appointment.id.in_([entry.appointment_id for entry in entries])).all()
+    held = [appointment for appointment in appointments if appointment.status == 'Booked']
+    if held:
+        db.session.execute(update(Appointment), [{'id': appointment.id, 'status': 'Cancelled'}
+                                                 for appointment in held])
+    db.session.execute(update(WaitlistEntry), [{'id': entry.id, 'status': status, 'hold_expires_at': None}
+                                               for entry in entries])
+    db.session.commit()
+
+    if held:
+        signals.appointment_changed.send(doctor_ids={appointment.doctor_id for appointment in held},
+                                         patient_ids={appointment.patient_id for appointment in held},
+                                         appointment_ids=[appointment.id for appointment in held],
+                                         doctor_days={(appointment.doctor_id, appointment.appointment_date)
+                                                      for appointment in held})
+    return len(entries)
+
+def expire_waitlist(now=None):
+    """Release holds past their deadline and close entries whose dates have passed.
+
+    Holds whose appointment was cancelled some other way are closed too.
+    Returns (holds released, waiting entries expired).
+    """
+    now = now or datetime.now()
+    held = WaitlistEntry.query.join(Appointment, WaitlistEntry.appointment_id == Appointment.id).filter(
+        WaitlistEntry.status == 'Held'
+    )
+    expired = held.filter(WaitlistEntry.hold_expires_at <= now, Appointment.status == 'Booked').all()
+    dropped = held.filter(Appointment.status != 'Booked').all()
+    released = release_holds(expired, 'Expired')
+    if dropped:
+        release_holds(dropped, 'Cancelled')
+
+    stale = db.session.execute(
+        update(WaitlistEntry).where(WaitlistEntry.status == 'Waiting', WaitlistEntry.end_date < now.date())
+        .values(status='Expired')
+    ).rowcount
+    db.session.commit()
+    return released, stale
+
+def run_waitlist_worker(interval=60, log=print):
+    """Expire waitlist holds every `interval` seconds until interrupted"""
+    while True:
+        released, stale = expire_waitlist()
+        log(f'{datetime.now().isoformat(timespec="seconds")} released {released} holds, '
+            f'expired {stale} entries')
+        db.session.remove()
+        time.sleep(interval)
+
+def waiting_days(doctor_ids, today=None):
+    """(doctor_id, day) pairs, from today on, that some waiting entry of these doctors covers"""
+    today = today or datetime.now().date()
+    days = set()
+    for doctor_id, start_date, end_date in db.session.query(
+        WaitlistEntry.doctor_id, WaitlistEntry.start_date, WaitlistEntry.end_date
+    ).filter(
+        WaitlistEntry.doctor_id.in_(doctor_ids),
+        WaitlistEntry.status == 'Waiting',
+        WaitlistEntry.end_date >= today
+    ):
+        day = max(start_date, today)
+        while day <= end_date:
+            days.add((doctor_id, day))
+            day += timedelta(days=1)
+    return days
+
+def _on_appointment_changed(sender, doctor_days=(), **extra):
+    match_waitlist(doctor_days)
+
+def _on_availability_changed(sender, doctor_ids=(), doctor_days=(), **extra):
+    # Removing a rule can free days that have no rollup row, so look at
+    # every day the doctors' waiters are waiting for
+    match_waitlist(set(doctor_days) | waiting_days(doctor_ids))
+
+def connect_waitlist():
+    """Match waiting patients whenever appointments or availability change"""
+    signals.appointment_changed.connect(_on_appointment_changed)
+    signals.availability_changed.connect(_on_availability_changed)